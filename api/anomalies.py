@@ -0,0 +1,259 @@
+"""
+Job que marca mediciones fuera de rango o con picos, de todos los usuarios,
+en ALERTAS_MEDICIONES:
+
+    python anomalies.py [--dias 1] [--desde 2024-01-01] [--procesos 4]
+
+Cada tabla se parte en bloques de usuarios con ~CHUNK_ROWS mediciones en
+la ventana. Un pool de procesos lee cada bloque ordenado por usuario y
+fecha con su propia conexión. Las reglas se aplican a todo el bloque a la
+vez con numpy:
+
+- rango: el valor pasa un límite clínico (hipoglucemia, crisis
+  hipertensiva...), ver RANGES.
+- pico: se aleja más de SPIKE_Z desviaciones del promedio de las
+  ROLLING_READINGS mediciones anteriores del mismo usuario.
+- atipica: se aleja más de OUTLIER_Z desviaciones del promedio del usuario
+  en la ventana.
+
+Las alertas de la ventana se borran antes de volver a escribirlas, así que
+correrlo dos veces sobre los mismos días no las duplica.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import numpy as np
+from database import connect_db, execute, fetch_all, local_params, pool
+from ingest import KINDS, MAX_PARAMS
+from logger import my_logger
+from series import EPOCH, fetch_array
+
+# {métrica: (límite bajo, regla, límite alto, regla)}; None si no hay límite de ese lado
+RANGES = {
+    'glucosa': (54, 'hipoglucemia', 250, 'hiperglucemia'),
+    'ritmo': (40, 'bradicardia', 150, 'taquicardia'),
+    # crisis hipertensiva: sistólica > 180 y/o diastólica > 120
+    'presion_sistolica': (90, 'hipotension', 180, 'crisis_hipertensiva'),
+    'presion_diastolica': (None, None, 120, 'crisis_hipertensiva'),
+}
+
+# desviación mínima por métrica, para que un usuario muy estable no dispare
+# alertas por cambios normales
+MIN_STD = {'glucosa': 10, 'ritmo': 5, 'presion_sistolica': 8, 'presion_diastolica': 5}
+
+ROLLING_READINGS = 20
+SPIKE_Z = 4
+OUTLIER_Z = 5
+# mediciones previas / del usuario que se necesitan para las reglas de desviación
+MIN_HISTORY = 5
+MIN_READINGS = 30
+
+# también se leen estos días antes de la ventana como historia de la regla de picos
+HISTORY_DAYS = 7
+
+CHUNK_ROWS = int(os.getenv('ANOMALY_CHUNK_ROWS', 500000))
+
+
+def _group_starts(users):
+    """Índice del primer renglón de cada usuario en un arreglo ordenado por usuario."""
+    return np.flatnonzero(np.diff(users, prepend=users[:1] - 1))
+
+
+def detect(users, x, y, metric, start):
+    """
+    Aplica las reglas a una métrica de un bloque ordenado por (usuario,
+    fecha). Solo se marcan los renglones con x >= `start` (los anteriores
+    son historia). Regresa (índices, reglas, puntajes) ordenados por índice;
+    el puntaje es el z de las reglas de desviación y NaN en las de rango.
+    """
+    n = len(y)
+    y = y.astype(np.int64)
+    in_window = x >= start
+    flags = []
+
+    low, low_rule, high, high_rule = RANGES[metric]
+    if low is not None:
+        flags.append((np.flatnonzero(in_window & (y < low)), low_rule, None))
+    if high is not None:
+        flags.append((np.flatnonzero(in_window & (y > high)), high_rule, None))
+
+    starts = _group_starts(users)
+    counts = np.diff(np.append(starts, n))
+    group_start = np.repeat(starts, counts)
+    floor = MIN_STD[metric]
+
+    # pico: contra las ROLLING_READINGS anteriores del mismo usuario, con sumas acumuladas
+    sums = np.concatenate(([0], np.cumsum(y)))
+    squares = np.concatenate(([0], np.cumsum(y * y)))
+    index = np.arange(n)
+    first = np.maximum(index - ROLLING_READINGS, group_start)
+    history = index - first
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = (sums[index] - sums[first]).astype(np.float64)
+        mean = total / history
+        variance = ((squares[index] - squares[first]) - total * mean) / (history - 1)
+        std = np.maximum(np.sqrt(np.maximum(variance, 0)), floor)
+        z = (y - mean) / std
+    spikes = np.flatnonzero(in_window & (history >= MIN_HISTORY) & (np.abs(z) > SPIKE_Z))
+    flags.append((spikes, 'pico', z))
+
+    # atípica: contra todas las mediciones del usuario en el bloque
+    group_sums = np.add.reduceat(y, starts).astype(np.float64)
+    group_squares = np.add.reduceat(y * y, starts).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        group_mean = group_sums / counts
+        group_var = (group_squares - group_sums * group_mean) / (counts - 1)
+        group_std = np.maximum(np.sqrt(np.maximum(group_var, 0)), floor)
+    z_user = (y - np.repeat(group_mean, counts)) / np.repeat(group_std, counts)
+    outliers = np.flatnonzero(in_window & (np.repeat(counts, counts) >= MIN_READINGS) & (np.abs(z_user) > OUTLIER_Z))
+    flags.append((outliers, 'atipica', z_user))
+
+    indices = np.concatenate([found for found, _, _ in flags])
+    rules = np.concatenate([np.full(len(found), rule, dtype=object) for found, rule, _ in flags])
+    scores = np.concatenate([scores[found] if scores is not None else np.full(len(found), np.nan)
+                             for found, _, scores in flags])
+    order = np.argsort(indices, kind='stable')
+    return indices[order], rules[order], scores[order]
+
+
+def _metrics(kind):
+    return [(field, column) for field, (column, _, _) in kind.fields.items()]
+
+
+def load_chunk(cursor, kind, first_user, last_user, desde, hasta):
+    """(usuarios, x en segundos, {columna: valores}) de un bloque de usuarios, ordenado por usuario y fecha."""
+    columns = kind.columns
+    data = fetch_array(cursor, f"""
+        SELECT CAST(USUARIO AS BIGINT), DATEDIFF_BIG(SECOND, '19700101', FECHA), {', '.join(columns)}
+        FROM {kind.table}
+        WHERE USUARIO BETWEEN %s AND %s AND FECHA >= %s AND FECHA < %s
+            AND {' AND '.join(f'{column} IS NOT NULL' for column in columns)}
+        ORDER BY USUARIO, FECHA
+    """, (first_user, last_user, desde - timedelta(days=HISTORY_DAYS), hasta), 2 + len(columns))
+    return data[:, 0], data[:, 1], {column: data[:, 2 + i] for i, column in enumerate(columns)}
+
+
+def detect_chunk(kind, users, x, values, start):
+    """Todas las alertas de un bloque: [(usuario, métrica, x, valor, regla, puntaje)]."""
+    alerts = []
+    for metric, column in _metrics(kind):
+        indices, rules, scores = detect(users, x, values[column], metric, start)
+        alerts.extend(zip(users[indices].tolist(), [metric] * len(indices), x[indices].tolist(),
+                          values[column][indices].tolist(), rules.tolist(),
+                          [None if np.isnan(score) else round(score, 2) for score in scores.tolist()]))
+    return alerts
+
+
+def insert_statements(alerts):
+    per_row = 6
+    chunk = MAX_PARAMS // per_row
+    for start in range(0, len(alerts), chunk):
+        block = alerts[start:start + chunk]
+        sql = (f"INSERT INTO ALERTAS_MEDICIONES (USUARIO, METRICA, FECHA, VALOR, REGLA, PUNTAJE) "
+               f"VALUES {', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(block))}")
+        params = []
+        for user_id, metric, x, value, rule, score in block:
+            fecha = (EPOCH + np.timedelta64(x, 's')).astype(object)
+            params.extend((user_id, metric, fecha, value, rule, score))
+        yield sql, tuple(params)
+
+
+def run_chunk(task):
+    """
+    Corre en un proceso del pool: lee un bloque, detecta y reemplaza sus
+    alertas de la ventana. Regresa (tabla, renglones leídos, alertas, segundos).
+    """
+    tipo, first_user, last_user, desde, hasta = task
+    kind = KINDS[tipo]
+    started = time.monotonic()
+    # cada proceso abre su conexión; las del pool del padre no se comparten
+    cnx = connect_db(local_params)
+    try:
+        cursor = cnx.cursor()
+        users, x, values = load_chunk(cursor, kind, first_user, last_user, desde, hasta)
+        start = int((np.datetime64(desde, 's') - EPOCH).astype(np.int64))
+        alerts = detect_chunk(kind, users, x, values, start) if len(users) else []
+        metrics = [metric for metric, _ in _metrics(kind)]
+        execute(cursor, f"""
+            DELETE FROM ALERTAS_MEDICIONES
+            WHERE USUARIO BETWEEN %s AND %s AND FECHA >= %s AND FECHA < %s
+                AND METRICA IN ({', '.join(['%s'] * len(metrics))})
+        """, (first_user, last_user, desde, hasta, *metrics))
+        for sql, params in insert_statements(alerts):
+            execute(cursor, sql, params)
+        cnx.commit()
+        cursor.close()
+    except Exception:
+        cnx.rollback()
+        raise
+    finally:
+        cnx.close()
+    return kind.table, len(users), len(alerts), time.monotonic() - started
+
+
+def plan_chunks(cursor, desde, hasta):
+    """Tareas (tipo, primer usuario, último usuario, desde, hasta) de ~CHUNK_ROWS mediciones cada una."""
+    tasks = []
+    for tipo, kind in KINDS.items():
+        counts = fetch_all(cursor, f"""
+            SELECT USUARIO, COUNT(*) AS cuenta FROM {kind.table}
+            WHERE FECHA >= %s AND FECHA < %s
+            GROUP BY USUARIO ORDER BY USUARIO
+        """, (desde, hasta))
+        first, rows = None, 0
+        for row in counts:
+            user_id = int(row.USUARIO)
+            if first is None:
+                first = user_id
+            rows += row.cuenta
+            if rows >= CHUNK_ROWS:
+                tasks.append((tipo, first, user_id, desde, hasta))
+                first, rows = None, 0
+        if first is not None:
+            tasks.append((tipo, first, int(counts[-1].USUARIO), desde, hasta))
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Marca mediciones anómalas en ALERTAS_MEDICIONES")
+    parser.add_argument('--dias', type=int, default=1)
+    parser.add_argument('--desde', type=datetime.fromisoformat)
+    parser.add_argument('--hasta', type=datetime.fromisoformat)
+    parser.add_argument('--procesos', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    hasta = args.hasta or datetime.now()
+    desde = args.desde or hasta - timedelta(days=args.dias)
+
+    with pool.connection() as cnx:
+        cursor = cnx.cursor()
+        tasks = plan_chunks(cursor, desde, hasta)
+        cursor.close()
+
+    # spawn: los hijos no heredan los sockets del pool ni su hilo de ping, y
+    # sin DB_POOL_MIN no abren conexiones al importar database
+    os.environ['DB_POOL_MIN'] = '0'
+    started = time.monotonic()
+    rows = alerts = 0
+    busy = 0.0
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=args.procesos, mp_context=context) as executor:
+        for done, future in enumerate(as_completed([executor.submit(run_chunk, task) for task in tasks]), 1):
+            table, chunk_rows, chunk_alerts, seconds = future.result()
+            rows += chunk_rows
+            alerts += chunk_alerts
+            busy += seconds
+            print(f"\r{done}/{len(tasks)} bloques  {rows:,} mediciones  {alerts:,} alertas", end='', file=sys.stderr)
+    print(file=sys.stderr)
+    elapsed = time.monotonic() - started
+    my_logger.info(f"Anomaly detection from {desde} to {hasta}: {rows} readings, {alerts} alerts, "
+                   f"{len(tasks)} chunks in {elapsed:.1f}s with {args.procesos} processes "
+                   f"({rows / busy if busy else 0:.0f} readings/s per process)")
+
+
+if __name__ == '__main__':
+    main()
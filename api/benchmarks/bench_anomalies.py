@@ -0,0 +1,72 @@
+"""
+Job de anomalías: mediciones por segundo que procesa cada núcleo al aplicar
+las reglas a bloques de usuarios (sin BD), con 1 proceso y con el pool
+completo.
+
+    python benchmarks/bench_anomalies.py [--rows 500000] [--chunks 8] [--procesos 4]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import anomalies
+from ingest import KINDS
+
+
+def make_chunk(seed, rows):
+    """Un bloque de presión arterial ordenado por usuario y fecha, ~300 mediciones por usuario."""
+    rng = np.random.default_rng(seed)
+    users = np.sort(rng.integers(0, max(1, rows // 300), rows))
+    x = np.empty(rows, dtype=np.int64)
+    starts = np.flatnonzero(np.diff(users, prepend=-1))
+    for start, end in zip(starts, np.append(starts[1:], rows)):
+        x[start:end] = np.sort(rng.integers(0, 30 * 86400, end - start))
+    systolic = np.rint(rng.normal(125, 12, rows)).astype(np.int64)
+    systolic[rng.choice(rows, rows // 1000)] = 190
+    values = {'PRESION_SISTOLICA': systolic, 'PRESION_DIASTOLICA': systolic - 45}
+    return users, x, values
+
+
+def run(task):
+    seed, rows = task
+    users, x, values = make_chunk(seed, rows)
+    started = time.perf_counter()
+    alerts = anomalies.detect_chunk(KINDS['presion_arterial'], users, x, values, 7 * 86400)
+    return rows, len(alerts), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--chunks', type=int, default=8)
+    parser.add_argument('--procesos', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    tasks = [(seed, args.rows) for seed in range(args.chunks)]
+    # como en anomalies.main: los procesos no necesitan conexiones
+    os.environ['DB_POOL_MIN'] = '0'
+    context = multiprocessing.get_context('spawn')
+    print(f"chunks:           {args.chunks} x {args.rows:,} readings (2 metrics each)")
+    for processes in sorted({1, args.procesos}):
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+            # el primero calienta los procesos (imports)
+            list(executor.map(run, [(0, 1000)] * processes))
+            started = time.perf_counter()
+            results = list(executor.map(run, tasks))
+            elapsed = time.perf_counter() - started
+        rows = sum(r for r, _, _ in results)
+        alerts = sum(a for _, a, _ in results)
+        busy = sum(s for _, _, s in results)
+        print(f"{processes:>2} processes:     {rows / busy:,.0f} readings/s per core, "
+              f"{rows / elapsed:,.0f} readings/s wall (incl. generating data), {alerts:,} alerts")
+
+
+if __name__ == '__main__':
+    main()
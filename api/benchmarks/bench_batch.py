@@ -0,0 +1,59 @@
+"""
+Latencia de /medicionesdatos con las cuatro consultas una por una contra
+un solo batch con fetch_sets. Necesita la BD configurada en el .env.
+
+    python benchmarks/bench_batch.py --user 1 [--iterations 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import fetch_all, fetch_sets, pool
+
+QUERIES = [
+    ('glucosa', "SELECT TOP 5 G.FECHA AS fecha, G.NIVEL AS glucosa FROM GLUCOSA G WHERE G.USUARIO = %s ORDER BY G.FECHA DESC"),
+    ('ritmo_cardiaco', "SELECT TOP 5 RC.FECHA AS fecha, RC.RITMO AS ritmo FROM RITMO_CARDIACO RC WHERE RC.USUARIO = %s ORDER BY RC.FECHA DESC"),
+    ('presion_arterial', "SELECT TOP 5 PA.FECHA AS fecha, PA.PRESION_SISTOLICA AS presion_sistolica, PA.PRESION_DIASTOLICA AS presion_diastolica FROM PRESION_ARTERIAL PA WHERE PA.USUARIO = %s ORDER BY PA.FECHA DESC"),
+    ('usuario_info', "SELECT U.NOMBRE AS nombre, DS.EDAD AS edad, DS.PESO AS peso FROM USUARIOS U JOIN DATOS_SALUD DS ON U.ID_USUARIO = DS.USUARIO WHERE U.ID_USUARIO = %s"),
+]
+
+
+def sequential(cursor, user_id):
+    return {name: fetch_all(cursor, query, (user_id,)) for name, query in QUERIES}
+
+
+def batched(cursor, user_id):
+    return fetch_sets(cursor, [(name, query, (user_id,)) for name, query in QUERIES])
+
+
+def measure(fn, cursor, user_id, iterations):
+    fn(cursor, user_id)
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn(cursor, user_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--user', type=int, required=True)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    with pool.connection() as cnx:
+        cursor = cnx.cursor()
+        for name, fn in (('sequential', sequential), ('batched', batched)):
+            p50, p95 = measure(fn, cursor, args.user, args.iterations)
+            print(f"{name:12} p50 {p50:6.2f} ms   p95 {p95:6.2f} ms")
+        cursor.close()
+
+
+if __name__ == '__main__':
+    main()
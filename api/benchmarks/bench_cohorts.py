@@ -0,0 +1,77 @@
+"""
+/mediciones/cohortes: tiempo de meter mediciones a un sketch KLL, de juntar
+sketches y de leer percentiles, y el error de rango contra los percentiles
+exactos de numpy.
+
+    python benchmarks/bench_cohorts.py [--samples 1000000] [--cohorts 84]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from sketches import KLL
+
+QS = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=1000000)
+    parser.add_argument('--cohorts', type=int, default=84)
+    parser.add_argument('--chunk', type=int, default=50000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    values = np.rint(rng.lognormal(4.7, 0.25, args.samples))
+    cohort = rng.integers(0, args.cohorts, args.samples)
+
+    started = time.perf_counter()
+    sketches = [KLL() for _ in range(args.cohorts)]
+    for start in range(0, args.samples, args.chunk):
+        chunk = slice(start, start + args.chunk)
+        order = np.argsort(cohort[chunk], kind='stable')
+        groups = np.split(values[chunk][order], np.flatnonzero(np.diff(cohort[chunk][order])) + 1)
+        for i, group in zip(np.unique(cohort[chunk]), groups):
+            sketches[i].update(group)
+    update_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    total = KLL()
+    for sketch in sketches:
+        total.merge(sketch)
+    merge_time = time.perf_counter() - started
+
+    small = KLL()
+    small.merge(total)
+    started = time.perf_counter()
+    for value in values[:10000]:
+        small.update([value])
+    small_time = (time.perf_counter() - started) / 10000
+
+    total.quantiles(QS)
+    started = time.perf_counter()
+    for _ in range(1000):
+        total.quantiles(QS)
+    query_time = (time.perf_counter() - started) / 1000
+
+    ordered = np.sort(values)
+    estimates = total.quantiles(QS)
+    errors = [abs(np.searchsorted(ordered, estimate, side='right') / len(values) - q)
+              for q, estimate in zip(QS, estimates)]
+    retained = sum(len(level) for level in total.levels)
+
+    print(f"samples:          {args.samples:,} in {args.cohorts} cohorts")
+    print(f"update:           {update_time * 1000:6.0f} ms  ({args.samples / update_time:,.0f} values/s)")
+    print(f"merge cohorts:    {merge_time * 1000:6.1f} ms  ({retained} values retained)")
+    print(f"single update:    {small_time * 1e6:6.1f} us")
+    print(f"query {len(QS)} quantiles: {query_time * 1e6:6.1f} us")
+    print(f"max rank error:   {max(errors) * 100:6.2f} %")
+
+
+if __name__ == '__main__':
+    main()
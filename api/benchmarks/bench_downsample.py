@@ -0,0 +1,76 @@
+"""
+/mediciones/rango: tiempo de LTTB y min/max sobre un año de ritmo cardiaco
+y el tamaño del JSON con y sin reducir, y lo mismo sobre los resúmenes por
+hora y por día (que no dependen de cuántas muestras haya).
+
+    python benchmarks/bench_downsample.py [--samples 500000] [--points 500]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+from flask import Flask, jsonify
+
+import json_provider
+from downsample import METHODS
+from rollups import LEVELS, aggregate
+from series import Series
+
+
+def make_series(n):
+    rng = np.random.default_rng(0)
+    start = int(np.datetime64('2024-01-01T00:00:00', 's').astype(np.int64))
+    # un año repartido en n muestras, con huecos como los de un reloj que no se usa de noche
+    x = start + np.sort(rng.choice(365 * 24 * 3600, n, replace=False)).astype(np.int64)
+    hours = (x // 3600) % 24
+    y = np.rint(65 + 15 * np.sin(hours / 24 * 2 * np.pi) + rng.normal(0, 6, n)).astype(np.int64)
+    return Series(x, y)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=500000)
+    parser.add_argument('--points', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    series = make_series(args.samples)
+    app = Flask('bench')
+    json_provider.init_app(app)
+
+    with app.test_request_context():
+        started = time.perf_counter()
+        raw_size = len(jsonify(series.points()).get_data())
+        raw_time = time.perf_counter() - started
+        print(f"samples:          {args.samples:,}")
+        print(f"raw json:         {raw_size / 1024:,.0f} KB in {raw_time * 1000:.0f} ms")
+        for name, method in METHODS.items():
+            y = series.y.astype(float)
+            best = float('inf')
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                indices = method(series.x, y, args.points)
+                best = min(best, time.perf_counter() - started)
+            size = len(jsonify(series.points(indices)).get_data())
+            print(f"{name + ':':<17} {best * 1000:6.1f} ms  {len(indices)} points, {size / 1024:.0f} KB json")
+
+        fechas = series.x.astype('datetime64[s]')
+        for level, (_, seconds, _) in LEVELS.items():
+            started = time.perf_counter()
+            starts, low, high, sums, counts = aggregate(fechas, series.y, seconds)
+            aggregate_time = time.perf_counter() - started
+            rollup = Series.from_buckets(starts.astype(np.int64), low, high, sums, counts, level)
+            started = time.perf_counter()
+            indices = METHODS['lttb'](rollup.x, rollup.y.astype(float), args.points)
+            coarse = rollup.coarsen(args.points)
+            rollup_time = time.perf_counter() - started
+            print(f"rollup {level + ':':<10} {len(rollup):,} buckets (aggregate {aggregate_time * 1000:.0f} ms), "
+                  f"lttb + minmax {rollup_time * 1000:.1f} ms  ({len(indices)} / {len(coarse)} points)")
+
+
+if __name__ == '__main__':
+    main()
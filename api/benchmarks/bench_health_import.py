@@ -0,0 +1,119 @@
+"""
+Importador de Apple Salud sobre un export.xml sintético del tamaño pedido:
+MB/s y lecturas/s de iterparse + validación, y la memoria máxima del
+proceso (debe quedarse igual sin importar el tamaño). Con --user también
+inserta en la BD configurada en el .env.
+
+    python benchmarks/bench_health_import.py [--size-mb 1024] [--keep export.xml] [--user 1]
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import health_import
+from ingest import validate
+
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ELEMENT HealthData (ExportDate,Me,(Record|Correlation|Workout|ActivitySummary)*)>
+<!ATTLIST HealthData locale CDATA #REQUIRED>
+]>
+<HealthData locale="es_MX">
+ <ExportDate value="2024-10-01 08:00:00 -0600"/>
+ <Me HKCharacteristicTypeIdentifierBiologicalSex="HKBiologicalSexFemale"/>
+"""
+
+RECORD = (' <Record type="{type}" sourceName="Apple Watch" sourceVersion="10.0" unit="{unit}" '
+          'creationDate="{date}" startDate="{date}" endDate="{date}" value="{value}">\n'
+          '  <MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="0"/>\n'
+          ' </Record>\n')
+
+CORRELATION = (' <Correlation type="HKCorrelationTypeIdentifierBloodPressure" sourceName="Omron" '
+               'creationDate="{date}" startDate="{date}" endDate="{date}">\n'
+               '  <Record type="HKQuantityTypeIdentifierBloodPressureSystolic" sourceName="Omron" '
+               'unit="mmHg" startDate="{date}" endDate="{date}" value="{systolic}"/>\n'
+               '  <Record type="HKQuantityTypeIdentifierBloodPressureDiastolic" sourceName="Omron" '
+               'unit="mmHg" startDate="{date}" endDate="{date}" value="{diastolic}"/>\n'
+               ' </Correlation>\n')
+
+
+def write_export(path, size):
+    """Escribe un export de ~`size` bytes: mayormente ritmo cardiaco y pasos, como los reales."""
+    start = datetime(2015, 1, 1)
+    i = 0
+    with open(path, 'w') as f:
+        f.write(HEADER)
+        while f.tell() < size:
+            chunk = []
+            for _ in range(10000):
+                date = (start + timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S -0600')
+                kind = i % 10
+                if kind < 5:
+                    chunk.append(RECORD.format(type=health_import.HEART_RATE, unit='count/min',
+                                               date=date, value=random.randint(50, 140)))
+                elif kind < 8:
+                    chunk.append(RECORD.format(type='HKQuantityTypeIdentifierStepCount', unit='count',
+                                               date=date, value=random.randint(1, 500)))
+                elif kind == 8:
+                    chunk.append(RECORD.format(type=health_import.GLUCOSE, unit='mg/dL',
+                                               date=date, value=random.randint(70, 180)))
+                else:
+                    chunk.append(CORRELATION.format(date=date, systolic=random.randint(100, 150),
+                                                    diastolic=random.randint(60, 95)))
+                i += 1
+            f.write(''.join(chunk))
+        f.write('</HealthData>\n')
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=1024)
+    parser.add_argument('--keep', help="ruta donde dejar (o reusar) el export generado")
+    parser.add_argument('--user', type=int)
+    args = parser.parse_args()
+
+    path = args.keep or os.path.join(tempfile.gettempdir(), 'bench_export.xml')
+    if not (args.keep and os.path.exists(path)):
+        started = time.perf_counter()
+        write_export(path, args.size_mb * 1024 * 1024)
+        print(f"generated:        {os.path.getsize(path) / 2 ** 20:,.0f} MB in {time.perf_counter() - started:.1f} s")
+    size = os.path.getsize(path)
+    rss_before = max_rss_mb()
+
+    try:
+        started = time.perf_counter()
+        read = rejected = 0
+        with open(path, 'rb') as f:
+            for batch in health_import._batches(health_import.readings(f), health_import.BATCH_SIZE):
+                _, batch_rejected = validate(batch)
+                read += len(batch)
+                rejected += len(batch_rejected)
+        elapsed = time.perf_counter() - started
+        print(f"parse + validate: {elapsed:.1f} s  {size / 2 ** 20 / elapsed:,.1f} MB/s  "
+              f"{read / elapsed:,.0f} readings/s ({read:,} readings, {rejected:,} rejected)")
+        print(f"max rss:          {max_rss_mb():.0f} MB (was {rss_before:.0f} MB before parsing)")
+
+        if args.user:
+            from database import pool
+            with pool.connection() as cnx:
+                status = health_import.run_import(cnx, args.user, path)
+            print(f"import (db):      {status['segundos']} s  {sum(status['insertadas'].values()):,} inserted  "
+                  f"{status['duplicadas']:,} duplicated")
+    finally:
+        if not args.keep:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
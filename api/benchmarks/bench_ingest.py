@@ -0,0 +1,100 @@
+"""
+Lecturas por segundo de /mediciones/ingest: parseo (JSON y NDJSON),
+validación con numpy, filtro de Bloom de id_muestra y armado de los INSERT.
+Con --user también inserta en la BD configurada en el .env, dentro de una
+transacción que se deshace.
+
+    python benchmarks/bench_ingest.py [--readings 20000] [--user 1]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from dedup import BloomFilter
+from ingest import insert_statements, parse_body, validate
+from statements import server_side
+
+
+def make_readings(n, invalid=0.02):
+    start = datetime.now() - timedelta(minutes=n)
+    readings = []
+    for i in range(n):
+        fecha = (start + timedelta(minutes=i)).isoformat(timespec='seconds')
+        kind = i % 3
+        if kind == 0:
+            reading = {"tipo": "glucosa", "fecha": fecha, "glucosa": random.randint(70, 180)}
+        elif kind == 1:
+            reading = {"tipo": "ritmo_cardiaco", "fecha": fecha, "ritmo": random.randint(50, 140)}
+        else:
+            reading = {"tipo": "presion_arterial", "fecha": fecha,
+                       "presion_sistolica": random.randint(100, 150), "presion_diastolica": random.randint(60, 95)}
+        reading["id_muestra"] = str(uuid.uuid4()).upper()
+        if random.random() < invalid:
+            reading["fecha"] = "ayer"
+        readings.append(reading)
+    return readings
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--readings', type=int, default=20000)
+    parser.add_argument('--user', type=int)
+    args = parser.parse_args()
+
+    readings = make_readings(args.readings)
+    body_json = json.dumps(readings).encode()
+    body_ndjson = '\n'.join(json.dumps(reading) for reading in readings).encode()
+
+    _, json_time = timed(lambda: parse_body(body_json, 'application/json'))
+    parsed, ndjson_time = timed(lambda: parse_body(body_ndjson, 'application/x-ndjson'))
+    (batches, rejected), validate_time = timed(lambda: validate(parsed))
+    statements, build_time = timed(lambda: [server_side(sql, params)
+                                            for batch in batches.values()
+                                            for sql, params in insert_statements(args.user or 1, batch)])
+
+    # resincronización: la mitad ya estaba en el filtro
+    keys = [f"{batch.kind.table}:{sample_id}" for batch in batches.values() for sample_id in batch.ids.tolist()]
+    bloom = BloomFilter(len(keys) // 2)
+    _, bloom_add_time = timed(lambda: bloom.add(keys[::2]))
+    maybe, bloom_time = timed(lambda: bloom.contains(keys))
+    false_positives = maybe[1::2].mean()
+
+    n = args.readings
+    print(f"readings:         {n} ({len(rejected)} rejected, {len(statements)} INSERT statements)")
+    print(f"parse json:       {json_time * 1000:7.1f} ms  {n / json_time:10,.0f}/s")
+    print(f"parse ndjson:     {ndjson_time * 1000:7.1f} ms  {n / ndjson_time:10,.0f}/s")
+    print(f"validate:         {validate_time * 1000:7.1f} ms  {n / validate_time:10,.0f}/s")
+    print(f"bloom add:        {bloom_add_time * 1000:7.1f} ms  {len(keys) // 2 / bloom_add_time:10,.0f}/s")
+    print(f"bloom contains:   {bloom_time * 1000:7.1f} ms  {len(keys) / bloom_time:10,.0f}/s "
+          f"({false_positives:.2%} false positives, {bloom.array.nbytes / 1024:.0f} KB)")
+    print(f"build statements: {build_time * 1000:7.1f} ms  {n / build_time:10,.0f}/s")
+
+    if args.user:
+        from database import fetch_all, pool
+        with pool.connection() as cnx:
+            cursor = cnx.cursor()
+            started = time.perf_counter()
+            for batch in batches.values():
+                for sql, params in insert_statements(args.user, batch):
+                    fetch_all(cursor, sql, params)
+            insert_time = time.perf_counter() - started
+            cnx.rollback()
+        inserted = n - len(rejected)
+        print(f"insert (db):      {insert_time * 1000:7.1f} ms  {inserted / insert_time:10,.0f}/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+jsonify con el provider default de Flask contra el de orjson, sobre
+renglones como los que regresa pymssql (NUMERIC -> Decimal, DATETIME).
+
+    python benchmarks/bench_json.py [--rows 10000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+
+
+def make_rows(n):
+    start = datetime(2024, 1, 1, 8, 0)
+    return [
+        {
+            'ID': Decimal(i),
+            'USUARIO': Decimal(i % 500),
+            'FECHA': start + timedelta(minutes=i),
+            'PUNTOS_MODIFICADOS': Decimal(50),
+            'TIPO_MODIFICACION': 'EVENTO',
+            'BENEFICIO': None,
+            'EVENTO': Decimal(i % 40),
+            'RETO': None,
+        }
+        for i in range(n)
+    ]
+
+
+def timed(app, rows, repeat):
+    with app.test_request_context():
+        jsonify(rows)
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = jsonify(rows).get_data()
+            best = min(best, time.perf_counter() - started)
+    return best, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if json_provider.orjson is None:
+        sys.exit("orjson is not installed")
+
+    rows = make_rows(args.rows)
+
+    default_app = Flask('default')
+    default_app.json = DefaultJSONProvider(default_app)
+    fast_app = Flask('orjson')
+    json_provider.init_app(fast_app)
+
+    default_time, default_size = timed(default_app, rows, args.repeat)
+    fast_time, fast_size = timed(fast_app, rows, args.repeat)
+
+    print(f"rows:             {args.rows}")
+    print(f"flask default:    {default_time * 1000:.1f} ms ({default_size / 1024:.0f} KB)")
+    print(f"orjson provider:  {fast_time * 1000:.1f} ms ({fast_size / 1024:.0f} KB)")
+    print(f"speedup:          {default_time / fast_time:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
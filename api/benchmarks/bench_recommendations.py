@@ -0,0 +1,70 @@
+"""
+/eventos/recomendados: tiempo de armar el TagModel de la lista de eventos y
+de ordenar los eventos para un usuario, contra el ciclo por par de tags que
+hacía la app (sin el costo de cargar el modelo de CoreML en cada par).
+
+    python benchmarks/bench_recommendations.py [--events 500] [--tags 30]
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+from recommendations import TagModel
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--tags', type=int, default=30)
+    parser.add_argument('--user-tags', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    tags = list(range(1, args.tags + 1))
+    similitud = [SimpleNamespace(ID_TAG_1=a, ID_TAG_2=b, SIMILITUD=float(rng.random()))
+                 for a in tags for b in tags if a < b]
+    pairs = {(row.ID_TAG_1, row.ID_TAG_2): row.SIMILITUD for row in similitud}
+    eventos = [SimpleNamespace(ID_EVENTO=i) for i in range(args.events)]
+    eventos_tags = [SimpleNamespace(ID_EVENTO=i, ID_TAG=int(t))
+                    for i in range(args.events) for t in rng.choice(tags, rng.integers(1, 5), replace=False)]
+    weights = {int(t): int(rng.integers(1, 10)) for t in rng.choice(tags, args.user_tags, replace=False)}
+
+    started = time.perf_counter()
+    model = TagModel(eventos, tags, similitud, eventos_tags)
+    build_time = time.perf_counter() - started
+
+    best = float('inf')
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        model.rank(weights)
+        best = min(best, time.perf_counter() - started)
+
+    by_event = {}
+    for row in eventos_tags:
+        by_event.setdefault(row.ID_EVENTO, []).append(row.ID_TAG)
+    started = time.perf_counter()
+    predictions = 0
+    for evento in eventos:
+        total = frequency = 0
+        for tag, veces in weights.items():
+            for event_tag in by_event.get(evento.ID_EVENTO, []):
+                total += (1.0 if tag == event_tag else pairs[(min(tag, event_tag), max(tag, event_tag))]) * veces
+                frequency += veces
+                predictions += 1
+    loop_time = time.perf_counter() - started
+
+    print(f"events:           {args.events} x {args.tags} tags, user with {args.user_tags} tags")
+    print(f"build model:      {build_time * 1000:6.2f} ms  (once per event list)")
+    print(f"rank events:      {best * 1000:6.3f} ms")
+    print(f"per-pair loop:    {loop_time * 1000:6.2f} ms  ({predictions:,} predictions)")
+
+
+if __name__ == '__main__':
+    main()
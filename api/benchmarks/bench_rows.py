@@ -0,0 +1,91 @@
+"""
+dict(zip(columns, row)) por renglón contra los records de records.py, sobre
+renglones como los que regresa pymssql para HISTORIAL_PUNTOS.
+
+    python benchmarks/bench_rows.py [--rows 10000] [--repeat 20]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask, jsonify
+
+import json_provider
+from records import decode_rows
+
+QUERY = "SELECT ID, USUARIO, FECHA, PUNTOS_MODIFICADOS, TIPO_MODIFICACION, BENEFICIO, EVENTO, RETO FROM HISTORIAL_PUNTOS"
+
+DESCRIPTION = (
+    ('ID', 5, None, None, None, None, None),
+    ('USUARIO', 5, None, None, None, None, None),
+    ('FECHA', 4, None, None, None, None, None),
+    ('PUNTOS_MODIFICADOS', 5, None, None, None, None, None),
+    ('TIPO_MODIFICACION', 3, None, None, None, None, None),
+    ('BENEFICIO', 5, None, None, None, None, None),
+    ('EVENTO', 5, None, None, None, None, None),
+    ('RETO', 5, None, None, None, None, None),
+)
+
+
+def make_rows(n):
+    start = datetime(2024, 1, 1, 8, 0)
+    return [(Decimal(i), Decimal(i % 500), start + timedelta(minutes=i), Decimal(50), 1, None, Decimal(i % 40), None)
+            for i in range(n)]
+
+
+def as_dicts(rows):
+    columns = [column[0] for column in DESCRIPTION]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def as_records(rows):
+    return decode_rows(QUERY, DESCRIPTION, rows)
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def retained(fn, rows):
+    tracemalloc.start()
+    result = fn(rows)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    app = Flask('bench')
+    json_provider.init_app(app)
+
+    print(f"rows: {args.rows}  (JSON_DECIMAL={'number' if json_provider.DECIMAL_AS_NUMBER else 'str'})")
+    print(f"{'':10} {'decode':>10} {'decode+json':>12} {'memory':>10}")
+    with app.test_request_context():
+        for name, fn in (('dict', as_dicts), ('records', as_records)):
+            fn(rows)
+            decode_time = best_of(lambda: fn(rows), args.repeat)
+            total_time = best_of(lambda: jsonify(fn(rows)).get_data(), args.repeat)
+            memory = retained(fn, rows)
+            print(f"{name:10} {decode_time * 1000:8.1f}ms {total_time * 1000:10.1f}ms {memory / 2 ** 20:8.2f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Tiempo de restaurar sesiones desde el snapshot al arrancar un worker.
+
+    python benchmarks/bench_session_restore.py [--sessions 1000000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from session_backends import MemoryBackend
+from session_snapshot import SessionSnapshot, read_records, replay
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'sessions.snap')
+
+        source = MemoryBackend(max_sessions=args.sessions)
+        now = time.time()
+        source.load((str(uuid.uuid4()), i, now, now + 3600) for i in range(args.sessions))
+        writer = SessionSnapshot(source, path)
+        started = time.perf_counter()
+        writer.compact()
+        write_time = time.perf_counter() - started
+        size_mb = os.path.getsize(path) / 2 ** 20
+
+        started = time.perf_counter()
+        records = read_records(path)
+        parse_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        live = replay(records)
+        replay_time = time.perf_counter() - started
+
+        target = MemoryBackend(max_sessions=args.sessions)
+        started = time.perf_counter()
+        restored = SessionSnapshot(target, path).restore()
+        restore_time = time.perf_counter() - started
+
+    print(f"sessions:         {args.sessions}")
+    print(f"snapshot size:    {size_mb:.1f} MB")
+    print(f"write snapshot:   {write_time:.2f}s")
+    print(f"mmap + unpack:    {parse_time:.2f}s")
+    print(f"replay log:       {replay_time:.2f}s ({len(live)} live)")
+    print(f"full restore:     {restore_time:.2f}s ({restored} sessions loaded into MemoryBackend)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+/mediciones/stats: tiempo de convertir los renglones de la BD a numpy y de
+calcular las estadísticas de una métrica (objetivo: < 20 ms con 100k
+muestras), y de un acierto del memo.
+
+    python benchmarks/bench_trends.py [--samples 100000] [--days 365]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+import trends
+from series import EPOCH, Series, fetch_array
+
+
+class FakeCursor:
+    """Regresa los renglones como los da pymssql, sin BD."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+def best_of(repeat, fn):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--samples', type=int, default=100000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    desde = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=args.days - 1)
+    start = int((np.datetime64(desde, 's') - EPOCH).astype(np.int64))
+    x = start + np.sort(rng.choice(args.days * 86400, args.samples, replace=False)).astype(np.int64)
+    y = np.rint(rng.normal(120, 35, args.samples)).astype(np.int64)
+    rows = list(zip(x.tolist(), y.tolist()))
+
+    fetch_time, data = best_of(args.repeat, lambda: fetch_array(FakeCursor(rows), "SELECT 1", None, 2))
+    series = Series(data[:, 0], data[:, 1])
+    compute_time, _ = best_of(args.repeat, lambda: trends.compute(series, desde, args.days, 'glucosa'))
+    memo = trends.UserMemo('bench_trends', ttl=300)
+    memo.get(1, 'glucosa', lambda: trends.compute(series, desde, args.days, 'glucosa'))
+    hit_time, _ = best_of(args.repeat, lambda: memo.get(1, 'glucosa', lambda: None))
+
+    print(f"samples:          {args.samples:,} over {args.days} days")
+    print(f"rows -> numpy:    {fetch_time * 1000:6.1f} ms")
+    print(f"compute stats:    {compute_time * 1000:6.1f} ms")
+    print(f"memo hit:         {hit_time * 1e6:6.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, current_app, make_response, request
+from logger import my_logger
+from compression import CACHED_LEVEL, ETAG_SUFFIX, MIN_SIZE, choose_encoding, compress
+
+# Caches en memoria de respuestas que cambian poco. Cada cache guarda el JSON
+# ya serializado junto con la versión con la que se generó; la versión vive
+# en un archivo mapeado en memoria que comparten todos los workers del host,
+# así que checar si el cache sigue vigente es solo leer 8 bytes.
+
+# privado (0700): ahí también viven los sketches de cohorts.py
+CACHE_DIR = os.getenv('CACHE_DIR', '/tmp/api_cache')
+os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+
+VERSION = struct.Struct('<Q')
+
+caches = {}
+
+
+class SharedVersion:
+    """Contador de versión compartido entre procesos; con `slots` son varios contadores en el mismo archivo."""
+
+    def __init__(self, name, slots=1):
+        self.path = os.path.join(CACHE_DIR, f'{name}.version')
+        size = VERSION.size * slots
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def get(self, slot=0):
+        return VERSION.unpack_from(self._mm, slot * VERSION.size)[0]
+
+    def bump(self, slot=0):
+        with open(self.path, 'rb+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                version = self.get(slot) + 1
+                VERSION.pack_into(self._mm, slot * VERSION.size, version)
+                self._mm.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return version
+
+
+class Expiring:
+    """Lo puede regresar un loader cuando sus datos caducan solos en `expires_in` segundos."""
+    __slots__ = ('data', 'expires_in')
+
+    def __init__(self, data, expires_in):
+        self.data = data
+        self.expires_in = expires_in
+
+
+class CacheEntry:
+    __slots__ = ('version', 'data', 'body', 'expires', 'etag', 'variants')
+
+    def __init__(self, version, data, body, expires=None):
+        self.version = version
+        # los datos tal cual, para paginar sin volver a la BD
+        self.data = data
+        self.body = body
+        self.expires = expires
+        # hash del contenido: igual en todos los workers para los mismos datos
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        # body ya comprimido por codificación, se calcula una vez por entrada
+        self.variants = {}
+
+    def encoded(self, encoding):
+        if encoding is None:
+            return self.body
+        data = self.variants.get(encoding)
+        if data is None:
+            data = compress(self.body, encoding, CACHED_LEVEL[encoding])
+            self.variants[encoding] = data
+        return data
+
+    def fresh(self, version, now):
+        return self.version == version and (self.expires is None or now < self.expires)
+
+
+class VersionedCache:
+    """
+    Cache de un payload JSON. `loader` regresa los datos (lista o dict) y se
+    llama solo cuando la versión compartida cambió desde la última carga o
+    cuando venció el Expiring que regresó.
+
+    Con `swr` (stale-while-revalidate), si ya hay datos y dejaron de estar
+    vigentes se siguen sirviendo mientras un hilo los recarga en segundo
+    plano; solo el primer request de un worker espera a la BD.
+    """
+
+    def __init__(self, name, loader, swr=False):
+        self.name = name
+        self.loader = loader
+        self.swr = swr
+        self.version = SharedVersion(name)
+        self._entry = None
+        self._lock = threading.Lock()
+        # lo tiene el hilo que está recargando en segundo plano
+        self._refreshing = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stale': 0, 'not_modified': 0, 'bytes_saved': 0,
+                         'invalidations': 0, 'refresh_errors': 0}
+        caches[name] = self
+
+    def get(self):
+        """Regresa el CacheEntry vigente, cargándolo si hace falta."""
+        version = self.version.get()
+        entry = self._entry
+        if entry is not None and entry.fresh(version, time.time()):
+            self.counters['hits'] += 1
+            return entry
+        if entry is not None and self.swr:
+            self.counters['stale'] += 1
+            self._refresh_in_background()
+            return entry
+        # solo un hilo va a la BD; los demás esperan y usan su resultado
+        with self._lock:
+            entry = self._entry
+            if entry is not None and entry.fresh(version, time.time()):
+                self.counters['hits'] += 1
+                return entry
+            self.counters['misses'] += 1
+            return self._load(version)
+
+    def _load(self, version):
+        # si invalidan mientras cargamos, la versión vieja obliga a recargar
+        data = self.loader()
+        expires = None
+        if isinstance(data, Expiring):
+            if data.expires_in is not None:
+                expires = time.time() + max(data.expires_in, 1)
+            data = data.data
+        entry = CacheEntry(version, data, current_app.json.dumps(data).encode(), expires)
+        self._entry = entry
+        my_logger.debug(f"Cache {self.name} reloaded at version {version}")
+        return entry
+
+    def _refresh_in_background(self):
+        if not self._refreshing.acquire(blocking=False):
+            return
+        app = current_app._get_current_object()
+        threading.Thread(target=self._refresh, args=(app,), name=f'cache-refresh-{self.name}', daemon=True).start()
+
+    def _refresh(self, app):
+        try:
+            # contexto propio para que get_db() tome y regrese su conexión
+            with app.app_context():
+                with self._lock:
+                    self._load(self.version.get())
+        except Exception as e:
+            self.counters['refresh_errors'] += 1
+            my_logger.error(f"Error refreshing cache {self.name}: {e}")
+        finally:
+            self._refreshing.release()
+
+    def response(self):
+        """200 con el JSON, o 304 sin body si el cliente ya tiene este ETag."""
+        entry = self.get()
+        encoding = None
+        if len(entry.body) >= MIN_SIZE:
+            encoding = choose_encoding(request.accept_encodings)
+        body = entry.encoded(encoding)
+        response = Response(body, mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+        etag = entry.etag
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+            etag += ETAG_SUFFIX[encoding]
+        response.set_etag(etag)
+        if etag in request.if_none_match:
+            self.counters['not_modified'] += 1
+            self.counters['bytes_saved'] += len(body)
+        return response.make_conditional(request)
+
+    def invalidate(self):
+        self.counters['invalidations'] += 1
+        # con swr se deja la entrada para servirla mientras se recarga
+        if not self.swr:
+            self._entry = None
+        return self.version.bump()
+
+    def stats(self):
+        entry = self._entry
+        return dict(self.counters,
+                    version=self.version.get(),
+                    cached_bytes=len(entry.body) if entry is not None else 0,
+                    compressed_bytes={encoding: len(data) for encoding, data in entry.variants.items()}
+                        if entry is not None else {},
+                    expires_in=None if entry is None or entry.expires is None
+                        else round(entry.expires - time.time(), 1))
+
+
+class UserMemo:
+    """
+    Resultados calculados por usuario, en la memoria de cada worker. Cada
+    usuario tiene su versión compartida (por ranura: usuarios distintos
+    pueden compartirla y solo se recalcula de más), así que invalidate()
+    en un worker hace que todos recalculen. Las entradas también caducan
+    a los `ttl` segundos.
+    """
+
+    SLOTS = 4096
+
+    def __init__(self, name, ttl, max_entries=10000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = SharedVersion(name, slots=self.SLOTS)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        caches[name] = self
+
+    def get(self, user_id, key, compute):
+        """El resultado de `compute()` para (usuario, key), calculándolo si hace falta."""
+        version = self.version.get(int(user_id) % self.SLOTS)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((user_id, key))
+            if entry is not None and entry[0] == version and now < entry[1]:
+                self._entries.move_to_end((user_id, key))
+                self.counters['hits'] += 1
+                return entry[2]
+            self.counters['misses'] += 1
+        # si invalidan mientras se calcula, la versión vieja obliga a recalcular
+        value = compute()
+        with self._lock:
+            self._entries[(user_id, key)] = (version, now + self.ttl, value)
+            self._entries.move_to_end((user_id, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, user_id):
+        self.counters['invalidations'] += 1
+        return self.version.bump(int(user_id) % self.SLOTS)
+
+    def stats(self):
+        return dict(self.counters, entries=len(self._entries))
+
+
+def cache_policy(value):
+    """Cache-Control propio de un endpoint; los demás se quedan con no-store."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = make_response(view(*args, **kwargs))
+            response.headers['Cache-Control'] = value
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -0,0 +1,433 @@
+"""
+Distribuciones por cohorte (banda de edad, género y tipo de sangre) de peso,
+altura, IMC y las mediciones, con sketches KLL (ver sketches.py).
+
+Cada cohorte tiene un sketch por métrica, y también cada combinación con
+comodines ('*': todas las edades, todos los géneros...), así que una
+consulta es buscar un sketch en un dict y leer sus cuantiles ya ordenados.
+
+    python cohorts.py
+
+los recalcula desde la BD (pensado para correr cada noche) y los deja en
+CACHE_DIR para que los workers los carguen. Entre una corrida y otra,
+dedup.store agrega las mediciones nuevas a un log compartido que cada
+worker aplica a su copia antes de contestar.
+
+Ninguno de los dos archivos usa pickle: el snapshot es un .npz con los
+valores de los sketches y un JSON con el resto, y el log son registros de
+struct (DELTA_HEADER) seguidos de sus valores en float64.
+"""
+import fcntl
+import itertools
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from cache import CACHE_DIR, SharedVersion
+from database import fetch_all, pool
+from ingest import KINDS
+from logger import my_logger
+from sketches import KLL
+
+DIMENSIONS = ('edad', 'genero', 'tipo_sangre')
+
+# límites inferiores de las bandas de edad
+AGE_BANDS = (0, 18, 30, 40, 50, 60, 70)
+AGE_LABELS = ('<18', '18-29', '30-39', '40-49', '50-59', '60-69', '70+')
+
+# una por usuario (su registro más reciente de DATOS_SALUD)
+PROFILE_METRICS = ('peso', 'altura', 'imc')
+# todas las mediciones de los últimos COHORT_DAYS días
+READING_METRICS = tuple(field for kind in KINDS.values() for field in kind.fields)
+
+COHORT_DAYS = int(os.getenv('COHORT_DAYS', 90))
+
+# cohortes con menos usuarios no se muestran, para no exponer a nadie
+MIN_USERS = int(os.getenv('COHORT_MIN_USERS', 5))
+
+WILDCARD = '*'
+
+DEFAULT_PERCENTILES = '5,25,50,75,95'
+
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, 'cohorts.npz')
+DELTAS_PATH = os.path.join(CACHE_DIR, 'cohorts.deltas')
+
+# registro del log: usuario, largo del nombre de la métrica y cuántos valores;
+# luego el nombre en utf-8 y los valores en float64
+DELTA_HEADER = struct.Struct('<qBI')
+
+FETCH_SIZE = 50000
+
+
+def age_band(edad):
+    if edad is None:
+        return None
+    return AGE_LABELS[int(np.searchsorted(AGE_BANDS, edad, side='right')) - 1]
+
+
+def rollup_keys(cohort):
+    """Las 8 llaves de una cohorte: ella misma y cada combinación con comodines."""
+    return [tuple(WILDCARD if hide else value for value, hide in zip(cohort, mask))
+            for mask in itertools.product((False, True), repeat=len(DIMENSIONS))]
+
+
+class CohortSketches:
+    """Sketches de todas las cohortes, con el mapa usuario -> cohorte para aplicar mediciones nuevas."""
+
+    def __init__(self):
+        self.users = {}
+        self.user_counts = {}
+        self.sketches = {}
+        self.built = None
+        self._groups = None
+
+    def sketch(self, key, metric):
+        sketch = self.sketches.get((key, metric))
+        if sketch is None:
+            sketch = self.sketches[(key, metric)] = KLL()
+            self._groups = None
+        return sketch
+
+    def add(self, user_id, metric, values):
+        """Agrega valores de un usuario a todas las llaves de su cohorte (actualización incremental)."""
+        cohort = self.users.get(user_id)
+        if cohort is None:
+            # usuario sin DATOS_SALUD o nuevo desde la última reconstrucción
+            return
+        for key in rollup_keys(cohort):
+            self.sketch(key, metric).update(values)
+
+    def cohorts(self, metric, filters, group_by):
+        """
+        [(llave, sketch)] de la métrica agrupada por las dimensiones `group_by`
+        y restringida a `filters` {dimensión: valor}.
+        """
+        if not group_by:
+            # una sola cohorte: su llave se arma directo
+            key = tuple(filters.get(dimension, WILDCARD) for dimension in DIMENSIONS)
+            sketch = self.sketches.get((key, metric))
+            return [(key, sketch)] if sketch is not None else []
+        shown = tuple(dimension in filters or dimension in group_by for dimension in DIMENSIONS)
+        return [(key, sketch) for key, sketch in self._grouped(metric, shown)
+                if all(key[DIMENSIONS.index(dimension)] == value for dimension, value in filters.items())]
+
+    def _grouped(self, metric, shown):
+        """Las llaves de la métrica que tienen valor justo en las dimensiones `shown`, ya ordenadas."""
+        if getattr(self, '_groups', None) is None:
+            groups = {}
+            for (key, key_metric), sketch in self.sketches.items():
+                mask = tuple(value != WILDCARD for value in key)
+                groups.setdefault((key_metric, mask), []).append((key, sketch))
+            for items in groups.values():
+                items.sort(key=lambda item: _sort_key(item[0]))
+            self._groups = groups
+        return self._groups.get((metric, shown), [])
+
+    def save(self, f):
+        """Escribe el estado en `f` como .npz, sin objetos de Python (ver load)."""
+        items = list(self.sketches.items())
+        meta = {
+            "built": self.built.isoformat() if self.built else None,
+            "users": [[user_id, *cohort] for user_id, cohort in self.users.items()],
+            "user_counts": [[*key, count] for key, count in self.user_counts.items()],
+            # k, n, min, max y el largo de cada nivel; los valores van juntos en `values`
+            "sketches": [],
+        }
+        levels = []
+        for (key, metric), sketch in items:
+            k, n, low, high, sketch_levels = sketch.to_state()
+            meta["sketches"].append([*key, metric, k, n, low, high, [len(level) for level in sketch_levels]])
+            levels.extend(sketch_levels)
+        values = np.concatenate(levels) if levels else np.empty(0)
+        np.savez(f, meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8), values=values)
+
+    @classmethod
+    def load(cls, f):
+        """El estado que escribió save; ValueError / KeyError si el archivo no tiene ese formato."""
+        with np.load(f, allow_pickle=False) as data:
+            meta = json.loads(data['meta'].tobytes())
+            values = data['values'].astype(np.float64, copy=False)
+        state = cls()
+        state.built = datetime.fromisoformat(meta["built"]) if meta["built"] else None
+        state.users = {int(user_id): tuple(cohort) for user_id, *cohort in meta["users"]}
+        state.user_counts = {tuple(key): int(count) for *key, count in meta["user_counts"]}
+        position = 0
+        for *key, metric, k, n, low, high, lengths in meta["sketches"]:
+            levels = []
+            for length in lengths:
+                levels.append(values[position:position + length])
+                position += length
+            state.sketches[(tuple(key), metric)] = KLL.from_state(k, n, low, high, levels)
+        if position != len(values):
+            raise ValueError("cohort snapshot values do not match its metadata")
+        return state
+
+
+def _sort_key(key):
+    # bandas de edad en orden y los desconocidos (None) al final
+    edad, genero, tipo_sangre = key
+    band = AGE_LABELS.index(edad) if edad in AGE_LABELS else len(AGE_LABELS)
+    return band, genero is None, genero or '', tipo_sangre is None, tipo_sangre or ''
+
+
+def _profiles(cursor):
+    return fetch_all(cursor, """
+        SELECT USUARIO, EDAD, GENERO, TIPO_SANGRE, PESO, ALTURA
+        FROM (
+            SELECT DS.*, ROW_NUMBER() OVER (PARTITION BY DS.USUARIO ORDER BY DS.ID_HISTORIAL DESC) AS N
+            FROM DATOS_SALUD DS
+        ) AS D
+        WHERE N = 1
+    """)
+
+
+def _stream_readings(cnx, state, table, columns, desde):
+    """Agrega las mediciones de una tabla a las cohortes base, leyendo de a FETCH_SIZE renglones."""
+    cursor = cnx.cursor()
+    try:
+        cursor.execute(f"SELECT USUARIO, {', '.join(columns)} FROM {table} WHERE FECHA >= %s", (desde,))
+        cohort_ids = {}
+        keys = []
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            data = np.array([[np.nan if value is None else float(value) for value in row] for row in rows])
+            users, inverse = np.unique(data[:, 0].astype(np.int64), return_inverse=True)
+            # índice de la cohorte de cada usuario del bloque (-1 si no tiene DATOS_SALUD)
+            mapped = np.empty(len(users), dtype=np.int64)
+            for i, user_id in enumerate(users.tolist()):
+                cohort = state.users.get(user_id)
+                if cohort is None:
+                    mapped[i] = -1
+                    continue
+                if cohort not in cohort_ids:
+                    cohort_ids[cohort] = len(keys)
+                    keys.append(cohort)
+                mapped[i] = cohort_ids[cohort]
+            row_cohorts = mapped[inverse]
+            order = np.argsort(row_cohorts, kind='stable')
+            starts = np.flatnonzero(np.diff(row_cohorts[order], prepend=-2))
+            for start, end in zip(starts, np.append(starts[1:], len(order))):
+                cohort_id = row_cohorts[order[start]]
+                if cohort_id < 0:
+                    continue
+                group = order[start:end]
+                for j, metric in enumerate(columns.values()):
+                    state.sketch(keys[cohort_id], metric).update(data[group, j + 1])
+    finally:
+        cursor.close()
+
+
+def build(cnx):
+    """Calcula desde cero los sketches de todas las cohortes."""
+    state = CohortSketches()
+    cursor = cnx.cursor()
+    profiles = _profiles(cursor)
+    cursor.close()
+
+    base = set()
+    for row in profiles:
+        cohort = (age_band(row.EDAD), row.GENERO or None, row.TIPO_SANGRE or None)
+        user_id = int(row.USUARIO)
+        state.users[user_id] = cohort
+        base.add(cohort)
+        for key in rollup_keys(cohort):
+            state.user_counts[key] = state.user_counts.get(key, 0) + 1
+        peso = float(row.PESO) if row.PESO is not None else None
+        altura = float(row.ALTURA) if row.ALTURA is not None else None
+        if altura is not None and altura > 3:
+            # registrada en centímetros
+            altura /= 100
+        imc = peso / altura ** 2 if peso and altura else None
+        for metric, value in (('peso', peso), ('altura', altura), ('imc', imc)):
+            if value is not None:
+                state.sketch(cohort, metric).update([value])
+
+    desde = datetime.now() - timedelta(days=COHORT_DAYS)
+    for kind in KINDS.values():
+        columns = {column: field for field, (column, _, _) in kind.fields.items()}
+        _stream_readings(cnx, state, kind.table, columns, desde)
+
+    # las combinaciones con comodines se arman juntando los sketches de las cohortes base
+    for (key, metric), sketch in list(state.sketches.items()):
+        if key not in base:
+            continue
+        for rollup in rollup_keys(key)[1:]:
+            state.sketch(rollup, metric).merge(sketch)
+    state.built = datetime.now()
+    return state
+
+
+class CohortIndex:
+    """La copia del worker: el snapshot de la última reconstrucción más el log de mediciones nuevas."""
+
+    def __init__(self):
+        self.version = SharedVersion('cohorts')
+        self._lock = threading.Lock()
+        self._state = None
+        self._loaded_version = None
+        self._offset = 0
+
+    def current(self):
+        with self._lock:
+            version = self.version.get()
+            if version != self._loaded_version:
+                self._state = self._load_snapshot()
+                self._loaded_version = version
+                self._offset = 0
+            self._apply_deltas()
+            return self._state
+
+    def _load_snapshot(self):
+        try:
+            with open(SNAPSHOT_PATH, 'rb') as f:
+                return CohortSketches.load(f)
+        except FileNotFoundError:
+            return CohortSketches()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            my_logger.error(f"Could not load cohort snapshot {SNAPSHOT_PATH}: {e}")
+            return CohortSketches()
+
+    def _apply_deltas(self):
+        try:
+            f = open(DELTAS_PATH, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            # LOCK_SH: record no escribe a medias y publish no vacía el log mientras se lee
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                if self.version.get() != self._loaded_version:
+                    # publish ya lo vació; la siguiente consulta carga el snapshot nuevo
+                    return
+                f.seek(self._offset)
+                data = f.read()
+                position = 0
+                while len(data) - position >= DELTA_HEADER.size:
+                    user_id, name_size, count = DELTA_HEADER.unpack_from(data, position)
+                    start = position + DELTA_HEADER.size + name_size
+                    end = start + 8 * count
+                    if end > len(data):
+                        # registro incompleto: se vuelve a intentar desde aquí la próxima vez
+                        break
+                    metric = data[start - name_size:start].decode('utf-8', 'replace')
+                    if metric in READING_METRICS:
+                        self._state.add(user_id, metric, np.frombuffer(data, dtype='<f8', count=count, offset=start))
+                    position = end
+                self._offset += position
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def record(self, user_id, batches):
+        """Agrega al log las mediciones recién guardadas (ver dedup.store)."""
+        # como en build: solo cuentan las de los últimos COHORT_DAYS días
+        desde = np.datetime64(datetime.now() - timedelta(days=COHORT_DAYS), 's')
+        entries = []
+        for batch in batches.values():
+            recent = batch.fechas >= desde
+            if not recent.any():
+                continue
+            for field, (column, _, _) in batch.kind.fields.items():
+                values = batch.values[column][recent].astype('<f8')
+                name = field.encode()
+                entries.append(DELTA_HEADER.pack(user_id, len(name), len(values)) + name + values.tobytes())
+        if not entries:
+            return
+        with open(DELTAS_PATH, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(b''.join(entries))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def publish(self, state):
+        """Deja `state` como el snapshot nuevo y vacía el log; los workers lo cargan en su siguiente consulta."""
+        fd, tmp = tempfile.mkstemp(prefix='cohorts.', suffix='.tmp', dir=os.path.dirname(SNAPSHOT_PATH))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                state.save(f)
+            os.replace(tmp, SNAPSHOT_PATH)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        # las mediciones que llegaron durante la reconstrucción pueden perderse
+        # hasta la siguiente; no se cuentan doble. La versión sube antes de
+        # vaciar el log y con el lock tomado, así ningún worker sigue leyendo
+        # con un offset del log anterior.
+        with open(DELTAS_PATH, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                self.version.bump()
+                f.truncate(0)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+cohort_index = CohortIndex()
+
+
+def query(metric, filters, group_by, percentiles):
+    """
+    (fecha de la reconstrucción, [cohortes], ocultas): los percentiles de
+    cada cohorte que tenga al menos MIN_USERS usuarios, y cuántas no los tenían.
+    """
+    state = cohort_index.current()
+    qs = [p / 100 for p in percentiles]
+    results = []
+    hidden = 0
+    for key, sketch in state.cohorts(metric, filters, group_by):
+        users = state.user_counts.get(key, 0)
+        if users < MIN_USERS:
+            hidden += 1
+            continue
+        cohort = {dimension: value for dimension, value in zip(DIMENSIONS, key) if value != WILDCARD}
+        values = sketch.quantiles(qs)
+        cohort.update({
+            "usuarios": users,
+            "muestras": sketch.n,
+            "percentiles": {f"p{p:g}": None if value is None else round(value, 2)
+                            for p, value in zip(percentiles, values)},
+        })
+        results.append(cohort)
+    return state.built, results, hidden
+
+
+def cohort_args(metric, args):
+    """(filtros, agrupar por, percentiles) de los parámetros del request; ValueError si alguno no sirve."""
+    metrics = PROFILE_METRICS + READING_METRICS
+    if metric not in metrics:
+        raise ValueError(f"La métrica debe ser una de: {', '.join(metrics)}.")
+    filters = {dimension: args[dimension] for dimension in DIMENSIONS if args.get(dimension)}
+    if 'edad' in filters and filters['edad'] not in AGE_LABELS:
+        raise ValueError(f"El parámetro edad debe ser una de: {', '.join(AGE_LABELS)}.")
+    group_by = [dimension for dimension in args.get('por', '').split(',') if dimension]
+    if any(dimension not in DIMENSIONS for dimension in group_by):
+        raise ValueError(f"El parámetro por debe ser una lista de: {', '.join(DIMENSIONS)}.")
+    try:
+        percentiles = [float(p) for p in args.get('q', DEFAULT_PERCENTILES).split(',')]
+    except ValueError:
+        raise ValueError("El parámetro q debe ser una lista de números.")
+    if not percentiles or any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError("Los percentiles deben estar entre 0 y 100.")
+    return filters, group_by, percentiles
+
+
+def main():
+    started = time.monotonic()
+    with pool.connection() as cnx:
+        state = build(cnx)
+    cohort_index.publish(state)
+    elapsed = time.monotonic() - started
+    my_logger.info(f"Rebuilt cohort sketches for {len(state.users)} users, "
+                   f"{len(state.sketches)} sketches in {elapsed:.1f}s")
+    print(f"{len(state.users)} usuarios, {len(state.sketches)} sketches, {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
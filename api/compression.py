@@ -0,0 +1,69 @@
+import gzip
+import os
+from flask import request
+
+# brotli viene en requirements.txt; si no está instalado solo se ofrece gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from logger import my_logger
+
+# Compresión de respuestas según Accept-Encoding. Las respuestas chicas se
+# mandan tal cual (no vale la pena el CPU) y los streams no se tocan. Los
+# payloads de cache.py se comprimen una sola vez y se guardan junto al JSON.
+
+MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+COMPRESSIBLE = ('application/json', 'text/html', 'text/plain', 'text/csv', 'application/x-ndjson')
+
+# niveles para respuestas dinámicas; los payloads cacheados usan el máximo
+DYNAMIC_LEVEL = {'br': 4, 'gzip': 6}
+CACHED_LEVEL = {'br': 11, 'gzip': 9}
+
+# sufijo del ETag por codificación, cada representación tiene el suyo
+ETAG_SUFFIX = {'br': '-br', 'gzip': '-gz'}
+
+
+def choose_encoding(accept_encodings):
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_response(response):
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < MIN_SIZE:
+        return response
+    try:
+        response.set_data(compress(data, encoding, DYNAMIC_LEVEL[encoding]))
+    except Exception as e:
+        my_logger.error(f"Error compressing response: {e}")
+        return response
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + ETAG_SUFFIX[encoding], weak)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -1,22 +1,420 @@
 import pymssql
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from flask import g
 from dotenv import load_dotenv
+from logger import my_logger
+from records import decode_rows
+from statements import plan_cache_query, server_side, single_use_query
+from pagination import count_query, keyset_query
 load_dotenv()
 
 local_params = {
     'DB_HOST': os.getenv('DB_HOST'),
     'DB_NAME': os.getenv('DB_NAME'),
     'DB_USER': os.getenv('DB_USER'),
-    'DB_PASSWORD': os.getenv('DB_PASSWORD')
+    'DB_PASSWORD': os.getenv('DB_PASSWORD'),
+    'DB_LOGIN_TIMEOUT': int(os.getenv('DB_LOGIN_TIMEOUT', 5))
 }
 
+pool_params = {
+    'min_size': int(os.getenv('DB_POOL_MIN', 2)),
+    'max_size': int(os.getenv('DB_POOL_MAX', 10)),
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    'validate_after': float(os.getenv('DB_VALIDATE_AFTER', 30)),
+    'ping_interval': float(os.getenv('DB_PING_INTERVAL', 60)),
+    'backoff_base': float(os.getenv('DB_BACKOFF_BASE', 0.1)),
+    'backoff_max': float(os.getenv('DB_BACKOFF_MAX', 5))
+}
+
+# errores de pymssql que pueden venir de una conexión caída
+CONNECTION_ERRORS = (pymssql.OperationalError, pymssql.InterfaceError)
+
 def connect_db(params):
     conn = pymssql.connect(
         server=params['DB_HOST'],
         user=params['DB_USER'],
         password=params['DB_PASSWORD'],
-        database=params['DB_NAME']
+        database=params['DB_NAME'],
+        login_timeout=params.get('DB_LOGIN_TIMEOUT', 60)
     )
     return conn
 
-cnx =  connect_db(local_params)
\ No newline at end of file
+def ping(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+def is_alive(conn):
+    try:
+        ping(conn)
+        return True
+    except Exception:
+        return False
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones thread-safe. Cada request toma su propia conexión,
+    así una query lenta no bloquea a las demás y los cursores no se mezclan.
+
+    Las conexiones que llevan más de `validate_after` segundos sin usarse se
+    validan con un SELECT 1 antes de entregarse, y un hilo revisa las ociosas
+    cada `ping_interval` segundos. Si la BD se cae, se reconecta con backoff
+    exponencial y se registra cuánto tardó en recuperarse.
+    """
+
+    def __init__(self, params, min_size=2, max_size=10, timeout=10,
+                 validate_after=30, ping_interval=60, backoff_base=0.1, backoff_max=5):
+        self.params = params
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self.ping_interval = ping_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # (conexión, último uso)
+        self._idle = deque()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._outage_started = None
+        self._pinger = None
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'created': 0,
+            'closed': 0,
+            'validations': 0,
+            'failed_validations': 0,
+            'connect_failures': 0,
+            'reconnects': 0,
+            'outages': 0,
+            'last_recovery_seconds': None
+        }
+
+    def fill(self):
+        # abrir las conexiones mínimas sin tronar si la BD todavía no responde
+        while True:
+            with self._lock:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._open(retry=False)
+            except Exception:
+                return
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+                self._available.notify()
+
+    def start_pinger(self):
+        if self._pinger is None and self.ping_interval > 0:
+            self._pinger = threading.Thread(target=self._ping_loop, name='db-pool-pinger', daemon=True)
+            self._pinger.start()
+
+    def _ping_loop(self):
+        while True:
+            time.sleep(self.ping_interval)
+            try:
+                self.check_idle()
+            except Exception as e:
+                my_logger.error(f"Error checking idle connections: {e}")
+
+    def check_idle(self):
+        # sacar las ociosas viejas para validarlas sin bloquear el pool
+        now = time.monotonic()
+        with self._lock:
+            stale = [item for item in self._idle if now - item[1] >= self.ping_interval]
+            for item in stale:
+                self._idle.remove(item)
+        for conn, _ in stale:
+            if self.validate(conn):
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+                    self._available.notify()
+            else:
+                self._close(conn)
+        self.fill()
+
+    def validate(self, conn):
+        with self._lock:
+            self._stats['validations'] += 1
+        try:
+            ping(conn)
+            return True
+        except Exception as e:
+            my_logger.warning(f"Dropping dead database connection: {e}")
+            with self._lock:
+                self._stats['failed_validations'] += 1
+                self._mark_outage()
+            return False
+
+    def _mark_outage(self):
+        if self._outage_started is None:
+            self._outage_started = time.monotonic()
+            self._stats['outages'] += 1
+
+    def _open(self, retry=True, deadline=None):
+        # el lugar en _size ya lo apartó quien llama (_checkout o fill)
+        attempt = 0
+        while True:
+            try:
+                conn = connect_db(self.params)
+                break
+            except Exception as e:
+                with self._lock:
+                    self._stats['connect_failures'] += 1
+                    self._mark_outage()
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                attempt += 1
+                if not retry or (deadline is not None and time.monotonic() + delay > deadline):
+                    with self._lock:
+                        self._size -= 1
+                        self._available.notify()
+                    raise
+                my_logger.warning(f"Database connection failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+        with self._lock:
+            self._stats['created'] += 1
+            if self._outage_started is not None:
+                recovery = time.monotonic() - self._outage_started
+                self._outage_started = None
+                self._stats['reconnects'] += 1
+                self._stats['last_recovery_seconds'] = round(recovery, 3)
+                my_logger.info(f"Database connection recovered after {recovery:.2f}s")
+        return conn
+
+    def get(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            conn, last_used = self._checkout(deadline, timeout)
+            if conn is None:
+                return self._open(deadline=deadline)
+            if time.monotonic() - last_used < self.validate_after or self.validate(conn):
+                return conn
+            self._close(conn)
+
+    def _checkout(self, deadline, timeout):
+        waited = False
+        started = time.monotonic()
+        with self._lock:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"No hay conexiones disponibles después de {timeout}s")
+                waited = True
+                self._available.wait(remaining)
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += time.monotonic() - started
+            self._stats['checkouts'] += 1
+            if self._idle:
+                return self._idle.pop()
+            # apartar el lugar antes de soltar el lock para no pasar de max_size
+            self._size += 1
+        return None, None
+
+    def put(self, conn, discard=False):
+        if not discard:
+            try:
+                # no regresar transacciones abiertas al pool
+                conn.rollback()
+            except Exception:
+                discard = True
+        if discard:
+            self._close(conn)
+            return
+        with self._lock:
+            self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._size -= 1
+            self._stats['closed'] += 1
+            self._available.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        # para usar fuera de un request (jobs, scripts)
+        conn = self.get(timeout)
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            self.put(conn, discard=not is_alive(conn))
+            raise
+        except BaseException:
+            self.put(conn)
+            raise
+        else:
+            self.put(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'outage_seconds': None if self._outage_started is None
+                    else round(time.monotonic() - self._outage_started, 3)
+            })
+        return stats
+
+
+pool = ConnectionPool(local_params, **pool_params)
+pool.fill()
+pool.start_pinger()
+
+
+# conexión del request actual, se regresa al pool en el teardown
+def get_db():
+    if 'db' not in g:
+        g.db = pool.get()
+    return g.db
+
+def release_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.put(conn, discard=isinstance(exception, CONNECTION_ERRORS))
+
+# tirar la conexión del request (murió) para que get_db() abra otra
+def discard_db():
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.put(conn, discard=True)
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
+
+def pool_stats():
+    return pool.stats()
+
+# ejecutar una lectura idempotente; si la conexión se cayó se reintenta una vez
+def run_read(fn):
+    cnx = get_db()
+    try:
+        return fn(cnx)
+    except CONNECTION_ERRORS as e:
+        # pymssql también usa OperationalError para errores de SQL
+        if pool.validate(cnx):
+            raise
+        my_logger.warning(f"Connection lost during read ({e}), retrying once")
+        discard_db()
+        return fn(get_db())
+
+# renglones del query como records (ver records.py); los parámetros van por
+# sp_executesql (ver statements.py)
+def fetch_all(cursor, query, params=None):
+    cursor.execute(*server_side(query, params))
+    return decode_rows(query, cursor.description, cursor.fetchall())
+
+def fetch_one(cursor, query, params=None):
+    cursor.execute(*server_side(query, params))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return decode_rows(query, cursor.description, (row,))[0]
+
+def fetch_sets(cursor, queries):
+    """
+    Manda varios SELECT en un solo batch (un viaje a la BD) y lee cada
+    resultado con nextset(). `queries` es una lista de (nombre, query, params);
+    regresa {nombre: [records]} en el mismo orden.
+    """
+    statements = [server_side(query.strip().rstrip(';'), query_params) for _, query, query_params in queries]
+    batch = ';\n'.join(sql for sql, _ in statements)
+    params = tuple(value for _, query_params in statements for value in query_params or ())
+    cursor.execute(batch, params or None)
+    results = {}
+    for name, query, _ in queries:
+        results[name] = decode_rows(query, cursor.description, cursor.fetchall())
+        cursor.nextset()
+    return results
+
+def execute(cursor, query, params=None):
+    """INSERT / UPDATE / DELETE con parámetros del lado del servidor; regresa los renglones afectados."""
+    sql, params = server_side(query, params)
+    if sql is query:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+    # el rowcount de pymssql no es confiable dentro de un EXEC, se pide en el mismo viaje
+    cursor.execute(sql + ';\nSELECT @@ROWCOUNT', params)
+    return cursor.fetchone()[0]
+
+def stream_rows(query, params=None, batch_size=500):
+    """
+    Genera los renglones del query en bloques de records sin traerlos todos:
+    pymssql los va leyendo de la red conforme se piden con fetchmany.
+    Usa la conexión del request, así que el generador debe correr dentro de
+    stream_with_context.
+    """
+    cursor = get_db().cursor()
+    try:
+        cursor.execute(*server_side(query, params))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield decode_rows(query, cursor.description, rows)
+    finally:
+        cursor.close()
+
+def query_all(query, params=None):
+    def read(cnx):
+        cursor = cnx.cursor()
+        try:
+            return fetch_all(cursor, query, params)
+        finally:
+            cursor.close()
+    return run_read(read)
+
+def query_page(query, params, keyset, page):
+    """Una página de `query` (ver pagination.py) y el total si se pidió, en un solo viaje."""
+    queries = [('items', *keyset_query(query, params, keyset, page))]
+    if page.with_count:
+        queries.append(('total', *count_query(query, params)))
+
+    def read(cnx):
+        cursor = cnx.cursor()
+        try:
+            return fetch_sets(cursor, queries)
+        finally:
+            cursor.close()
+    sets = run_read(read)
+    return sets['items'], sets['total'][0].total if page.with_count else None
+
+def plan_stats():
+    """Cuántos planes reusa SQL Server por tipo (Adhoc, Prepared, Proc) para esta BD."""
+    by_type = query_all(plan_cache_query)
+    uses = sum(row.uses for row in by_type)
+    plans = sum(row.plans for row in by_type)
+    return {
+        'by_type': [dict(row.to_dict(), reuse_ratio=round(1 - row.plans / row.uses, 3) if row.uses else 0)
+                    for row in by_type],
+        'reuse_ratio': round(1 - plans / uses, 3) if uses else 0,
+        'single_use_adhoc': query_all(single_use_query),
+    }
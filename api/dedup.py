@@ -0,0 +1,255 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from database import fetch_all
+from ingest import KINDS, insert_statements
+from logger import my_logger
+import rollups
+from trends import trend_stats
+from cohorts import cohort_index
+
+# Al resincronizar con HealthKit la app vuelve a mandar muestras que ya
+# subió. Cada proceso guarda por usuario un filtro de Bloom con los
+# id_muestra que ya tiene la BD:
+#
+#   - si el filtro dice que no está, es nueva y se inserta sin preguntar
+#   - si dice que tal vez, se confirma con un solo SELECT por tabla para
+#     todas las dudosas del request
+#
+# El índice único (USUARIO, ID_MUESTRA) sigue siendo la autoridad; el filtro
+# solo evita mandar a la BD las que ya se sabe que están repetidas.
+
+ERROR_RATE = float(os.getenv('DEDUP_ERROR_RATE', 0.01))
+
+# usuarios con filtro en memoria (los menos usados se sueltan)
+MAX_USERS = int(os.getenv('DEDUP_MAX_USERS', 1000))
+
+MIN_CAPACITY = 1024
+
+# parámetros por SELECT de confirmación (SQL Server acepta hasta 2100)
+PROBE_CHUNK = 2000
+
+_MASK64 = (1 << 64) - 1
+
+
+def _hashes(keys):
+    """Dos hashes de 64 bits por llave; los k índices salen de combinarlos."""
+    h1 = np.empty(len(keys), dtype=np.uint64)
+    h2 = np.empty(len(keys), dtype=np.uint64)
+    for i, key in enumerate(keys):
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=16).digest(), 'little')
+        h1[i] = digest & _MASK64
+        # impar para que los k índices no se repitan
+        h2[i] = (digest >> 64) | 1
+    return h1, h2
+
+
+class BloomFilter:
+    """Filtro de Bloom sobre un arreglo de bits de numpy, para `capacity` llaves con ERROR_RATE falsos positivos."""
+
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        self.capacity = capacity
+        self.bits = max(64, int(-capacity * np.log(error_rate) / np.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * np.log(2)))
+        self.array = np.zeros((self.bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def full(self):
+        return self.count > self.capacity
+
+    def _positions(self, keys):
+        h1, h2 = _hashes(keys)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        # (h1 + i * h2) mod bits; el desbordamiento de uint64 es intencional
+        with np.errstate(over='ignore'):
+            return (h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.bits)
+
+    def add(self, keys):
+        if not len(keys):
+            return
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(self.array, positions >> np.uint64(3),
+                         np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(keys)
+
+    def contains(self, keys):
+        """Arreglo bool: False es seguro que no está, True es que tal vez."""
+        if not len(keys):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        bits = (self.array[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+
+class SampleIndex:
+    """Filtros de Bloom por usuario, con los id_muestra de todas sus tablas de mediciones."""
+
+    def __init__(self, max_users=MAX_USERS):
+        self.max_users = max_users
+        self._filters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, cursor, user_id):
+        query = ' UNION ALL '.join(
+            f"SELECT '{kind.table}' AS TABLA, ID_MUESTRA FROM {kind.table} "
+            f"WHERE USUARIO = %s AND ID_MUESTRA IS NOT NULL"
+            for kind in KINDS.values())
+        rows = fetch_all(cursor, query, (user_id,) * len(KINDS))
+        bloom = BloomFilter(max(MIN_CAPACITY, 2 * len(rows)))
+        bloom.add([f'{row.TABLA}:{row.ID_MUESTRA}' for row in rows])
+        my_logger.info(f"Loaded {len(rows)} sample ids for user_id: {user_id}")
+        return bloom
+
+    def get(self, cursor, user_id):
+        with self._lock:
+            bloom = self._filters.get(user_id)
+            if bloom is not None:
+                self._filters.move_to_end(user_id)
+                return bloom
+        bloom = self._load(cursor, user_id)
+        with self._lock:
+            self._filters[user_id] = bloom
+            while len(self._filters) > self.max_users:
+                self._filters.popitem(last=False)
+        return bloom
+
+    def add(self, user_id, keys):
+        with self._lock:
+            bloom = self._filters.get(user_id)
+            if bloom is None:
+                return
+            bloom.add(keys)
+            if bloom.full():
+                # ya no cumple la tasa de error; se vuelve a cargar más grande cuando se pida
+                del self._filters[user_id]
+
+    def forget(self, user_id):
+        with self._lock:
+            self._filters.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._filters),
+                "samples": sum(len(bloom) for bloom in self._filters.values()),
+                "bytes": sum(bloom.array.nbytes for bloom in self._filters.values()),
+            }
+
+
+samples = SampleIndex()
+
+
+def _keys(batch, positions):
+    return [f'{batch.kind.table}:{sample_id}' for sample_id in batch.ids[positions].tolist()]
+
+
+def _probe(cursor, user_id, table, sample_ids):
+    """Cuáles de `sample_ids` ya están en la tabla."""
+    found = set()
+    for start in range(0, len(sample_ids), PROBE_CHUNK):
+        chunk = sample_ids[start:start + PROBE_CHUNK]
+        rows = fetch_all(cursor,
+                         f"SELECT ID_MUESTRA FROM {table} WHERE USUARIO = %s "
+                         f"AND ID_MUESTRA IS NOT NULL AND ID_MUESTRA IN ({', '.join(['%s'] * len(chunk))})",
+                         (user_id, *chunk))
+        found.update(row.ID_MUESTRA for row in rows)
+    return found
+
+
+def drop_duplicates(cursor, user_id, batches):
+    """
+    Quita de los Batch (ver ingest.validate) las muestras que ya están en la
+    BD o que vienen repetidas en el mismo request. Regresa
+    ({tipo: Batch}, cuántas se descartaron).
+    """
+    duplicates = 0
+    if not any(np.not_equal(batch.ids, None).any() for batch in batches.values()):
+        return batches, duplicates
+
+    bloom = samples.get(cursor, user_id)
+    result = {}
+    for tipo, batch in batches.items():
+        has_id = np.not_equal(batch.ids, None)
+        keep = np.ones(len(batch), dtype=bool)
+
+        # repetidas dentro del request: se queda la primera
+        positions = np.flatnonzero(has_id)
+        _, first = np.unique(batch.ids[positions].astype(str), return_index=True)
+        repeated = np.ones(len(positions), dtype=bool)
+        repeated[first] = False
+        keep[positions[repeated]] = False
+        duplicates += int(repeated.sum())
+
+        candidates = np.flatnonzero(keep & has_id)
+        maybe = candidates[bloom.contains(_keys(batch, candidates))]
+        if len(maybe):
+            found = _probe(cursor, user_id, batch.kind.table, batch.ids[maybe].tolist())
+            seen = np.array([sample_id in found for sample_id in batch.ids[maybe].tolist()], dtype=bool)
+            keep[maybe[seen]] = False
+            duplicates += int(seen.sum())
+            my_logger.debug(f"Probed {len(maybe)} sample ids in {batch.kind.table} for user_id: {user_id}, "
+                            f"{int(seen.sum())} already stored")
+
+        if keep.all():
+            result[tipo] = batch
+        elif keep.any():
+            result[tipo] = batch.select(keep)
+    return result, duplicates
+
+
+def remember(user_id, batches):
+    """Agrega al filtro los id_muestra que se acaban de guardar (después del commit)."""
+    keys = []
+    for batch in batches.values():
+        keys.extend(_keys(batch, np.flatnonzero(np.not_equal(batch.ids, None))))
+    samples.add(user_id, keys)
+
+
+def store(cnx, user_id, valid):
+    """
+    Inserta los Batch de ingest.validate sin las muestras repetidas, y los
+    suma a los resúmenes por hora y día, en una transacción. Regresa
+    ({tipo: insertadas}, duplicadas).
+    """
+    cursor = cnx.cursor()
+    try:
+        batches, duplicates = drop_duplicates(cursor, user_id, valid)
+        inserted = {}
+        # solo los renglones que el INSERT sí guardó, para el filtro y los deltas de cohortes
+        stored = {}
+        for tipo, batch in batches.items():
+            rows = []
+            for sql, params in insert_statements(user_id, batch):
+                rows.extend(fetch_all(cursor, sql, params))
+            inserted[tipo] = len(rows)
+            if len(rows) == len(batch):
+                stored[tipo] = batch
+            elif rows:
+                # el INSERT saltó las que otro worker guardó después del filtro;
+                # las que no traen id_muestra siempre se insertan
+                ids = {row.ID_MUESTRA for row in rows}
+                stored[tipo] = batch.select(np.array([sample_id is None or sample_id in ids
+                                                      for sample_id in batch.ids.tolist()], dtype=bool))
+        rollups.update(cursor, user_id, batches, inserted)
+        cnx.commit()
+    except Exception:
+        cnx.rollback()
+        raise
+    finally:
+        cursor.close()
+    remember(user_id, stored)
+    if any(inserted.values()):
+        trend_stats.invalidate(user_id)
+        try:
+            cohort_index.record(user_id, stored)
+        except OSError as e:
+            # ya se guardaron; los percentiles por cohorte las toman en la reconstrucción de la noche
+            my_logger.warning(f"Could not record cohort deltas for user_id: {user_id} - {str(e)}")
+    # las que otro worker guardó entre el filtro y el INSERT
+    duplicates += sum(len(batch) for batch in batches.values()) - sum(inserted.values())
+    return inserted, duplicates
@@ -0,0 +1,75 @@
+import numpy as np
+
+# Reducción de series de tiempo para las gráficas: de los N puntos de un
+# rango se regresan a lo más `points`, así que el payload no depende de
+# cuántas mediciones haya. `x` son los segundos (int64, ordenados) y `y`
+# los valores (float).
+#
+#   lttb    Largest-Triangle-Three-Buckets: conserva la forma de la curva
+#   minmax  el mínimo y el máximo de cada intervalo de tiempo: conserva los
+#           picos (hipoglucemias, taquicardias) aunque sean de un solo punto
+
+
+def lttb(x, y, points):
+    """Índices de los puntos que quedan con LTTB."""
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n) if points >= n else np.array([0, n - 1])[:points]
+
+    # el primero y el último siempre quedan; el resto se reparte en points - 2 cubetas
+    edges = (np.arange(points - 1) * (n - 2) / (points - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    starts, ends = edges[:-1], edges[1:]
+
+    # promedio de cada cubeta (la tercera esquina del triángulo) con sumas acumuladas
+    xf = x.astype(np.float64)
+    cx = np.concatenate(([0.0], np.cumsum(xf)))
+    cy = np.concatenate(([0.0], np.cumsum(y)))
+    counts = ends - starts
+    avg_x = np.append((cx[ends] - cx[starts]) / counts, xf[-1])
+    avg_y = np.append((cy[ends] - cy[starts]) / counts, y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    # cada cubeta depende del punto elegido en la anterior; dentro de la cubeta es vectorizado
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        bx = xf[start:end]
+        by = y[start:end]
+        # el doble del área del triángulo (a, candidato, promedio de la siguiente)
+        area = np.abs((xf[a] - avg_x[i + 1]) * (by - y[a]) - (xf[a] - bx) * (avg_y[i + 1] - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(x, y, points):
+    """Índices del mínimo y el máximo de cada intervalo de tiempo (points / 2 intervalos)."""
+    n = len(x)
+    if points >= n:
+        return np.arange(n)
+    buckets = max(1, points // 2)
+    span = int(x[-1] - x[0]) + 1
+    bucket = (x - x[0]) * buckets // span
+
+    # x está ordenado, así que cada cubeta es un tramo contiguo
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+    counts = np.diff(np.append(starts, n))
+    return np.unique(np.concatenate((_first_equal(y, np.minimum.reduceat(y, starts), starts, counts),
+                                     _first_equal(y, np.maximum.reduceat(y, starts), starts, counts))))
+
+
+def _first_equal(y, targets, starts, counts):
+    """Por tramo, el índice del primer valor igual a su objetivo (el argmin/argmax de cada cubeta)."""
+    hits = np.flatnonzero(y == np.repeat(targets, counts))
+    # a qué tramo pertenece cada coincidencia; se queda la primera de cada uno
+    owner = np.searchsorted(starts, hits, side='right') - 1
+    first = np.flatnonzero(np.diff(owner, prepend=-1))
+    return hits[first]
+
+
+METHODS = {
+    'lttb': lttb,
+    'minmax': minmax,
+}
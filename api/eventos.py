@@ -1,43 +1,74 @@
-from flask import Blueprint, jsonify, request
-from database import cnx
-from session_manager import validate_key
+import os
+from flask import Blueprint, g, jsonify, request
+from database import execute, fetch_all, fetch_one, get_db, query_all, query_page
+from session_manager import require_session
+from cache import Expiring, VersionedCache, cache_policy
+from pagination import Keyset, ordered_query, page_args, page_rows
+from recommendations import recommender, user_weights
 
 from logger import my_logger  
 
 eventos_bp = Blueprint('eventos', __name__)
 
+query_futuros_eventos = """
+    SELECT E.ID_EVENTO, E.NOMBRE, E.DESCRIPCION, E.NUM_MAX_ASISTENTES, E.PUNTAJE, E.FECHA, E.LUGAR, E.EXPOSITOR,
+           STRING_AGG(T.NOMBRE, ', ') AS TAGS
+    FROM EVENTOS E
+    LEFT JOIN EVENTOS_TAGS ET ON E.ID_EVENTO = ET.ID_EVENTO
+    LEFT JOIN TAGS T ON ET.ID_TAG = T.ID_TAG
+    WHERE E.FECHA >= GETDATE()
+    GROUP BY E.ID_EVENTO, E.NOMBRE, E.DESCRIPCION, E.NUM_MAX_ASISTENTES, E.PUNTAJE, E.FECHA, E.LUGAR, E.EXPOSITOR;
+"""
+
+# segundos (según el reloj de la BD) hasta que el evento más próximo pase
+# y deje de salir en la lista
+query_siguiente_corte = """
+    SELECT DATEDIFF(SECOND, GETDATE(), MIN(FECHA)) AS SEGUNDOS
+    FROM EVENTOS
+    WHERE FECHA >= GETDATE();
+"""
+
+# tope de vida de la lista: los eventos y tags se dan de alta directo en la BD,
+# así que aunque nadie llame invalidar_eventos() aparecen a lo más en este tiempo
+EVENTOS_MAX_TTL = int(os.getenv('EVENTOS_CACHE_TTL', 300))
+
+def cargar_futuros_eventos():
+    eventos = query_all(query_futuros_eventos)
+    corte = query_all(query_siguiente_corte)[0].SEGUNDOS
+    # SEGUNDOS es NULL si no hay eventos futuros
+    return Expiring(eventos, EVENTOS_MAX_TTL if corte is None else min(corte, EVENTOS_MAX_TTL))
+
+# la lista cambia cuando se crea o edita un evento (invalidar_eventos) o cuando
+# un evento pasa su FECHA; con swr ningún request espera al join
+futuros_eventos_cache = VersionedCache('futuros_eventos', cargar_futuros_eventos, swr=True)
+
+def invalidar_eventos():
+    """
+    Hay que llamarla después de crear, editar o borrar EVENTOS o EVENTOS_TAGS.
+    También rehace el modelo de /recomendados, que se arma con cada lista
+    nueva. Los demás workers la ven por la versión compartida.
+    """
+    return futuros_eventos_cache.invalidate()
+eventos_keyset = Keyset('FECHA', 'ID_EVENTO')
+
 @eventos_bp.route('/getFuturosEventos', methods=['GET'])
+@require_session
+@cache_policy('private, no-cache')
 def eventos():
     # Log the request for this endpoint
     my_logger.info(f"({request.remote_addr}) Requested /getFuturosEventos")
+    page = page_args(eventos_keyset)
 
-    query = """
-        SELECT E.ID_EVENTO, E.NOMBRE, E.DESCRIPCION, E.NUM_MAX_ASISTENTES, E.PUNTAJE, E.FECHA, E.LUGAR, E.EXPOSITOR,
-               STRING_AGG(T.NOMBRE, ', ') AS TAGS
-        FROM EVENTOS E
-        LEFT JOIN EVENTOS_TAGS ET ON E.ID_EVENTO = ET.ID_EVENTO
-        LEFT JOIN TAGS T ON ET.ID_TAG = T.ID_TAG
-        WHERE E.FECHA >= GETDATE()
-        GROUP BY E.ID_EVENTO, E.NOMBRE, E.DESCRIPCION, E.NUM_MAX_ASISTENTES, E.PUNTAJE, E.FECHA, E.LUGAR, E.EXPOSITOR;
-    """
-    
     try:
-        cursor = cnx.cursor()
-        cursor.execute(query)
-        
-        columns = [column[0] for column in cursor.description]
-        results = cursor.fetchall()
-        cursor.close()
+        if page is not None:
+            eventos = futuros_eventos_cache.get().data
+            return page.response(page_rows(eventos, eventos_keyset, page), eventos_keyset, total=len(eventos))
+        response = futuros_eventos_cache.response()
 
         # Log success after fetching data
         my_logger.info(f"({request.remote_addr}) Successfully fetched future events.")
         
-        eventos = []
-        for result in results:
-            evento = dict(zip(columns, result))
-            eventos.append(evento)
-        
-        return jsonify(eventos), 200
+        return response
     except Exception as e:
         # Log the error if an exception occurs
         my_logger.error(f"({request.remote_addr}) Error fetching future events: {str(e)}")
@@ -46,22 +77,11 @@ def eventos():
     
 
 @eventos_bp.route('/eventosUsuario/<int:user_id>', methods=['GET'])
+@require_session(match='user_id')
 def eventos_usuario(user_id):
-    session_key = request.headers.get('key')
-
     # Log the request
     my_logger.info(f"({request.remote_addr}) Requested /eventosUsuario/{user_id}")
 
-    if not session_key:
-        my_logger.warning(f"({request.remote_addr}) Missing session key.")
-        return jsonify({"error": "Llave de sesión faltante."}), 400
-
-    valid_user_id = validate_key(session_key)
-
-    if valid_user_id != user_id:
-        my_logger.warning(f"({request.remote_addr}) Invalid session key for user {user_id}.")
-        return jsonify({"error": "Llave de sesión inválida."}), 400
-    
     query = """
         SELECT E.ID_EVENTO, E.NOMBRE, E.DESCRIPCION, E.NUM_MAX_ASISTENTES, E.PUNTAJE, E.FECHA, E.LUGAR, E.EXPOSITOR,
                STRING_AGG(T.NOMBRE, ', ') AS TAGS
@@ -74,20 +94,10 @@ def eventos_usuario(user_id):
     """
     
     try:
-        cursor = cnx.cursor()
-        cursor.execute(query, (user_id,))
-        
-        columns = [column[0] for column in cursor.description]
-        results = cursor.fetchall()
-        cursor.close()
+        eventos = query_all(query, (user_id,))
         
         my_logger.info(f"({request.remote_addr}) Successfully fetched events for user {user_id}.")
         
-        eventos = []
-        for result in results:
-            evento = dict(zip(columns, result))
-            eventos.append(evento)
-        
         return jsonify(eventos), 200
     except Exception as e:
         my_logger.error(f"({request.remote_addr}) Error fetching events for user {user_id}: {str(e)}")
@@ -95,52 +105,88 @@ def eventos_usuario(user_id):
 
     
 
+@eventos_bp.route('/recomendados/<int:user_id>', methods=['GET'])
+@require_session(match='user_id')
+def eventos_recomendados(user_id):
+    """
+    Eventos futuros ordenados por compatibilidad con los tags del usuario
+    (ver recommendations.py); reemplaza el ciclo de predicciones de CoreML
+    por evento de la app.
+
+        /eventos/recomendados/1?limite=10
+    """
+    my_logger.info(f"({request.remote_addr}) Requested /recomendados/{user_id}")
+    limite = request.args.get('limite')
+    if limite is not None:
+        if not limite.isdigit() or int(limite) < 1:
+            return jsonify({"error": "El parámetro limite debe ser un número positivo."}), 400
+        limite = int(limite)
+
+    try:
+        cnx = get_db()
+        model = recommender.model(futuros_eventos_cache.get(), cnx)
+        cursor = cnx.cursor()
+        weights = user_weights(cursor, user_id)
+        cursor.close()
+        ranked = model.rank(weights, limite)
+    except Exception as e:
+        my_logger.error(f"({request.remote_addr}) Error recommending events for user {user_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify([{"evento": evento, "compatibilidad": compatibilidad} for evento, compatibilidad in ranked]), 200
+
+# para cuando el staff edita eventos directo en la BD y no quiere esperar EVENTOS_MAX_TTL
+@eventos_bp.route('/invalidarCache', methods=['POST'])
+@require_session(staff=True)
+def invalidar_cache():
+    version = invalidar_eventos()
+    my_logger.info(f"({request.remote_addr}) Event cache invalidated by staff {g.user_id} (version {version})")
+    return jsonify({"message": "Cache de eventos invalidado."}), 200
+
+usuarios_keyset = Keyset('ID_REGISTRO')
+
 @eventos_bp.route('/usuariosEvento/<int:user_id>/<int:id_evento>', methods=['GET'])
+@require_session(match='user_id')
 def usuarios_evento(user_id, id_evento):
-    session_key = request.headers.get('key')
-
     my_logger.info(f"({request.remote_addr}) Requested /usuariosEvento/{user_id}/{id_evento}")
 
-    if not session_key or validate_key(session_key) != user_id:
-        my_logger.warning(f"({request.remote_addr}) Invalid session key for user {user_id}.")
-        return jsonify({"error": "Llave de sesión inválida."}), 400
-    
+    # en orden de registro; ID_REGISTRO es la llave de la paginación
     query = """
-        SELECT U.NOMBRE, U.A_PATERNO
+        SELECT UE.ID AS ID_REGISTRO, U.NOMBRE, U.A_PATERNO
         FROM USUARIOS_EVENTOS UE
         JOIN USUARIOS U ON UE.USUARIO = U.ID_USUARIO
-        WHERE UE.EVENTO = %d AND U.ID_USUARIO != %d;
+        WHERE UE.EVENTO = %d AND U.ID_USUARIO != %d
     """
+    params = (id_evento, user_id)
+    page = page_args(usuarios_keyset)
     
     try:
-        cursor = cnx.cursor()
-        cursor.execute(query, (id_evento, user_id))
-        
-        columns = [column[0] for column in cursor.description]
-        results = cursor.fetchall()
-        cursor.close()
+        if page is None:
+            usuarios = query_all(ordered_query(query, usuarios_keyset), params)
+            my_logger.info(f"({request.remote_addr}) Successfully fetched users for event {id_evento}.")
+            return jsonify(usuarios), 200
+
+        usuarios, total = query_page(query, params, usuarios_keyset, page)
         
         my_logger.info(f"({request.remote_addr}) Successfully fetched users for event {id_evento}.")
         
-        usuarios = []
-        for result in results:
-            usuario = dict(zip(columns, result))
-            usuarios.append(usuario)
-        
-        return jsonify(usuarios), 200
+        return page.response(usuarios, usuarios_keyset, total=total)
     except Exception as e:
         my_logger.error(f"({request.remote_addr}) Error fetching users for event {id_evento}: {str(e)}")
         return jsonify({"error": str(e)}), 500
     
 
 @eventos_bp.route('/registrarParticipacion', methods=['POST'])
+@require_session
 def registrar_participacion():
-    session_key = request.headers.get('key')
-    
     data = request.json
     user_id = data.get('user_id')
     id_evento = data.get('id_evento')
     my_logger.info(f"({request.remote_addr}) Requested /registrarParticipacion for user {user_id} in event {id_evento}")
+
+    if g.user_id != user_id:
+        my_logger.warning(f"({request.remote_addr}) Session does not belong to user {user_id}.")
+        return jsonify({"error": "Llave de sesión inválida."}), 400
     # Query para registrar la participación en USUARIOS_EVENTOS
     query_participacion = """
 
@@ -155,39 +201,30 @@ def registrar_participacion():
         WHERE ID_EVENTO = %s;
     """
     
-    # Query para actualizar los tags del usuario (incrementar veces usado si ya existe)
+    # Query para actualizar los tags del usuario (incrementar veces usado si ya
+    # existe, si no insertarlo); con el IF es un solo viaje a la BD por tag
     query_update_tag = """
         UPDATE USUARIOS_TAGS
         SET VECES_USADO = VECES_USADO + 1
         WHERE ID_USUARIO = %s AND ID_TAG = %s;
-    """
-    
-    # Query para insertar un nuevo tag en USUARIOS_TAGS si no existe
-    query_insert_tag = """
-        INSERT INTO USUARIOS_TAGS (ID_USUARIO, ID_TAG, VECES_USADO)
-        VALUES (%s, %s, 1);
+        IF @@ROWCOUNT = 0
+            INSERT INTO USUARIOS_TAGS (ID_USUARIO, ID_TAG, VECES_USADO)
+            VALUES (%s, %s, 1);
     """
     
     try:
+        cnx = get_db()
         cursor = cnx.cursor()
         
         # 1. Registrar la participación en el evento
-        cursor.execute(query_participacion, (user_id, id_evento))
+        execute(cursor, query_participacion, (user_id, id_evento))
         
         # 2. Obtener los tags asociados al evento
-        cursor.execute(query_tags_evento, (id_evento,))
-        event_tags = cursor.fetchall()
+        event_tags = fetch_all(cursor, query_tags_evento, (id_evento,))
         
-        # 3. Actualizar los tags del usuario
+        # 3. Actualizar los tags del usuario (o insertarlos si no los tiene)
         for tag in event_tags:
-            id_tag = tag[0]
-            
-            # Intentar actualizar el tag del usuario (si ya lo tiene)
-            rows_affected = cursor.execute(query_update_tag, (user_id, id_tag))
-            
-            # Si no se actualizó ninguna fila, significa que el usuario no tiene ese tag, así que lo insertamos
-            if cursor.rowcount == 0:
-                cursor.execute(query_insert_tag, (user_id, id_tag))
+            execute(cursor, query_update_tag, (user_id, tag.ID_TAG, user_id, tag.ID_TAG))
         
         # Confirmar los cambios en la base de datos
         cnx.commit()
@@ -201,21 +238,48 @@ def registrar_participacion():
 
     
     
+# la llama el helper del staff al escanear el QR del voluntario, por eso
+# se pide una sesión del staff y no que sea del mismo usuario
 @eventos_bp.route('/asistirEvento', methods=['POST'])
-def asistir_evento():    
+@require_session(staff=True)
+def asistir_evento():
     data = request.json
     user_id = data.get('user_id')
     id_evento = data.get('id_evento')
-    
-    # primero validar que usuario este registrado en el evento
+    my_logger.info(f"({request.remote_addr}) Requested /asistirEvento for user {user_id} in event {id_evento} by staff {g.user_id}")
+
+    # condicional para que dos escaneos al mismo tiempo no la registren dos veces
+    query_asistencia = """
+        UPDATE USUARIOS_EVENTOS
+        SET ASISTIO = 1
+        WHERE USUARIO = %d AND EVENTO = %d AND ASISTIO = 0;
+    """
+
     query = """
-        SELECT *
+        SELECT ASISTIO
         FROM USUARIOS_EVENTOS
         WHERE USUARIO = %d AND EVENTO = %d;
     """
-    
+
     try:
+        cnx = get_db()
         cursor = cnx.cursor()
-        cursor.execute(query, (user_id, id_evento))
-        result = cursor.fetchone()
-        cursor.close()
\ No newline at end of file
+        registradas = execute(cursor, query_asistencia, (user_id, id_evento))
+        cnx.commit()
+
+        if registradas == 1:
+            cursor.close()
+            my_logger.info(f"({request.remote_addr}) Attendance registered for user {user_id} in event {id_evento}.")
+            return jsonify({"message": "Asistencia registrada."}), 200
+
+        result = fetch_one(cursor, query, (user_id, id_evento))
+        cursor.close()
+        if result is None:
+            my_logger.warning(f"({request.remote_addr}) User {user_id} is not registered in event {id_evento}.")
+            return jsonify({"error": "El usuario no está registrado en el evento."}), 404
+
+        my_logger.warning(f"({request.remote_addr}) User {user_id} already attended event {id_evento}.")
+        return jsonify({"conflict": "La asistencia ya se había registrado."}), 409
+    except Exception as e:
+        my_logger.error(f"({request.remote_addr}) Error registering attendance for user {user_id} in event {id_evento}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
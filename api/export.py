@@ -0,0 +1,74 @@
+import csv
+import io
+from datetime import date
+from itertools import chain
+from flask import Response, current_app, stream_with_context
+from database import discard_db
+from logger import my_logger
+
+# Exportaciones que se mandan conforme se leen de la BD (chunked), para que
+# la memoria no crezca con el tamaño del historial. `batches` es un
+# generador de listas de records, como database.stream_rows.
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def ndjson_chunks(batches):
+    dumps = current_app.json.dumps
+    for rows in batches:
+        yield ''.join(dumps(row) + '\n' for row in rows)
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(batches):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    header = False
+    for rows in batches:
+        if not rows:
+            continue
+        if not header:
+            writer.writerow(rows[0]._fields)
+            header = True
+        for row in rows:
+            writer.writerow([_csv_value(getattr(row, name)) for name in row._fields])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def _guarded(chunks, name):
+    try:
+        yield from chunks
+    except Exception as e:
+        # ya se mandó el 200; cortar la respuesta a medias es la única señal
+        my_logger.error(f"Error streaming export {name}: {e}")
+        discard_db()
+        raise
+
+
+def export_response(batches, fmt, filename):
+    """
+    Response en streaming. El primer bloque se lee antes de regresar para
+    que un error del query todavía pueda contestarse con un 500 normal.
+    """
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is not None:
+        batches = chain([first], batches)
+    chunks = ndjson_chunks(batches) if fmt == 'ndjson' else csv_chunks(batches)
+    response = Response(stream_with_context(_guarded(chunks, filename)), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,323 @@
+"""
+Importa el export.xml (o export.zip) de Apple Salud a GLUCOSA,
+RITMO_CARDIACO y PRESION_ARTERIAL.
+
+    python health_import.py <usuario> <export.xml|export.zip>
+
+El archivo se lee con iterparse y cada elemento se suelta en cuanto se
+procesa, así que la memoria no crece con el tamaño del export. Las lecturas
+pasan por la misma validación y deduplicación que /mediciones/ingest, en
+bloques de BATCH_SIZE con un commit por bloque. Como cada muestra lleva un
+id_muestra derivado de sus datos, volver a importar el mismo archivo (o
+uno más nuevo que lo incluye) solo agrega lo que falta.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+import zipfile
+from xml.etree.ElementTree import iterparse
+from database import pool
+from dedup import store
+from ingest import validate
+from logger import my_logger
+
+BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 20000))
+
+# uploads y archivos de progreso de los imports en curso
+IMPORT_DIR = os.getenv('IMPORT_DIR', '/tmp/api_imports')
+
+# el progreso de un import se puede consultar hasta un día después
+PROGRESS_TTL = 24 * 3600
+
+# tamaño máximo del upload (el export.zip de varios años pesa unos cientos de MB)
+MAX_UPLOAD_BYTES = int(os.getenv('IMPORT_MAX_BYTES', 512 * 1024 * 1024))
+
+# imports corriendo a la vez en cada worker, en total y por usuario
+MAX_JOBS = int(os.getenv('IMPORT_MAX_JOBS', 2))
+MAX_JOBS_PER_USER = int(os.getenv('IMPORT_MAX_JOBS_PER_USER', 1))
+
+GLUCOSE = 'HKQuantityTypeIdentifierBloodGlucose'
+HEART_RATE = 'HKQuantityTypeIdentifierHeartRate'
+SYSTOLIC = 'HKQuantityTypeIdentifierBloodPressureSystolic'
+DIASTOLIC = 'HKQuantityTypeIdentifierBloodPressureDiastolic'
+BLOOD_PRESSURE = 'HKCorrelationTypeIdentifierBloodPressure'
+
+# mg/dL por mmol/L de glucosa
+MMOL_TO_MG = 18.0156
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class CountingReader:
+    """Envuelve el archivo para saber cuántos bytes lleva leídos iterparse."""
+
+    def __init__(self, f):
+        self.f = f
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.bytes += len(data)
+        return data
+
+
+def open_export(path):
+    """(archivo, tamaño) del export.xml, directo o dentro del export.zip."""
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        names = [name for name in archive.namelist() if name.endswith('export.xml')]
+        if not names:
+            raise ValueError("El zip no trae export.xml")
+        # el export.zip también trae export_cda.xml; se busca el nombre exacto
+        name = min(names, key=len)
+        return archive.open(name), archive.getinfo(name).file_size
+    return open(path, 'rb'), os.path.getsize(path)
+
+
+def _fecha(value):
+    """'2019-01-01 10:00:00 -0600' -> '2019-01-01T10:00:00-06:00' (ISO, lo lee numpy)."""
+    if not value:
+        return None
+    return f'{value[:10]}T{value[11:19]}{value[20:23]}:{value[23:25]}'
+
+
+def _sample_id(*parts):
+    # el export no trae el UUID de HealthKit; uno estable a partir de los datos
+    return hashlib.blake2b('|'.join(part or '' for part in parts).encode(), digest_size=16).hexdigest()
+
+
+def _glucose(attrib):
+    try:
+        value = float(attrib['value'])
+    except (KeyError, ValueError):
+        # la validación la marca como inválida
+        return None
+    if attrib.get('unit', '').startswith('mmol'):
+        value *= MMOL_TO_MG
+    return value
+
+
+def readings(f):
+    """Genera las lecturas del export con el formato de /mediciones/ingest."""
+    events = iterparse(f, events=('start', 'end'))
+    _, root = next(events)
+    # después de la raíz solo hacen falta los 'end': ahí el elemento ya trae sus atributos e hijos
+    events = iterparse_ends(events)
+    for elem in events:
+        tag = elem.tag
+        if tag == 'Record':
+            kind = elem.get('type')
+            if kind == HEART_RATE:
+                start = elem.get('startDate')
+                yield {"tipo": "ritmo_cardiaco", "fecha": _fecha(start), "ritmo": elem.get('value'),
+                       "id_muestra": _sample_id(kind, start, elem.get('sourceName'), elem.get('value'))}
+            elif kind == GLUCOSE:
+                start = elem.get('startDate')
+                yield {"tipo": "glucosa", "fecha": _fecha(start), "glucosa": _glucose(elem.attrib),
+                       "id_muestra": _sample_id(kind, start, elem.get('sourceName'), elem.get('value'))}
+        elif tag == 'Correlation' and elem.get('type') == BLOOD_PRESSURE:
+            # la presión viene como una correlación con la sistólica y la diastólica adentro; las
+            # mismas lecturas también pueden venir sueltas y esas se ignoran para no contarlas doble
+            values = {child.get('type'): child.get('value') for child in elem}
+            systolic, diastolic = values.get(SYSTOLIC), values.get(DIASTOLIC)
+            start = elem.get('startDate')
+            yield {"tipo": "presion_arterial", "fecha": _fecha(start),
+                   "presion_sistolica": systolic, "presion_diastolica": diastolic,
+                   "id_muestra": _sample_id(BLOOD_PRESSURE, start, elem.get('sourceName'), systolic, diastolic)}
+        else:
+            continue
+        # soltar lo que ya se leyó; si se está leyendo una correlación el
+        # parser la sigue armando aunque ya no cuelgue de la raíz
+        root.clear()
+
+
+def iterparse_ends(events):
+    for event, elem in events:
+        if event == 'end':
+            yield elem
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run_import(cnx, user_id, path, progress=None):
+    """
+    Importa el export de `path` para `user_id`. `progress(estado)` se llama
+    después de cada bloque con los totales hasta ese momento.
+    """
+    f, total = open_export(path)
+    reader = CountingReader(f)
+    status = {"estado": "procesando", "bytes": 0, "total": total, "leidas": 0,
+              "insertadas": {}, "duplicadas": 0, "rechazadas": 0}
+    started = time.monotonic()
+    try:
+        for batch in _batches(readings(reader), BATCH_SIZE):
+            valid, rejected = validate(batch)
+            inserted, duplicates = store(cnx, user_id, valid) if valid else ({}, 0)
+            status["bytes"] = reader.bytes
+            status["leidas"] += len(batch)
+            for tipo, n in inserted.items():
+                status["insertadas"][tipo] = status["insertadas"].get(tipo, 0) + n
+            status["duplicadas"] += duplicates
+            status["rechazadas"] += len(rejected)
+            if progress:
+                progress(status)
+    finally:
+        f.close()
+    status["estado"] = "terminado"
+    status["bytes"] = total
+    status["segundos"] = round(time.monotonic() - started, 1)
+    my_logger.info(f"Health import for user_id: {user_id} read {status['leidas']} readings, "
+                   f"inserted {sum(status['insertadas'].values())}, duplicated {status['duplicadas']}, "
+                   f"rejected {status['rechazadas']} in {status['segundos']}s")
+    if progress:
+        progress(status)
+    return status
+
+
+# jobs del endpoint de upload: el progreso va a un archivo para que
+# cualquier worker pueda contestar la consulta
+
+def _progress_path(job_id):
+    return os.path.join(IMPORT_DIR, f'{job_id}.json')
+
+
+def _write_progress(job_id, user_id, status):
+    tmp = _progress_path(job_id) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(dict(status, usuario=user_id), f)
+    os.replace(tmp, _progress_path(job_id))
+
+
+def read_progress(job_id):
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(_progress_path(job_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _clean_progress():
+    # también los .upload que dejó un worker que se reinició a medio import
+    cutoff = time.time() - PROGRESS_TTL
+    for entry in os.scandir(IMPORT_DIR):
+        if entry.name.endswith(('.json', '.upload', '.tmp')) and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                # otro worker lo borró primero
+                pass
+
+
+def save_upload(stream, chunk_size=1024 * 1024, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Guarda el upload en IMPORT_DIR sin tenerlo completo en memoria; regresa
+    (job_id, path). UploadTooLarge si pasa de `max_bytes` (se cuenta al leer,
+    aunque el request no traiga Content-Length).
+    """
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    _clean_progress()
+    job_id = uuid.uuid4().hex
+    path = os.path.join(IMPORT_DIR, f'{job_id}.upload')
+    size = 0
+    with open(path, 'wb') as f:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                break
+            f.write(chunk)
+    if size > max_bytes:
+        os.remove(path)
+        raise UploadTooLarge(f"El archivo pasa de {max_bytes // (1024 * 1024)} MB")
+    return job_id, path
+
+
+_jobs_lock = threading.Lock()
+# {usuario: imports corriendo en este worker}
+_running = {}
+
+
+def reserve_job(user_id):
+    """
+    Aparta un lugar para un import de `user_id` en este worker; regresa None
+    o el motivo por el que no se puede. Quien lo aparta lo libera con
+    release_job (start_job lo hace al terminar el import).
+    """
+    with _jobs_lock:
+        if _running.get(user_id, 0) >= MAX_JOBS_PER_USER:
+            return "Ya tienes un import en curso"
+        if sum(_running.values()) >= MAX_JOBS:
+            return "Hay demasiados imports en curso, intenta más tarde"
+        _running[user_id] = _running.get(user_id, 0) + 1
+    return None
+
+
+def release_job(user_id):
+    with _jobs_lock:
+        _running[user_id] -= 1
+        if not _running[user_id]:
+            del _running[user_id]
+
+
+def _job(job_id, user_id, path):
+    try:
+        with pool.connection() as cnx:
+            run_import(cnx, user_id, path, lambda status: _write_progress(job_id, user_id, status))
+    except Exception as e:
+        my_logger.error(f"Health import {job_id} for user_id: {user_id} failed - {str(e)}")
+        status = read_progress(job_id) or {}
+        status.update(estado="error", error=str(e))
+        _write_progress(job_id, user_id, status)
+    finally:
+        os.remove(path)
+        release_job(user_id)
+
+
+def start_job(job_id, user_id, path):
+    # corre en un hilo del worker (con el lugar de reserve_job ya apartado); si
+    # el worker se reinicia el import se queda a medias, pero volver a subir
+    # el archivo solo agrega lo que faltó
+    _write_progress(job_id, user_id, {"estado": "en cola"})
+    threading.Thread(target=_job, args=(job_id, user_id, path), name=f'import-{job_id}', daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa un export de Apple Salud")
+    parser.add_argument('usuario', type=int)
+    parser.add_argument('archivo')
+    args = parser.parse_args()
+
+    def report(status):
+        percent = 100 * status["bytes"] / status["total"] if status["total"] else 100
+        print(f"\r{percent:5.1f}%  {status['leidas']:,} leídas  "
+              f"{sum(status['insertadas'].values()):,} insertadas  {status['duplicadas']:,} duplicadas  "
+              f"{status['rechazadas']:,} rechazadas", end='', file=sys.stderr)
+
+    with pool.connection() as cnx:
+        status = run_import(cnx, args.usuario, args.archivo, report)
+    print(file=sys.stderr)
+    print(json.dumps(status, indent=2))
+
+
+if __name__ == '__main__':
+    main()
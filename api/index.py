@@ -5,8 +5,14 @@ from eventos import eventos_bp
 from mediciones import mediciones_bp
 from tienda import tienda_bp
 from retos import retos_bp
-from database import cnx
-from session_manager import validate_key, create_session, delete_session, session_storage
+from database import get_db, init_app, plan_stats, pool_stats
+from cache import cache_stats
+from dedup import samples
+from health_import import MAX_UPLOAD_BYTES
+import compression
+import json_provider
+import pagination
+from session_manager import list_sessions, require_session, session_stats
 import secure
 from logger import my_logger  # Import the logger from the logger module
 
@@ -20,12 +26,21 @@ class Response(wsgi.Response):
 wsgi.Response = Response
 
 app = Flask(__name__)
+# el body más grande que se acepta es el export de /mediciones/import
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+init_app(app)
+json_provider.init_app(app)
+compression.init_app(app)
+pagination.init_app(app)
+
+# sin cache=None, secure escribe Cache-Control: no-store encima del de @cache_policy
+secure_headers = secure.Secure(cache=None)
 
 @app.after_request
 def add_header(r):
-    secure_headers = secure.Secure()
     secure_headers.framework.flask(r)
-    r.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    # los endpoints con @cache_policy ya traen su Cache-Control; los demás no se guardan
+    r.headers.setdefault("Cache-Control", "no-cache, no-store, must-revalidate")
     r.headers["Content-Security-Policy"] = "default-src 'none'"
     r.headers["Shakira"] = "rocks!"
     return r
@@ -50,6 +65,7 @@ def get_tables():
     my_logger.info("({}) Se hizo una petición".format(request.remote_addr))
     
     try:
+        cnx = get_db()
         cursor = cnx.cursor()
         cursor.execute("SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_TYPE = 'BASE TABLE'")
         rows = cursor.fetchall()
@@ -64,6 +80,7 @@ def runquery():
     my_logger.info("({}) Se hizo una petición".format(request.remote_addr))
     
     try:
+        cnx = get_db()
         cursor = cnx.cursor()
         cursor.execute("SELECT * FROM USUARIOS")
         rows = cursor.fetchall()
@@ -76,7 +93,42 @@ def runquery():
 @app.route("/getSessions")
 def get_sessions():
     my_logger.info("({}) Requested sessions".format(request.remote_addr))
-    return jsonify(session_storage)
+    return jsonify(list_sessions())
+
+# estadísticas de operación: solo para el staff
+@app.route("/getSessionStats")
+@require_session(staff=True)
+def get_session_stats():
+    my_logger.info("({}) Requested session stats".format(request.remote_addr))
+    return jsonify(session_stats())
+
+@app.route("/getCacheStats")
+@require_session(staff=True)
+def get_cache_stats():
+    my_logger.info("({}) Requested cache stats".format(request.remote_addr))
+    return jsonify(cache_stats())
+
+@app.route("/getPoolStats")
+@require_session(staff=True)
+def get_pool_stats():
+    my_logger.info("({}) Requested pool stats".format(request.remote_addr))
+    return jsonify(pool_stats())
+
+@app.route("/getPlanStats")
+@require_session(staff=True)
+def get_plan_stats():
+    my_logger.info("({}) Requested plan cache stats".format(request.remote_addr))
+    try:
+        return jsonify(plan_stats())
+    except Exception as e:
+        my_logger.error("Error reading plan cache stats: {}".format(e))
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/getDedupStats")
+@require_session(staff=True)
+def get_dedup_stats():
+    my_logger.info("({}) Requested sample dedup stats".format(request.remote_addr))
+    return jsonify(samples.stats())
 
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=8000)
\ No newline at end of file
@@ -0,0 +1,240 @@
+import json
+import os
+import warnings
+from datetime import datetime, timezone
+import numpy as np
+
+# Carga masiva de mediciones (glucosa, ritmo cardiaco, presión arterial).
+# Cada lectura usa los mismos nombres que regresa /medicionesdatos:
+#
+#   {"tipo": "glucosa", "fecha": "2024-10-01T08:30:00", "glucosa": 95}
+#   {"tipo": "ritmo_cardiaco", "fecha": "...", "ritmo": 72}
+#   {"tipo": "presion_arterial", "fecha": "...", "presion_sistolica": 120, "presion_diastolica": 80}
+#
+# Opcionalmente "id_muestra" (el UUID de la muestra en HealthKit): las que ya
+# se subieron antes se saltan en vez de duplicarse (ver dedup.py).
+#
+# La validación se hace por tipo sobre arreglos de numpy y no lectura por
+# lectura; las lecturas inválidas se reportan y las demás se insertan con un
+# INSERT de muchos renglones por bloque.
+
+MAX_READINGS = int(os.getenv('INGEST_MAX_READINGS', 50000))
+
+# SQL Server acepta hasta 2100 parámetros por llamada
+MAX_PARAMS = 2000
+
+# no se aceptan lecturas de antes de esta fecha ni de más de un día en el futuro
+MIN_DATE = np.datetime64('2000-01-01T00:00:00', 's')
+
+# largo de la columna ID_MUESTRA
+MAX_SAMPLE_ID = 64
+
+
+class Kind:
+    """Un tipo de medición: su tabla y {campo del payload: (columna, mínimo, máximo)}."""
+
+    def __init__(self, table, fields):
+        self.table = table
+        self.fields = fields
+        self.columns = tuple(column for column, _, _ in fields.values())
+
+
+KINDS = {
+    'glucosa': Kind('GLUCOSA', {'glucosa': ('NIVEL', 20, 600)}),
+    'ritmo_cardiaco': Kind('RITMO_CARDIACO', {'ritmo': ('RITMO', 20, 250)}),
+    'presion_arterial': Kind('PRESION_ARTERIAL', {
+        'presion_sistolica': ('PRESION_SISTOLICA', 50, 260),
+        'presion_diastolica': ('PRESION_DIASTOLICA', 30, 160),
+    }),
+}
+
+
+class Batch:
+    """Lecturas válidas de un tipo, listas para insertar."""
+
+    def __init__(self, kind, indices, fechas, values, ids):
+        self.kind = kind
+        self.indices = indices
+        # datetime64[s], {columna: int64} y los id_muestra (None si no trae)
+        self.fechas = fechas
+        self.values = values
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.fechas)
+
+    def select(self, mask):
+        """Otro Batch con solo las lecturas de `mask`."""
+        return Batch(self.kind, self.indices[mask], self.fechas[mask],
+                     {column: array[mask] for column, array in self.values.items()}, self.ids[mask])
+
+    def rows(self):
+        """Renglones (fecha, valor, ..., id_muestra) con tipos de Python para pymssql."""
+        fechas = self.fechas.astype(object)
+        columns = [self.values[column].tolist() for column in self.kind.columns]
+        return list(zip(fechas, *columns, self.ids.tolist()))
+
+
+def parse_body(body, content_type=''):
+    """Lecturas del body como arreglo JSON o NDJSON (una por renglón)."""
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        # un solo json.loads sobre el arreglo armado es mucho más rápido que uno por renglón
+        lines = [line for line in body.splitlines() if line.strip()]
+        readings = json.loads(b'[' + b','.join(lines) + b']')
+    else:
+        readings = json.loads(body)
+        if isinstance(readings, dict):
+            readings = readings.get('mediciones', [readings])
+    if not isinstance(readings, list):
+        raise ValueError("Se esperaba un arreglo de mediciones")
+    if len(readings) > MAX_READINGS:
+        raise ValueError(f"Máximo {MAX_READINGS} mediciones por request")
+    return readings
+
+
+def _to_float(values):
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        out = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                out[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return out
+
+
+def _parse_fecha(value):
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _to_datetime(values):
+    try:
+        # numpy pasa a UTC las fechas con zona horaria (igual que _parse_fecha)
+        # pero avisa que la zona no se guarda
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            return np.array(values, dtype='datetime64[s]')
+    except (TypeError, ValueError):
+        # alguna no se pudo leer: una por una, las inválidas quedan en NaT
+        parsed = []
+        for value in values:
+            try:
+                parsed.append(_parse_fecha(value))
+            except (TypeError, ValueError):
+                parsed.append(None)
+        return np.array(parsed, dtype='datetime64[s]')
+
+
+def _to_sample_ids(values):
+    """Arreglo de objetos con los id_muestra; False en los que no son un string válido."""
+    ids = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        if value is None or (isinstance(value, str) and 0 < len(value) <= MAX_SAMPLE_ID):
+            ids[i] = value
+        else:
+            ids[i] = False
+    return ids
+
+
+def _flag(errors, mask, message):
+    """Anota `message` en las lecturas de `mask` que todavía no tienen error."""
+    errors[mask & np.equal(errors, None)] = message
+
+
+def validate(readings, now=None):
+    """
+    Regresa ({tipo: Batch}, [(índice, error)]) con las lecturas válidas
+    agrupadas por tipo y las rechazadas con el motivo.
+    """
+    now = np.datetime64(now or datetime.now(), 's')
+    max_date = now + np.timedelta64(1, 'D')
+    rejected = []
+    groups = {tipo: [] for tipo in KINDS}
+    for i, reading in enumerate(readings):
+        tipo = reading.get('tipo') if isinstance(reading, dict) else None
+        # un tipo que no es string (lista, objeto) ni siquiera se puede buscar en el dict
+        if isinstance(tipo, str) and tipo in groups:
+            groups[tipo].append(i)
+        else:
+            rejected.append((i, "tipo inválido"))
+
+    batches = {}
+    for tipo, indices in groups.items():
+        if not indices:
+            continue
+        kind = KINDS[tipo]
+        indices = np.array(indices)
+        group = [readings[i] for i in indices]
+        fechas = _to_datetime([reading.get('fecha') for reading in group])
+        ok = ~np.isnat(fechas)
+        errors = np.full(len(group), None, dtype=object)
+        _flag(errors, ~ok, "fecha inválida")
+        bad_date = ok & ((fechas < MIN_DATE) | (fechas > max_date))
+        _flag(errors, bad_date, "fecha fuera de rango")
+        ok &= ~bad_date
+
+        ids = _to_sample_ids([reading.get('id_muestra') for reading in group])
+        bad_id = np.equal(ids, False)
+        _flag(errors, bad_id, "id_muestra inválido")
+        ok &= ~bad_id
+
+        values = {}
+        for field, (column, low, high) in kind.fields.items():
+            raw = _to_float([reading.get(field) for reading in group])
+            valid = ~np.isnan(raw)
+            _flag(errors, ~valid, f"{field} inválido")
+            in_range = valid & (raw >= low) & (raw <= high)
+            _flag(errors, valid & ~in_range, f"{field} fuera de rango ({low}-{high})")
+            ok &= in_range
+            values[column] = np.rint(np.where(in_range, raw, 0)).astype(np.int64)
+
+        if tipo == 'presion_arterial':
+            inverted = ok & (values['PRESION_SISTOLICA'] <= values['PRESION_DIASTOLICA'])
+            _flag(errors, inverted, "presion_sistolica debe ser mayor que presion_diastolica")
+            ok &= ~inverted
+
+        for i in np.flatnonzero(~ok):
+            rejected.append((int(indices[i]), errors[i]))
+        if ok.any():
+            batches[tipo] = Batch(kind, indices, fechas, values, ids).select(ok)
+
+    rejected.sort()
+    return batches, rejected
+
+
+def insert_statements(user_id, batch):
+    """
+    (sql, params) de INSERTs de muchos renglones para el Batch. El usuario
+    va una sola vez por statement y las lecturas en un VALUES derivado, así
+    que caben MAX_PARAMS / columnas lecturas por statement.
+
+    Las muestras con id_muestra que ya estén en la tabla no se insertan: el
+    filtro de dedup.py es por proceso y otro worker pudo haberlas subido.
+    El IS NOT NULL es para que SQL Server use el índice filtrado. Cada
+    statement regresa el ID_MUESTRA de los renglones que sí insertó (OUTPUT).
+    """
+    kind = batch.kind
+    per_row = 2 + len(kind.columns)
+    chunk = (MAX_PARAMS - 2) // per_row
+    names = ('FECHA',) + kind.columns + ('ID_MUESTRA',)
+    # un NULL en los parámetros se declara INT; el CAST evita que el VALUES quede como INT
+    row_placeholder = '(' + ', '.join(['%s'] * (per_row - 1) + [f'CAST(%s AS VARCHAR({MAX_SAMPLE_ID}))']) + ')'
+    rows = batch.rows()
+    for start in range(0, len(rows), chunk):
+        block = rows[start:start + chunk]
+        sql = (f"INSERT INTO {kind.table} (USUARIO, {', '.join(names)}) "
+               f"OUTPUT INSERTED.ID_MUESTRA "
+               f"SELECT %s, {', '.join('V.' + name for name in names)} "
+               f"FROM (VALUES {', '.join([row_placeholder] * len(block))}) AS V ({', '.join(names)}) "
+               f"WHERE V.ID_MUESTRA IS NULL OR NOT EXISTS "
+               f"(SELECT 1 FROM {kind.table} T WHERE T.USUARIO = %s AND T.ID_MUESTRA IS NOT NULL AND T.ID_MUESTRA = V.ID_MUESTRA)")
+        params = [user_id]
+        for row in block:
+            params.extend(row)
+        params.append(user_id)
+        yield sql, tuple(params)
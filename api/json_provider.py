@@ -0,0 +1,126 @@
+import base64
+import dataclasses
+import decimal
+import os
+import uuid
+from datetime import date, datetime, time, timezone
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Serializador JSON de la app. Con orjson los renglones de pymssql (Decimal,
+# datetime, bytes) se serializan sin pasar por el encoder de la librería
+# estándar; sin orjson se queda el de Flask.
+#
+# Por default la salida es la misma que ya consume la app de iOS: NUMERIC
+# como string y fechas en formato HTTP ("Tue, 01 Oct 2024 10:00:00 GMT").
+#   JSON_DECIMAL=number  NUMERIC(18,0) como int, DECIMAL con fracción como float
+#   JSON_DATETIME=iso    fechas ISO 8601 ("2024-10-01T10:00:00")
+
+DECIMAL_AS_NUMBER = os.getenv('JSON_DECIMAL', 'str') == 'number'
+DATETIME_AS_ISO = os.getenv('JSON_DATETIME', 'http') == 'iso'
+
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _http_date(value):
+    # lo mismo que werkzeug.http.http_date sin pasar por email.utils
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        hour, minute, second = value.hour, value.minute, value.second
+    else:
+        hour = minute = second = 0
+    return (f"{_DAYS[value.weekday()]}, {value.day:02d} {_MONTHS[value.month - 1]} "
+            f"{value.year:04d} {hour:02d}:{minute:02d}:{second:02d} GMT")
+
+
+def _decimal(value):
+    if not DECIMAL_AS_NUMBER:
+        return str(value)
+    if value == value.to_integral_value():
+        return int(value)
+    return float(value)
+
+
+def _date(value):
+    return value.isoformat() if DATETIME_AS_ISO else _http_date(value)
+
+
+def _bytes(value):
+    return base64.b64encode(value).decode('ascii')
+
+
+# por tipo exacto, para no hacer una cadena de isinstance en cada valor
+_ENCODERS = {
+    decimal.Decimal: _decimal,
+    datetime: _date,
+    date: _date,
+    time: time.isoformat,
+    bytes: _bytes,
+    bytearray: _bytes,
+    memoryview: _bytes,
+    uuid.UUID: str,
+}
+
+
+def _default(value):
+    encoder = _ENCODERS.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+    # records de records.py; con JSON_DECIMAL=number orjson los serializa directo
+    if hasattr(value, 'to_wire'):
+        return value.to_wire() if not DECIMAL_AS_NUMBER else value.to_dict()
+    for cls, encoder in _ENCODERS.items():
+        if isinstance(value, cls):
+            return encoder(value)
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSONProvider de Flask respaldado por orjson; `loads` sigue siendo el de Flask."""
+
+    default = staticmethod(_default)
+
+    def _options(self):
+        option = orjson.OPT_NON_STR_KEYS
+        if not DATETIME_AS_ISO:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        if not DECIMAL_AS_NUMBER:
+            # los records pasan por _record para mandar sus NUMERIC como string
+            option |= orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+
+    def dumpb(self, obj):
+        return orjson.dumps(obj, default=_default, option=self._options())
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumpb(obj).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self._options()
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        body = orjson.dumps(obj, default=_default, option=option)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def init_app(app):
+    if orjson is not None:
+        app.json = ORJSONProvider(app)
+    else:
+        app.json.default = _default
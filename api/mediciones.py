@@ -1,20 +1,28 @@
-from flask import Blueprint, jsonify, request
-from database import cnx
-from session_manager import validate_key
+import os
+from flask import Blueprint, g, jsonify, request
+from database import execute, fetch_sets, get_db
+from session_manager import require_session
+from ingest import parse_body, validate
+from dedup import store
+from health_import import MAX_UPLOAD_BYTES, UploadTooLarge, read_progress, release_job, reserve_job, save_upload, start_job
+from downsample import METHODS
+from series import load_range, range_args
+from trends import trend_args, user_trends
+from cohorts import cohort_args, query as cohort_query
 from logger import my_logger  # Import the logger
 
 mediciones_bp = Blueprint('mediciones', __name__)
 
 @mediciones_bp.route('/borrarMedicion', methods=['DELETE'])
+@require_session
 def borrar_medicion():
     user_id = request.json.get('user_id')
     medicion_id = request.json.get('medicion_id')
-    session_key = request.headers.get('key')
 
     # Log the incoming request
     my_logger.info(f"Request to /borrarMedicion with user_id: {user_id}, medicion_id: {medicion_id}")
 
-    if not session_key or validate_key(session_key) != user_id:
+    if g.user_id != user_id:
         my_logger.warning(f"Invalid session key for user_id: {user_id}")
         return jsonify({"error": "Invalid session key"}), 400
 
@@ -27,12 +35,15 @@ def borrar_medicion():
         WHERE ID = %s AND USUARIO = %s
     """
 
+    # en None para que el finally no tape el error si get_db() no consigue conexión
+    cursor = None
     try:
+        cnx = get_db()
         cursor = cnx.cursor()
-        cursor.execute(delete_query, (medicion_id, user_id))
+        borrados = execute(cursor, delete_query, (medicion_id, user_id))
         cnx.commit()
 
-        if cursor.rowcount > 0:
+        if borrados > 0:
             my_logger.info(f"Medición {medicion_id} deleted for user_id: {user_id}")
             return jsonify({"message": "Medición deleted successfully"}), 200
         else:
@@ -42,31 +53,28 @@ def borrar_medicion():
         my_logger.error(f"Error deleting medición {medicion_id} for user_id: {user_id} - {str(e)}")
         return jsonify({"error": str(e)}), 500
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
 
 @mediciones_bp.route('/medicionesdatos/<int:user_id>', methods=['GET'])
+@require_session(match='user_id')
 def obtener_mediciones(user_id):
-    session_key = request.headers.get('key')
-
-    if not session_key or validate_key(session_key) != user_id:
-        return jsonify({"error": "Invalid session key"}), 400
-    
     glucosa_query = """
-        SELECT TOP 5 G.FECHA, G.NIVEL
+        SELECT TOP 5 G.FECHA AS fecha, G.NIVEL AS glucosa
         FROM GLUCOSA G
         WHERE G.USUARIO = %s
         ORDER BY G.FECHA DESC
     """
 
     ritmo_cardiaco_query = """
-        SELECT TOP 5 RC.FECHA, RC.RITMO
+        SELECT TOP 5 RC.FECHA AS fecha, RC.RITMO AS ritmo
         FROM RITMO_CARDIACO RC
         WHERE RC.USUARIO = %s
         ORDER BY RC.FECHA DESC
     """
 
     presion_arterial_query = """
-        SELECT TOP 5 PA.FECHA, PA.PRESION_SISTOLICA, PA.PRESION_DIASTOLICA
+        SELECT TOP 5 PA.FECHA AS fecha, PA.PRESION_SISTOLICA AS presion_sistolica, PA.PRESION_DIASTOLICA AS presion_diastolica
         FROM PRESION_ARTERIAL PA
         WHERE PA.USUARIO = %s
         ORDER BY PA.FECHA DESC
@@ -74,14 +82,14 @@ def obtener_mediciones(user_id):
 
     userInfo_query = """
         SELECT 
-            U.NOMBRE, 
-            U.A_PATERNO,
-            U.A_MATERNO,
-            DS.EDAD, 
-            DS.TIPO_SANGRE, 
-            DS.GENERO, 
-            DS.PESO, 
-            DS.ALTURA
+            U.NOMBRE AS nombre,
+            U.A_PATERNO AS a_paterno,
+            U.A_MATERNO AS a_materno,
+            DS.EDAD AS edad,
+            DS.TIPO_SANGRE AS tipo_sangre,
+            DS.GENERO AS genero,
+            DS.PESO AS peso,
+            DS.ALTURA AS altura
         FROM 
             USUARIOS U
         JOIN 
@@ -93,57 +101,204 @@ def obtener_mediciones(user_id):
     """
 
     try:
+        cnx = get_db()
         cursor = cnx.cursor()
 
-        cursor.execute(glucosa_query, (user_id,))
-        glucosa_result = cursor.fetchall()
+        # las cuatro consultas van en un solo viaje a la BD
+        sets = fetch_sets(cursor, [
+            ('glucosa', glucosa_query, (user_id,)),
+            ('ritmo_cardiaco', ritmo_cardiaco_query, (user_id,)),
+            ('presion_arterial', presion_arterial_query, (user_id,)),
+            ('usuario_info', userInfo_query, (user_id,)),
+        ])
 
-        cursor.execute(ritmo_cardiaco_query, (user_id,))
-        ritmo_cardiaco_result = cursor.fetchall()
+        cursor.close()
 
-        cursor.execute(presion_arterial_query, (user_id,))
-        presion_arterial_result = cursor.fetchall()
+        # los alias de cada query ya son las llaves que espera la app
+        if all(sets.values()):
+            sets['usuario_info'] = sets['usuario_info'][0]
+            return jsonify({"resultados": sets}), 200
+        else:
+            return jsonify({"error": "No results from this user"}), 404
 
-        cursor.execute(userInfo_query, (user_id,))
-        userInfo_result = cursor.fetchone()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@mediciones_bp.route('/rango/<int:user_id>', methods=['GET'])
+@require_session(match='user_id')
+def rango_mediciones(user_id):
+    """
+    Serie de una métrica entre `from` y `to` para graficar, reducida en el
+    servidor a lo más `points` puntos (`method`=lttb o minmax, ver
+    downsample.py). Los rangos largos salen de los resúmenes por hora o
+    por día y cada punto trae además su min, max y cuenta.
+
+        /mediciones/rango/1?metric=ritmo&from=2024-01-01&to=2025-01-01&points=500
+    """
+    try:
+        metric, desde, hasta, points = range_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    method = request.args.get('method', 'lttb')
+    if method not in METHODS:
+        return jsonify({"error": f"El parámetro method debe ser uno de: {', '.join(METHODS)}."}), 400
 
+    try:
+        cursor = get_db().cursor()
+        series = load_range(cursor, user_id, metric, desde, hasta)
         cursor.close()
+    except Exception as e:
+        my_logger.error(f"Error reading {metric} range for user_id: {user_id} - {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-        if glucosa_result and ritmo_cardiaco_result and presion_arterial_result and userInfo_result:
-            glucosa_data = [
-                {"fecha": row[0], "glucosa": row[1]}
-                for row in glucosa_result
-            ]
-
-            ritmo_cardiaco_data = [
-                {"fecha": row[0], "ritmo": row[1]}
-                for row in ritmo_cardiaco_result
-            ]
-
-            presion_arterial_data = [
-                {"fecha": row[0], "presion_sistolica": row[1], "presion_diastolica": row[2]}
-                for row in presion_arterial_result
-            ]
-
-            userInfo_data = {
-                "nombre": userInfo_result[0],
-                "a_paterno": userInfo_result[1],
-                "a_materno": userInfo_result[2],
-                "edad": userInfo_result[3],
-                "tipo_sangre": userInfo_result[4],
-                "genero": userInfo_result[5],
-                "peso": userInfo_result[6],
-                "altura": userInfo_result[7]
-            }
-
-            return jsonify({"resultados": {
-                "glucosa": glucosa_data,
-                "ritmo_cardiaco": ritmo_cardiaco_data,
-                "presion_arterial": presion_arterial_data,
-                "usuario_info": userInfo_data
-            }}), 200
+    total = len(series)
+    indices = None
+    if total > points:
+        if method == 'minmax' and series.low is not None:
+            # con resúmenes los extremos ya vienen en cada cubeta: basta juntarlas
+            series = series.coarsen(points)
         else:
-            return jsonify({"No results from this user"}), 404
+            indices = METHODS[method](series.x, series.y.astype(float), points)
+    return jsonify({
+        "metric": metric,
+        "from": desde,
+        "to": hasta,
+        "source": series.source,
+        "method": method if total > points else "raw",
+        "total": total,
+        "puntos": series.points(indices),
+    }), 200
+
+
+@mediciones_bp.route('/stats/<int:user_id>', methods=['GET'])
+@require_session(match='user_id')
+def stats_mediciones(user_id):
+    """
+    Tendencias de los últimos `days` días (30 por default) de una métrica o
+    de todas: promedio diario y móvil, percentiles, desviación, pendiente
+    y tiempo en rango de la glucosa (ver trends.py).
+
+        /mediciones/stats/1?metric=glucosa&days=90
+    """
+    try:
+        metrics, days = trend_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        cursor = get_db().cursor()
+        desde, hasta, results = user_trends(cursor, user_id, metrics, days)
+        cursor.close()
+    except Exception as e:
+        my_logger.error(f"Error computing stats for user_id: {user_id} - {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"days": days, "from": desde, "to": hasta, "metricas": results}), 200
+
+@mediciones_bp.route('/cohortes/<metric>', methods=['GET'])
+@require_session
+def cohortes_mediciones(metric):
+    """
+    Percentiles de una métrica (peso, altura, imc o una de las mediciones)
+    por banda de edad, género y tipo de sangre, servidos de los sketches en
+    memoria (ver cohorts.py). Sin `por` regresa toda la población que pase
+    los filtros.
+
+        /mediciones/cohortes/glucosa?genero=F&por=edad&q=10,50,90
+    """
+    try:
+        filters, group_by, percentiles = cohort_args(metric, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
+    try:
+        actualizado, cohortes, ocultas = cohort_query(metric, filters, group_by, percentiles)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        my_logger.error(f"Error reading cohort sketches for metric: {metric} - {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({"metric": metric, "actualizado": actualizado, "cohortes": cohortes, "ocultas": ocultas}), 200
+
+@mediciones_bp.route('/ingest', methods=['POST'])
+@require_session
+def ingest_mediciones():
+    """
+    Carga muchas mediciones del usuario de la sesión en un solo request, como
+    arreglo JSON o NDJSON (ver ingest.py). Las inválidas se reportan, las
+    que ya se habían subido (mismo id_muestra) se saltan y el resto se
+    inserta en una sola transacción, así que reintentar es seguro.
+    """
+    user_id = g.user_id
+    try:
+        readings = parse_body(request.get_data(), request.content_type or '')
+    except ValueError as e:
+        my_logger.warning(f"Invalid ingest body from user_id: {user_id} - {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+    valid, rejected = validate(readings)
+    insertadas = {}
+    duplicadas = 0
+
+    if valid:
+        try:
+            insertadas, duplicadas = store(get_db(), user_id, valid)
+        except Exception as e:
+            my_logger.error(f"Error ingesting mediciones for user_id: {user_id} - {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
+    my_logger.info(f"Ingested {sum(insertadas.values())} mediciones for user_id: {user_id}, "
+                   f"duplicated {duplicadas}, rejected {len(rejected)}")
+    body = {
+        "insertadas": insertadas,
+        "duplicadas": duplicadas,
+        "rechazadas": len(rejected),
+        # solo los primeros, para no regresar un body del tamaño del request
+        "errores": [{"indice": i, "error": error} for i, error in rejected[:100]],
+    }
+    return jsonify(body), 200 if valid or not rejected else 400
+
+
+@mediciones_bp.route('/import', methods=['POST'])
+@require_session
+def import_salud():
+    """
+    Sube el export.xml o export.zip de Apple Salud (en el body o como el
+    campo "archivo" de un form) y lo importa en segundo plano. Regresa el
+    job para consultar el progreso en /mediciones/import/<job_id>.
+    """
+    user_id = g.user_id
+    # antes de leer el body: ni se guarda un upload que no se va a importar
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+        return jsonify({"error": f"El archivo pasa de {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+    busy = reserve_job(user_id)
+    if busy is not None:
+        my_logger.warning(f"Rejected health import for user_id: {user_id} - {busy}")
+        return jsonify({"error": busy}), 429
+
+    try:
+        upload = request.files.get('archivo')
+        job_id, path = save_upload(upload.stream if upload else request.stream)
+    except UploadTooLarge as e:
+        release_job(user_id)
+        return jsonify({"error": str(e)}), 413
+    except Exception:
+        release_job(user_id)
+        raise
+    if os.path.getsize(path) == 0:
+        os.remove(path)
+        release_job(user_id)
+        return jsonify({"error": "No se recibió ningún archivo"}), 400
+
+    start_job(job_id, user_id, path)
+    my_logger.info(f"Started health import {job_id} for user_id: {user_id}")
+    return jsonify({"job_id": job_id}), 202
+
+
+@mediciones_bp.route('/import/<job_id>', methods=['GET'])
+@require_session
+def import_progress(job_id):
+    status = read_progress(job_id)
+    if status is None or status.get("usuario") != g.user_id:
+        return jsonify({"error": "Import not found"}), 404
+    return jsonify(status), 200
@@ -0,0 +1,163 @@
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from flask import jsonify, request
+
+# Paginación por llave (keyset) para los listados. Sin parámetros los
+# endpoints regresan el arreglo completo como siempre; con alguno de
+#   ?limit=50         renglones por página (máximo MAX_LIMIT)
+#   ?next=<token>     el token que regresó la página anterior
+#   ?count=1          agrega el total (solo se calcula si se pide)
+# regresan {"items": [...], "next": token o null[, "total": n]}.
+#
+# El token es opaco para el cliente: guarda los valores de las columnas de
+# orden del último renglón, así que la siguiente página es un seek sobre el
+# índice y no un OFFSET que se vuelve más lento entre más atrás se pida.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+class Keyset:
+    """
+    Orden de un listado. `columns` son los nombres de las columnas del
+    resultado; la última debe ser única (la llave primaria) para desempatar.
+    """
+
+    def __init__(self, *columns, descending=False):
+        self.columns = columns
+        self.descending = descending
+
+    def order_by(self, alias=None):
+        prefix = f'{alias}.' if alias else ''
+        direction = ' DESC' if self.descending else ''
+        return ', '.join(f'{prefix}{column}{direction}' for column in self.columns)
+
+    def predicate(self, alias):
+        """(a > %s) OR (a = %s AND b > %s)... con los parámetros en orden de aparición."""
+        op = '<' if self.descending else '>'
+        terms = []
+        for i, column in enumerate(self.columns):
+            equal = [f'{alias}.{previous} = %s' for previous in self.columns[:i]]
+            terms.append('(' + ' AND '.join(equal + [f'{alias}.{column} {op} %s']) + ')')
+        return '(' + ' OR '.join(terms) + ')'
+
+    def predicate_params(self, values):
+        params = []
+        for i in range(len(self.columns)):
+            params.extend(values[:i + 1])
+        return tuple(params)
+
+    def key(self, row):
+        return tuple(getattr(row, column) for column in self.columns)
+
+
+def encode_token(values):
+    payload = [['d', value.isoformat()] if isinstance(value, datetime) else ['v', value] for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def _decode_value(kind, value):
+    # solo lo que escribe encode_token: fechas ISO o números (las llaves son IDs y FECHA)
+    if kind == 'd' and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if kind == 'v' and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    raise ValueError(f"valor de token inválido: {kind!r}, {value!r}")
+
+
+def decode_token(token, keyset):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        values = tuple(_decode_value(kind, value) for kind, value in payload)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidPage("Token de paginación inválido.")
+    if len(values) != len(keyset.columns):
+        raise InvalidPage("Token de paginación inválido.")
+    return values
+
+
+class Page:
+    """Parámetros de paginación del request actual."""
+
+    def __init__(self, limit, after, with_count):
+        self.limit = limit
+        self.after = after
+        self.with_count = with_count
+
+    def response(self, rows, keyset, total=None):
+        """`rows` trae hasta limit + 1 renglones; el extra solo dice si hay otra página."""
+        items = rows[:self.limit]
+        body = {"items": items, "next": None}
+        if len(rows) > self.limit:
+            body["next"] = encode_token(keyset.key(items[-1]))
+        if self.with_count:
+            body["total"] = total
+        return jsonify(body)
+
+
+def page_args(keyset):
+    """Page con los parámetros del request, o None si no pidió paginación."""
+    args = request.args
+    if 'limit' not in args and 'next' not in args and 'count' not in args:
+        return None
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise InvalidPage("El parámetro limit debe ser un número.")
+    limit = max(1, min(limit, MAX_LIMIT))
+    after = decode_token(args['next'], keyset) if args.get('next') else None
+    return Page(limit, after, args.get('count') in ('1', 'true'))
+
+
+def keyset_query(query, params, keyset, page):
+    """
+    Envuelve `query` (sin ORDER BY) para traer la página que sigue al token;
+    regresa (sql, params). Trae un renglón de más para saber si hay otra página.
+    """
+    where = ''
+    after = ()
+    if page.after is not None:
+        where = f' WHERE {keyset.predicate("Q")}'
+        after = keyset.predicate_params(page.after)
+    sql = (f"SELECT TOP (%s) * FROM ({query.strip().rstrip(';')}) AS Q{where} "
+           f"ORDER BY {keyset.order_by('Q')}")
+    return sql, (page.limit + 1,) + tuple(params) + after
+
+
+def count_query(query, params):
+    return f"SELECT COUNT(*) AS total FROM ({query.strip().rstrip(';')}) AS Q", tuple(params)
+
+
+def ordered_query(query, keyset):
+    """El query completo en el mismo orden que las páginas, para las respuestas sin paginar."""
+    return f"{query.strip().rstrip(';')} ORDER BY {keyset.order_by()}"
+
+
+def page_rows(rows, keyset, page):
+    """La misma paginación sobre una lista que ya está en memoria (los caches)."""
+    ordered = sorted(rows, key=keyset.key, reverse=keyset.descending)
+    start = 0
+    if page.after is not None:
+        keys = [keyset.key(row) for row in ordered]
+        try:
+            if keyset.descending:
+                # bisect necesita orden ascendente: los menores al token van al final
+                keys.reverse()
+                start = len(keys) - bisect_left(keys, page.after)
+            else:
+                start = bisect_right(keys, page.after)
+        except TypeError:
+            # un token bien formado pero de otro listado (número donde va una fecha)
+            raise InvalidPage("Token de paginación inválido.")
+    return ordered[start:start + page.limit + 1]
+
+
+def init_app(app):
+    app.register_error_handler(InvalidPage, lambda e: (jsonify({"error": str(e)}), 400))
@@ -0,0 +1,170 @@
+"""
+Recomendación de eventos por tags, la misma cuenta que hacía la app con el
+modelo de CoreML (modelData.swift) pero de una vez para todos los eventos:
+
+    compatibilidad(evento) = sum(veces_u * S[u, t]) / (sum(veces_u) * tags del evento)
+
+sumando sobre los tags u del usuario (USUARIOS_TAGS) y t del evento
+(EVENTOS_TAGS). S es la similitud entre tags de TAGS_SIMILITUD; se carga
+con los mismos datos con que se entrenó el modelo:
+
+    python recommendations.py tags_similarity.csv
+
+(columnas Tag1, Tag2, Similarity con los nombres de los tags). Los pares
+que no estén valen 1 si es el mismo tag y 0 si no.
+
+Con la lista de eventos futuros se precalcula ES = E @ S / tags por evento
+(E es la matriz 0/1 evento x tag), así que recomendar es un producto de
+matriz por vector con los pesos del usuario.
+"""
+import csv
+import sys
+import threading
+import numpy as np
+from cache import SharedVersion
+from database import execute, fetch_all, fetch_sets, pool
+from ingest import MAX_PARAMS
+from logger import my_logger
+
+query_tags = "SELECT ID_TAG FROM TAGS ORDER BY ID_TAG"
+
+query_similitud = "SELECT ID_TAG_1, ID_TAG_2, SIMILITUD FROM TAGS_SIMILITUD"
+
+query_eventos_tags = """
+    SELECT ET.ID_EVENTO, ET.ID_TAG
+    FROM EVENTOS_TAGS ET
+    JOIN EVENTOS E ON E.ID_EVENTO = ET.ID_EVENTO
+    WHERE E.FECHA >= GETDATE()
+"""
+
+query_tags_usuario = "SELECT ID_TAG, VECES_USADO FROM USUARIOS_TAGS WHERE ID_USUARIO = %s"
+
+
+class TagModel:
+    """Compatibilidad precalculada de una lista de eventos contra cada tag."""
+
+    def __init__(self, eventos, tag_ids, similitud, eventos_tags):
+        self.eventos = eventos
+        self.tag_index = {tag_id: i for i, tag_id in enumerate(tag_ids)}
+        n = len(tag_ids)
+        similarity = np.eye(n)
+        for row in similitud:
+            a, b = self.tag_index.get(row.ID_TAG_1), self.tag_index.get(row.ID_TAG_2)
+            if a is not None and b is not None:
+                similarity[a, b] = similarity[b, a] = row.SIMILITUD
+        event_index = {evento.ID_EVENTO: i for i, evento in enumerate(eventos)}
+        tags = np.zeros((len(eventos), n))
+        for row in eventos_tags:
+            e, t = event_index.get(row.ID_EVENTO), self.tag_index.get(row.ID_TAG)
+            if e is not None and t is not None:
+                tags[e, t] = 1
+        counts = tags.sum(axis=1, keepdims=True)
+        # los eventos sin tags quedan en 0, como el `?? 0.0` de la app
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.scores = np.where(counts > 0, tags @ similarity / counts, 0.0)
+
+    def compatibility(self, weights):
+        """Compatibilidad de cada evento con {id_tag: veces_usado}."""
+        f = np.zeros(len(self.tag_index))
+        for tag_id, veces in weights.items():
+            i = self.tag_index.get(tag_id)
+            if i is not None:
+                f[i] = veces
+        total = f.sum()
+        if total <= 0:
+            return np.zeros(len(self.eventos))
+        return self.scores @ f / total
+
+    def rank(self, weights, limit=None):
+        """[(evento, compatibilidad)] de mayor a menor; los empates quedan en el orden de la lista."""
+        scores = self.compatibility(weights)
+        order = np.argsort(-scores, kind='stable')[:limit]
+        return [(self.eventos[i], round(float(scores[i]), 4)) for i in order]
+
+
+class Recommender:
+    """El TagModel de la lista de eventos vigente; se reconstruye cuando cambia la lista o la similitud."""
+
+    def __init__(self):
+        self.version = SharedVersion('tag_similarity')
+        self._lock = threading.Lock()
+        self._key = None
+        self._entry = None
+        self._model = None
+
+    def model(self, entry, cnx):
+        """`entry` es el CacheEntry de futuros_eventos_cache; se compara por identidad."""
+        key = (id(entry), self.version.get())
+        with self._lock:
+            if self._key != key or self._model is None:
+                cursor = cnx.cursor()
+                try:
+                    sets = fetch_sets(cursor, [
+                        ('tags', query_tags, None),
+                        ('similitud', query_similitud, None),
+                        ('eventos_tags', query_eventos_tags, None),
+                    ])
+                finally:
+                    cursor.close()
+                self._model = TagModel(entry.data, [row.ID_TAG for row in sets['tags']],
+                                       sets['similitud'], sets['eventos_tags'])
+                # se guarda la entrada para que su id no se reuse mientras el modelo viva
+                self._entry = entry
+                self._key = key
+            return self._model
+
+
+recommender = Recommender()
+
+
+def user_weights(cursor, user_id):
+    return {row.ID_TAG: row.VECES_USADO for row in fetch_all(cursor, query_tags_usuario, (user_id,))}
+
+
+def load_similarity(cnx, rows):
+    """Reemplaza TAGS_SIMILITUD con [(tag, tag, similitud)] por nombre; regresa los nombres que no existen."""
+    cursor = cnx.cursor()
+    try:
+        ids = {row.NOMBRE.strip().lower(): row.ID_TAG
+               for row in fetch_all(cursor, "SELECT ID_TAG, NOMBRE FROM TAGS")}
+        pairs = {}
+        missing = set()
+        for tag1, tag2, value in rows:
+            a, b = ids.get(tag1.strip().lower()), ids.get(tag2.strip().lower())
+            if a is None or b is None:
+                missing.update(name for name, tag_id in ((tag1, a), (tag2, b)) if tag_id is None)
+                continue
+            pairs[(min(a, b), max(a, b))] = float(value)
+        execute(cursor, "DELETE FROM TAGS_SIMILITUD")
+        values = [(a, b, value) for (a, b), value in sorted(pairs.items())]
+        chunk = MAX_PARAMS // 3
+        for start in range(0, len(values), chunk):
+            block = values[start:start + chunk]
+            params = [value for row in block for value in row]
+            execute(cursor, f"INSERT INTO TAGS_SIMILITUD (ID_TAG_1, ID_TAG_2, SIMILITUD) "
+                            f"VALUES {', '.join(['(%s, %s, %s)'] * len(block))}", tuple(params))
+        cnx.commit()
+    except Exception:
+        cnx.rollback()
+        raise
+    finally:
+        cursor.close()
+    return len(values), sorted(missing)
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("uso: python recommendations.py tags_similarity.csv", file=sys.stderr)
+        sys.exit(2)
+    with open(sys.argv[1], newline='', encoding='utf-8-sig') as f:
+        rows = [(row['Tag1'], row['Tag2'], row['Similarity']) for row in csv.DictReader(f)]
+    with pool.connection() as cnx:
+        loaded, missing = load_similarity(cnx, rows)
+    recommender.version.bump()
+    my_logger.info(f"Loaded {loaded} tag similarity pairs")
+    if missing:
+        print(f"tags que no existen en TAGS: {', '.join(missing)}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import dataclasses
+import keyword
+import pymssql
+
+# Renglones como records con __slots__ en vez de un dict por renglón. La
+# clase y la función que decodifica se generan una vez por texto de query y
+# se reusan mientras la forma del resultado (cursor.description) no cambie.
+# Las columnas NUMERIC(p, 0) (todos los ids y puntos) llegan como int; las
+# DECIMAL con escala (PESO, ALTURA) se quedan como Decimal.
+
+class Record:
+    __slots__ = ()
+    _fields = ()
+    # columnas NUMERIC; json_provider las manda como string a los clientes viejos
+    _numeric = ()
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self._fields}
+
+    # to_wire() se genera por clase en _make_decoder: dict con las columnas
+    # NUMERIC como string, como las mandaba Flask
+
+
+def _numeric(value):
+    if value is not None and value.as_tuple().exponent == 0:
+        return int(value)
+    return value
+
+
+def _column_scales(description, rows):
+    """Escala de cada columna DECIMAL según el primer valor no nulo (None si no hay)."""
+    scales = {}
+    for i, column in enumerate(description):
+        if column[1] != pymssql.DECIMAL:
+            continue
+        scales[i] = None
+        for row in rows:
+            if row[i] is not None:
+                scales[i] = -row[i].as_tuple().exponent
+                break
+    return scales
+
+
+def _field_names(description):
+    names = []
+    for i, column in enumerate(description):
+        name = column[0]
+        if not name or not name.isidentifier() or keyword.iskeyword(name) or name.startswith('_'):
+            name = f'COL{i}'
+        while name in names:
+            name += '_'
+        names.append(name)
+    return names
+
+
+def _make_decoder(description, rows):
+    names = _field_names(description)
+    scales = _column_scales(description, rows)
+    record = dataclasses.make_dataclass('Record', names, bases=(Record,), slots=True)
+    record._fields = tuple(names)
+    record._numeric = tuple(names[i] for i in scales)
+    args = []
+    for i in range(len(names)):
+        if i not in scales or scales[i]:
+            # no es DECIMAL, o trae decimales (PESO): se deja igual
+            args.append(f'row[{i}]')
+        elif scales[i] == 0:
+            args.append(f'None if row[{i}] is None else int(row[{i}])')
+        else:
+            # sin valores todavía para saber la escala; se checa por valor
+            args.append(f'_numeric(row[{i}])')
+    wire = ', '.join(
+        f"{name!r}: None if self.{name} is None else str(self.{name})" if name in record._numeric
+        else f"{name!r}: self.{name}"
+        for name in names)
+    # igual que namedtuple: se arma el código para no iterar columnas por renglón
+    namespace = {'record': record, '_numeric': _numeric}
+    exec(f"def decode(rows):\n    return [record({', '.join(args)}) for row in rows]\n"
+         f"def to_wire(self):\n    return {{{wire}}}", namespace)
+    record.to_wire = namespace['to_wire']
+    return namespace['decode']
+
+
+_decoders = {}
+
+def decode_rows(query, description, rows):
+    cached = _decoders.get(query)
+    if cached is None or cached[0] != description:
+        cached = (description, _make_decoder(description, rows))
+        _decoders[query] = cached
+    return cached[1](rows)
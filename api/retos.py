@@ -1,6 +1,9 @@
-from flask import Blueprint, jsonify, request
-from database import cnx
-from session_manager import validate_key
+import os
+from flask import Blueprint, g, jsonify, request
+from database import execute, get_db, query_all
+from session_manager import require_session
+from cache import Expiring, VersionedCache, cache_policy
+from pagination import Keyset, page_args, page_rows
 
 from logger import my_logger  
 
@@ -9,57 +12,39 @@ from logger import my_logger
 # Define Blueprint
 retos_bp = Blueprint('retos', __name__)
 
+query_retos = """
+    SELECT ID_RETO, NOMBRE, DESCRIPCION, PUNTAJE, CONTACTO, FECHA_LIMITE 
+    FROM RETOS;
+"""
+
+# el catálogo de retos casi no cambia, pero se edita directo en la BD (la API
+# no tiene endpoints para crearlos), así que además de invalidate() caduca solo
+RETOS_TTL = int(os.getenv('RETOS_CACHE_TTL', 300))
+
+retos_cache = VersionedCache('retos', lambda: Expiring(query_all(query_retos), RETOS_TTL))
+retos_keyset = Keyset('ID_RETO')
+
 @retos_bp.route('/getRetos', methods=['GET'])
+@require_session
+@cache_policy('private, no-cache')
 def get_retos():
-    session_key = request.headers.get('key')
-    my_logger.debug(f"Session Key received: {session_key}")
-
-    # Validate session key
-    if not session_key or validate_key(session_key) is None:
-        my_logger.warning("Invalid session key.")
-        return jsonify({"error": "Llave de sesión inválida."}), 400
-    
-    query = """
-        SELECT ID_RETO, NOMBRE, DESCRIPCION, PUNTAJE, CONTACTO, FECHA_LIMITE 
-        FROM RETOS;
-    """
-    
+    page = page_args(retos_keyset)
     try:
-        my_logger.debug("Executing query to fetch all retos.")
-        cursor = cnx.cursor()
-        cursor.execute(query)
-        
-        columns = [column[0] for column in cursor.description]
-        results = cursor.fetchall()
-        cursor.close()
-        
-        retos = [dict(zip(columns, result)) for result in results]
-        my_logger.debug(f"Fetched {len(retos)} retos.")
+        if page is not None:
+            retos = retos_cache.get().data
+            return page.response(page_rows(retos, retos_keyset, page), retos_keyset, total=len(retos))
+        response = retos_cache.response()
+        my_logger.debug(f"Served retos ({response.status_code}).")
         
-        return jsonify(retos), 200
+        return response
     except Exception as e:
         my_logger.error(f"Error occurred while fetching retos: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 
 @retos_bp.route('/getMyRetos/<int:user_id>', methods=['GET'])
+@require_session(match='user_id')
 def get_my_retos(user_id):
-    session_key = request.headers.get('key')
-    my_logger.debug(f"Session Key received: {session_key}, User ID: {user_id}")
-    
-    # Validate session key
-    if not session_key:
-        my_logger.warning("Missing session key.")
-        return jsonify({"error": "Llave de sesión faltante."}), 400
-
-    # Verify session key is valid
-    valid_user_id = validate_key(session_key)
-    my_logger.debug(f"Validated user ID from session key: {valid_user_id}")
-
-    if valid_user_id != user_id:
-        my_logger.warning("Session key is invalid for the provided user ID.")
-        return jsonify({"error": "Llave de sesión inválida."}), 400
-    
     query = """
         SELECT R.ID_RETO, R.NOMBRE, R.DESCRIPCION, R.PUNTAJE, R.CONTACTO, R.FECHA_LIMITE 
         FROM RETOS R
@@ -69,14 +54,7 @@ def get_my_retos(user_id):
     
     try:
         my_logger.debug("Executing query to fetch user-specific retos.")
-        cursor = cnx.cursor()
-        cursor.execute(query, (user_id,))
-        
-        columns = [column[0] for column in cursor.description]
-        results = cursor.fetchall()
-        cursor.close()
-        
-        retos = [dict(zip(columns, result)) for result in results]
+        retos = query_all(query, (user_id,))
         my_logger.debug(f"Fetched {len(retos)} retos for user ID {user_id}.")
         
         return jsonify(retos), 200
@@ -86,22 +64,8 @@ def get_my_retos(user_id):
 
 
 @retos_bp.route('/registerReto', methods=['POST'])
+@require_session
 def register_reto():
-    session_key = request.headers.get('key')
-    my_logger.debug(f"Session Key received: {session_key}")
-    
-    # Validate session key
-    if not session_key:
-        my_logger.warning("Missing session key.")
-        return jsonify({"error": "Llave de sesión faltante."}), 400
-
-    valid_user_id = validate_key(session_key)
-    
-    # Verify session key is valid
-    if valid_user_id is None:
-        my_logger.warning("Invalid session key.")
-        return jsonify({"error": "Llave de sesión inválida."}), 400
-
     data = request.json
     user_id = data.get('user_id')
     id_reto = data.get('id_reto')
@@ -114,7 +78,7 @@ def register_reto():
         return jsonify({"error": "Faltan datos necesarios (user_id o id_reto)."}), 400
 
     # Check if user_id matches session user_id
-    if valid_user_id != user_id:
+    if g.user_id != user_id:
         my_logger.warning("User ID does not match session.")
         return jsonify({"error": "El ID de usuario no coincide con la sesión."}), 400
     
@@ -125,8 +89,9 @@ def register_reto():
     
     try:
         my_logger.debug(f"Registering user ID {user_id} to reto ID {id_reto}.")
+        cnx = get_db()
         cursor = cnx.cursor()
-        cursor.execute(query, (user_id, id_reto))
+        execute(cursor, query, (user_id, id_reto))
         cnx.commit()
         cursor.close()
         
@@ -0,0 +1,174 @@
+"""
+Resúmenes por hora y por día (mínimo, máximo, suma y cuenta) de las
+mediciones, para que las gráficas de rangos largos no tengan que leer las
+mediciones crudas (ver series.py).
+
+/mediciones/ingest y el importador los actualizan en la misma transacción
+en que insertan. Para llenarlos la primera vez, o si se desfasan:
+
+    python rollups.py [--usuario N] [--desde 2024-01-01]
+
+que los recalcula desde las tablas crudas por usuario, en bloques de
+CHUNK_DAYS días con un commit por bloque.
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+import numpy as np
+from database import execute, fetch_all, fetch_one, pool
+from ingest import KINDS, MAX_PARAMS
+from logger import my_logger
+
+# {nombre: (tabla, segundos por cubeta, expresión de SQL Server que trunca FECHA)}
+LEVELS = {
+    'hora': ('RESUMEN_MEDICIONES_HORA', 3600, 'DATEADD(HOUR, DATEDIFF(HOUR, 0, FECHA), 0)'),
+    'dia': ('RESUMEN_MEDICIONES_DIA', 86400, 'DATEADD(DAY, DATEDIFF(DAY, 0, FECHA), 0)'),
+}
+
+CHUNK_DAYS = 31
+
+
+def _metrics(kind):
+    """[(métrica, columna)] de un tipo; la métrica es el nombre del campo (glucosa, ritmo...)."""
+    return [(field, column) for field, (column, _, _) in kind.fields.items()]
+
+
+def aggregate(fechas, values, seconds):
+    """
+    Agrega una medición por cubetas de `seconds`: regresa (inicios en
+    datetime64[s], mínimos, máximos, sumas, cuentas), un renglón por cubeta.
+    """
+    x = fechas.astype(np.int64)
+    buckets = x - x % seconds
+    order = np.argsort(buckets, kind='stable')
+    buckets = buckets[order]
+    values = values[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    return (buckets[starts].astype('datetime64[s]'),
+            np.minimum.reduceat(values, starts),
+            np.maximum.reduceat(values, starts),
+            np.add.reduceat(values, starts),
+            np.diff(np.append(starts, len(values))))
+
+
+def merge_statements(user_id, metric, table, rows):
+    """
+    (sql, params) de MERGE que suman `rows` [(inicio, min, max, suma, cuenta)]
+    a los resúmenes que ya existen, o los crean.
+    """
+    chunk = (MAX_PARAMS - 4) // 5
+    for start in range(0, len(rows), chunk):
+        block = rows[start:start + chunk]
+        sql = (f"MERGE {table} WITH (HOLDLOCK) AS R "
+               f"USING (VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(block))}) "
+               f"AS V (INICIO, MINIMO, MAXIMO, SUMA, CUENTA) "
+               f"ON R.USUARIO = %s AND R.METRICA = %s AND R.INICIO = V.INICIO "
+               f"WHEN MATCHED THEN UPDATE SET "
+               f"MINIMO = CASE WHEN V.MINIMO < R.MINIMO THEN V.MINIMO ELSE R.MINIMO END, "
+               f"MAXIMO = CASE WHEN V.MAXIMO > R.MAXIMO THEN V.MAXIMO ELSE R.MAXIMO END, "
+               f"SUMA = R.SUMA + V.SUMA, CUENTA = R.CUENTA + V.CUENTA "
+               f"WHEN NOT MATCHED THEN INSERT (USUARIO, METRICA, INICIO, MINIMO, MAXIMO, SUMA, CUENTA) "
+               f"VALUES (%s, %s, V.INICIO, V.MINIMO, V.MAXIMO, V.SUMA, V.CUENTA)")
+        params = []
+        for row in block:
+            params.extend(row)
+        params.extend((user_id, metric, user_id, metric))
+        yield sql, tuple(params)
+
+
+def add_batch(cursor, user_id, batch):
+    """Suma a los resúmenes las lecturas de un Batch recién insertado (ver dedup.store)."""
+    for metric, column in _metrics(batch.kind):
+        for table, seconds, _ in LEVELS.values():
+            starts, mins, maxs, sums, counts = aggregate(batch.fechas, batch.values[column], seconds)
+            rows = list(zip(starts.astype(object), mins.tolist(), maxs.tolist(), sums.tolist(), counts.tolist()))
+            for sql, params in merge_statements(user_id, metric, table, rows):
+                execute(cursor, sql, params)
+
+
+def _day(value):
+    return datetime(value.year, value.month, value.day)
+
+
+def rebuild_range(cursor, user_id, kind, desde, hasta):
+    """
+    Recalcula desde las mediciones crudas los resúmenes de un tipo entre
+    `desde` y `hasta`, extendidos a días completos para que ninguna cubeta
+    quede a medias.
+    """
+    desde = _day(desde)
+    hasta = _day(hasta) + timedelta(days=1)
+    for metric, column in _metrics(kind):
+        for table, _, truncate in LEVELS.values():
+            execute(cursor, f"""
+                DELETE FROM {table} WHERE USUARIO = %s AND METRICA = %s AND INICIO >= %s AND INICIO < %s;
+                INSERT INTO {table} (USUARIO, METRICA, INICIO, MINIMO, MAXIMO, SUMA, CUENTA)
+                SELECT %s, %s, {truncate}, MIN({column}), MAX({column}), SUM(CAST({column} AS BIGINT)), COUNT({column})
+                FROM {kind.table}
+                WHERE USUARIO = %s AND FECHA >= %s AND FECHA < %s AND {column} IS NOT NULL
+                GROUP BY {truncate}
+            """, (user_id, metric, desde, hasta, user_id, metric, user_id, desde, hasta))
+
+
+def update(cursor, user_id, batches, inserted):
+    """
+    Actualiza los resúmenes con lo que se acaba de insertar. Si el INSERT
+    saltó muestras que otro worker guardó mientras tanto no se sabe cuáles
+    fueron, así que ese rango se recalcula desde las mediciones crudas.
+    """
+    for tipo, batch in batches.items():
+        if inserted.get(tipo, 0) == len(batch):
+            add_batch(cursor, user_id, batch)
+        elif inserted.get(tipo):
+            rebuild_range(cursor, user_id, batch.kind,
+                          batch.fechas.min().astype(object), batch.fechas.max().astype(object))
+
+
+def rebuild_user(cnx, user_id, desde=None, progress=None):
+    """Recalcula todos los resúmenes de un usuario en bloques de CHUNK_DAYS, un commit por bloque."""
+    cursor = cnx.cursor()
+    try:
+        for kind in KINDS.values():
+            bounds = fetch_one(cursor, f"SELECT MIN(FECHA) AS desde, MAX(FECHA) AS hasta FROM {kind.table} "
+                                       f"WHERE USUARIO = %s", (user_id,))
+            if bounds is None or bounds.desde is None:
+                continue
+            start = max(bounds.desde, desde) if desde else bounds.desde
+            while start <= bounds.hasta:
+                end = min(start + timedelta(days=CHUNK_DAYS - 1), bounds.hasta)
+                rebuild_range(cursor, user_id, kind, start, end)
+                cnx.commit()
+                if progress:
+                    progress(user_id, kind.table, end)
+                start = _day(end) + timedelta(days=1)
+    except Exception:
+        cnx.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula los resúmenes de mediciones")
+    parser.add_argument('--usuario', type=int)
+    parser.add_argument('--desde', type=datetime.fromisoformat)
+    args = parser.parse_args()
+
+    def report(user_id, table, until):
+        print(f"\rusuario {user_id}  {table:<17} hasta {until:%Y-%m-%d}", end='', file=sys.stderr)
+
+    with pool.connection() as cnx:
+        if args.usuario:
+            users = [args.usuario]
+        else:
+            cursor = cnx.cursor()
+            users = [int(row.ID_USUARIO) for row in fetch_all(cursor, "SELECT ID_USUARIO FROM USUARIOS ORDER BY ID_USUARIO")]
+            cursor.close()
+        for user_id in users:
+            rebuild_user(cnx, user_id, args.desde, report)
+    print(file=sys.stderr)
+    my_logger.info(f"Rebuilt measurement rollups for {len(users)} users")
+
+
+if __name__ == '__main__':
+    main()
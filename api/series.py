@@ -0,0 +1,156 @@
+import os
+from itertools import chain
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from ingest import KINDS
+from rollups import LEVELS
+from statements import server_side
+
+# Series de tiempo de una medición (para las gráficas). La métrica usa los
+# mismos nombres que /medicionesdatos: glucosa, ritmo, presion_sistolica y
+# presion_diastolica.
+#
+# Los rangos largos se leen de los resúmenes por hora o por día (ver
+# rollups.py) y no de las mediciones crudas, así que su costo depende del
+# largo del rango y no de cuántas mediciones haya.
+
+# {métrica: (tabla, columna)}
+METRICS = {field: (kind.table, column)
+           for kind in KINDS.values()
+           for field, (column, _, _) in kind.fields.items()}
+
+DEFAULT_DAYS = 30
+
+DEFAULT_POINTS = 500
+MAX_POINTS = 2000
+MIN_POINTS = 10
+
+# rangos de más de estos días se leen de los resúmenes por hora / por día
+ROLLUP_HOURLY_DAYS = int(os.getenv('ROLLUP_HOURLY_DAYS', 7))
+ROLLUP_DAILY_DAYS = int(os.getenv('ROLLUP_DAILY_DAYS', 180))
+
+EPOCH = np.datetime64('1970-01-01T00:00:00', 's')
+
+
+class Series:
+    """
+    Una serie leída de la BD: `x` en segundos desde 1970 (int64, ordenados)
+    y `y` los valores. Si viene de los resúmenes (`source` hora o dia), `y`
+    es el promedio de cada cubeta y también trae su mínimo, máximo, suma y
+    cuenta.
+    """
+
+    def __init__(self, x, y, source='raw', low=None, high=None, sums=None, counts=None):
+        self.x = x
+        self.y = y
+        self.source = source
+        self.low = low
+        self.high = high
+        self.sums = sums
+        self.counts = counts
+
+    @classmethod
+    def from_buckets(cls, x, low, high, sums, counts, source):
+        average = np.rint(sums / np.maximum(counts, 1)).astype(np.int64)
+        return cls(x, average, source, low, high, sums, counts)
+
+    def __len__(self):
+        return len(self.x)
+
+    def coarsen(self, points):
+        """Junta las cubetas en a lo más `points` intervalos de tiempo, sin perder los extremos."""
+        span = int(self.x[-1] - self.x[0]) + 1
+        bucket = (self.x - self.x[0]) * points // span
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(bucket)) + 1))
+        return Series.from_buckets(self.x[starts],
+                                   np.minimum.reduceat(self.low, starts),
+                                   np.maximum.reduceat(self.high, starts),
+                                   np.add.reduceat(self.sums, starts),
+                                   np.add.reduceat(self.counts, starts),
+                                   self.source)
+
+    def points(self, indices=None):
+        """[{"fecha", "valor"}] de los índices (o de toda la serie), con tipos de Python."""
+        if indices is None:
+            indices = slice(None)
+        fechas = (EPOCH + self.x[indices].astype('timedelta64[s]')).astype(object)
+        values = self.y[indices].tolist()
+        if self.low is None:
+            return [{"fecha": fecha, "valor": valor} for fecha, valor in zip(fechas, values)]
+        return [{"fecha": fecha, "valor": valor, "min": low, "max": high, "cuenta": count}
+                for fecha, valor, low, high, count
+                in zip(fechas, values, self.low[indices].tolist(), self.high[indices].tolist(),
+                       self.counts[indices].tolist())]
+
+
+def _parse_date(value, name):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"El parámetro {name} debe ser una fecha ISO (2024-10-01 o 2024-10-01T08:30:00).")
+    if parsed.tzinfo is not None:
+        # FECHA se guarda en UTC sin zona (ver ingest.py)
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def range_args(args):
+    """(métrica, desde, hasta, points) de los parámetros del request; ValueError si alguno no sirve."""
+    metric = args.get('metric')
+    if metric not in METRICS:
+        raise ValueError(f"El parámetro metric debe ser uno de: {', '.join(METRICS)}.")
+    hasta = _parse_date(args['to'], 'to') if args.get('to') else datetime.now()
+    desde = _parse_date(args['from'], 'from') if args.get('from') else hasta - timedelta(days=DEFAULT_DAYS)
+    if desde >= hasta:
+        raise ValueError("El parámetro from debe ser anterior a to.")
+    try:
+        points = int(args.get('points', DEFAULT_POINTS))
+    except ValueError:
+        raise ValueError("El parámetro points debe ser un número.")
+    return metric, desde, hasta, max(MIN_POINTS, min(points, MAX_POINTS))
+
+
+def load_series(cursor, user_id, metric, desde, hasta):
+    """Las mediciones crudas de la métrica en [desde, hasta), en orden de fecha."""
+    table, column = METRICS[metric]
+    # los segundos se calculan en SQL Server: convertir cientos de miles de datetime en Python es lo lento
+    query = f"""
+        SELECT DATEDIFF_BIG(SECOND, '19700101', FECHA), {column}
+        FROM {table}
+        WHERE USUARIO = %s AND FECHA >= %s AND FECHA < %s AND {column} IS NOT NULL
+        ORDER BY FECHA
+    """
+    data = fetch_array(cursor, query, (user_id, desde, hasta), 2)
+    return Series(data[:, 0], data[:, 1])
+
+
+def load_rollup(cursor, user_id, metric, level, desde, hasta):
+    """Los resúmenes de la métrica en [desde, hasta) del nivel `level` (hora o dia)."""
+    table = LEVELS[level][0]
+    query = f"""
+        SELECT DATEDIFF_BIG(SECOND, '19700101', INICIO), MINIMO, MAXIMO, SUMA, CUENTA
+        FROM {table}
+        WHERE USUARIO = %s AND METRICA = %s AND INICIO >= %s AND INICIO < %s
+        ORDER BY INICIO
+    """
+    data = fetch_array(cursor, query, (user_id, metric, desde, hasta), 5)
+    return Series.from_buckets(data[:, 0], data[:, 1], data[:, 2], data[:, 3], data[:, 4], level)
+
+
+def load_range(cursor, user_id, metric, desde, hasta):
+    """La serie de [desde, hasta): cruda, o de los resúmenes si el rango es largo."""
+    days = (hasta - desde) / timedelta(days=1)
+    if days > ROLLUP_DAILY_DAYS:
+        return load_rollup(cursor, user_id, metric, 'dia', desde, hasta)
+    if days > ROLLUP_HOURLY_DAYS:
+        return load_rollup(cursor, user_id, metric, 'hora', desde, hasta)
+    return load_series(cursor, user_id, metric, desde, hasta)
+
+
+def fetch_array(cursor, query, params, columns):
+    """Los renglones del query como un arreglo int64 de (renglones, columns); todas las columnas deben ser enteras."""
+    cursor.execute(*server_side(query, params))
+    rows = cursor.fetchall()
+    # fromiter sobre los valores aplanados es ~3x más rápido que np.array(rows)
+    values = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * columns)
+    return values.reshape(len(rows), columns)
@@ -0,0 +1,415 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+from session_snapshot import SessionSnapshot
+
+# Backends para guardar las sesiones. Todos exponen la misma interfaz:
+#   set(key, user_id), get(key), delete(key), items(), stats()
+# get() es una búsqueda por llave (dict, PRIMARY KEY o GET de redis).
+# Las sesiones tienen un TTL absoluto (desde el login) y uno deslizante
+# (desde el último uso); vence el que llegue primero.
+
+
+class SessionRecord:
+    __slots__ = ('user_id', 'created', 'expires', 'slot')
+
+    def __init__(self, user_id, created, expires):
+        self.user_id = user_id
+        self.created = created
+        self.expires = expires
+        self.slot = None
+
+
+class TimingWheel:
+    """
+    Rueda de expiración: cada slot es un tick de `tick` segundos. Un registro
+    se agenda en el slot de su expiración; cuando el slot vence se revisa y,
+    si la sesión se extendió mientras tanto (TTL deslizante), se vuelve a
+    agendar. Agendar, quitar y vencer cuestan O(1) amortizado.
+    """
+
+    def __init__(self, tick=1.0, slots=3600, clock=time.time):
+        self.tick = tick
+        self.slots = [dict() for _ in range(slots)]
+        self.current = int(clock() / tick)
+
+    def schedule(self, key, record):
+        # nunca agendar en un tick que ya pasó
+        tick = max(int(record.expires / self.tick), self.current + 1)
+        slot = tick % len(self.slots)
+        self.unschedule(key, record)
+        self.slots[slot][key] = record
+        record.slot = slot
+
+    def unschedule(self, key, record):
+        if record.slot is not None:
+            self.slots[record.slot].pop(key, None)
+            record.slot = None
+
+    def advance(self, now):
+        """Regresa los (key, record) de los slots que vencieron hasta `now`."""
+        target = int(now / self.tick)
+        # si el sweeper estuvo dormido mucho, basta con una vuelta completa
+        start = max(self.current + 1, target - len(self.slots) + 1)
+        due = []
+        for tick in range(start, target + 1):
+            slot = self.slots[tick % len(self.slots)]
+            if slot:
+                due.extend(slot.items())
+                slot.clear()
+        self.current = max(self.current, target)
+        for _, record in due:
+            record.slot = None
+        return due
+
+
+class MemoryBackend:
+    """
+    Sesiones en el proceso. Solo sirve con un worker; cuando se llena
+    se saca la sesión usada hace más tiempo (LRU). Las expiradas las saca
+    un hilo con una TimingWheel, sin recorrer todo el diccionario.
+    `clock` es la hora actual en segundos (las pruebas pasan un reloj propio).
+    """
+
+    def __init__(self, max_sessions=100000, absolute_ttl=7 * 24 * 3600, idle_ttl=24 * 3600, tick=1.0,
+                 clock=time.time):
+        self.max_sessions = max_sessions
+        self.absolute_ttl = absolute_ttl
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._wheel = TimingWheel(tick, clock=clock)
+        self._lock = threading.Lock()
+        self._sweeper = None
+        # llaves modificadas desde el último snapshot (None = sin snapshot)
+        self._changes = None
+        self.counters = {'created': 0, 'deleted': 0, 'expired': 0, 'evicted': 0}
+
+    def start_sweeper(self):
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(self._wheel.tick)
+            self.sweep()
+
+    def sweep(self, now=None):
+        now = self._clock() if now is None else now
+        with self._lock:
+            for key, record in self._wheel.advance(now):
+                if record.expires <= now:
+                    del self._data[key]
+                    self.counters['expired'] += 1
+                else:
+                    self._wheel.schedule(key, record)
+
+    def add(self, key, user_id, created, expires):
+        record = SessionRecord(user_id, created, expires)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._wheel.unschedule(key, old)
+            self._data[key] = record
+            self._wheel.schedule(key, record)
+            self.counters['created'] += 1
+            if self._changes is not None:
+                self._changes[key] = record
+            while len(self._data) > self.max_sessions:
+                old_key, old = self._data.popitem(last=False)
+                self._wheel.unschedule(old_key, old)
+                self.counters['evicted'] += 1
+                if self._changes is not None:
+                    self._changes[old_key] = None
+
+    def set(self, key, user_id):
+        now = self._clock()
+        self.add(key, user_id, now, min(now + self.absolute_ttl, now + self.idle_ttl))
+
+    def get(self, key):
+        now = self._clock()
+        with self._lock:
+            record = self._data.get(key)
+            if record is None:
+                return None
+            if record.expires <= now:
+                del self._data[key]
+                self._wheel.unschedule(key, record)
+                self.counters['expired'] += 1
+                return None
+            # la rueda lo reagenda cuando llegue a su slot viejo
+            record.expires = min(record.created + self.absolute_ttl, now + self.idle_ttl)
+            self._data.move_to_end(key)
+            if self._changes is not None:
+                self._changes[key] = record
+            return record.user_id
+
+    def delete(self, key):
+        with self._lock:
+            record = self._data.pop(key, None)
+            if record is not None:
+                self._wheel.unschedule(key, record)
+                self.counters['deleted'] += 1
+                if self._changes is not None:
+                    self._changes[key] = None
+
+    def items(self):
+        now = self._clock()
+        with self._lock:
+            return [(key, record.user_id) for key, record in self._data.items() if record.expires > now]
+
+    # usados por session_snapshot.py
+    def load(self, entries):
+        with self._lock:
+            for key, user_id, created, expires in entries:
+                record = SessionRecord(user_id, created, expires)
+                self._data[key] = record
+                self._wheel.schedule(key, record)
+
+    def snapshot(self):
+        now = self._clock()
+        with self._lock:
+            return [(key, record.user_id, record.created, record.expires)
+                    for key, record in self._data.items() if record.expires > now]
+
+    def track_changes(self):
+        with self._lock:
+            if self._changes is None:
+                self._changes = {}
+
+    def take_changes(self):
+        with self._lock:
+            changes, self._changes = self._changes, {}
+        return changes
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, live=len(self._data))
+
+
+class SQLiteBackend:
+    """
+    Sesiones en un archivo SQLite compartido por todos los workers del host.
+    Usa WAL para que las lecturas no se bloqueen con las escrituras. Cuando
+    hay más de `max_sessions` se borran las que expiran primero.
+
+    Para no escribir en cada request, el TTL deslizante solo se extiende
+    cuando ya se consumió más de `touch_ratio` del TTL de inactividad.
+    """
+
+    def __init__(self, path, max_sessions=100000, absolute_ttl=7 * 24 * 3600, idle_ttl=24 * 3600,
+                 touch_ratio=0.1):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.absolute_ttl = absolute_ttl
+        self.idle_ttl = idle_ttl
+        self.touch_ratio = touch_ratio
+        self._local = threading.local()
+        self._writes = 0
+        self.counters = {'created': 0, 'deleted': 0, 'expired': 0, 'evicted': 0}
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                key TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                created REAL NOT NULL,
+                expires REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def set(self, key, user_id):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO sessions (key, user_id, created, expires) VALUES (?, ?, ?, ?)",
+                     (key, int(user_id), now, now + min(self.absolute_ttl, self.idle_ttl)))
+        self.counters['created'] += 1
+        self._writes += 1
+        # revisar el límite de vez en cuando, no en cada login
+        if self._writes % 256 == 0:
+            self.evict()
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute("SELECT user_id, created, expires FROM sessions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        user_id, created, expires = row
+        now = time.time()
+        if expires <= now:
+            conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            self.counters['expired'] += 1
+            return None
+        new_expires = min(created + self.absolute_ttl, now + self.idle_ttl)
+        if new_expires - expires > self.idle_ttl * self.touch_ratio:
+            conn.execute("UPDATE sessions SET expires = ? WHERE key = ?", (new_expires, key))
+        return user_id
+
+    def delete(self, key):
+        if self._conn().execute("DELETE FROM sessions WHERE key = ?", (key,)).rowcount:
+            self.counters['deleted'] += 1
+
+    def items(self):
+        rows = self._conn().execute("SELECT key, user_id FROM sessions WHERE expires > ?", (time.time(),))
+        return rows.fetchall()
+
+    def evict(self):
+        conn = self._conn()
+        self.counters['expired'] += conn.execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),)).rowcount
+        total = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        if total > self.max_sessions:
+            self.counters['evicted'] += conn.execute("""
+                DELETE FROM sessions WHERE key IN (
+                    SELECT key FROM sessions ORDER BY expires LIMIT ?
+                )
+            """, (total - self.max_sessions,)).rowcount
+
+    def stats(self):
+        live = self._conn().execute("SELECT COUNT(*) FROM sessions WHERE expires > ?", (time.time(),)).fetchone()[0]
+        return dict(self.counters, live=live)
+
+
+class RedisBackend:
+    """
+    Sesiones en cualquier servidor que hable el protocolo de Redis (RESP),
+    visible para todos los nodos. La expiración la hace el servidor: GETEX
+    extiende el TTL deslizante en el mismo viaje de la lectura y EXPIREAT
+    pone el tope absoluto. El límite de memoria y la política de desalojo
+    se configuran en el servidor (maxmemory + volatile-lru).
+    """
+
+    def __init__(self, url, prefix='session:', absolute_ttl=7 * 24 * 3600, idle_ttl=24 * 3600):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.prefix = prefix
+        self.absolute_ttl = absolute_ttl
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+        self.counters = {'created': 0, 'deleted': 0}
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=5)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', self.db)
+
+    def command(self, *args):
+        if getattr(self._local, 'sock', None) is None:
+            self._connect()
+        try:
+            return self._call(*args)
+        except (OSError, ConnectionError):
+            # reconectar una vez si el servidor cerró el socket
+            self._connect()
+            return self._call(*args)
+
+    def _call(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._local.sock.sendall(b''.join(parts))
+        return self._read()
+
+    def _read(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest
+        if kind == b'-':
+            raise RuntimeError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length == -1:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(rest)
+            if length == -1:
+                return None
+            return [self._read() for _ in range(length)]
+        raise RuntimeError(f"Unexpected Redis reply: {line!r}")
+
+    # el valor es "user_id:creado" para poder aplicar el TTL absoluto
+    def set(self, key, user_id):
+        ttl = max(int(min(self.absolute_ttl, self.idle_ttl)), 1)
+        self.command('SET', self.prefix + key, f"{int(user_id)}:{int(time.time())}", 'EX', ttl)
+        self.counters['created'] += 1
+
+    def get(self, key):
+        value = self.command('GETEX', self.prefix + key, 'EX', max(int(self.idle_ttl), 1))
+        if value is None:
+            return None
+        user_id, created = value.split(b':')
+        deadline = int(created) + int(self.absolute_ttl)
+        if deadline < time.time() + self.idle_ttl:
+            self.command('EXPIREAT', self.prefix + key, deadline)
+        return int(user_id)
+
+    def delete(self, key):
+        self.counters['deleted'] += self.command('DEL', self.prefix + key)
+
+    def items(self):
+        result = []
+        cursor = b'0'
+        while True:
+            cursor, keys = self.command('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 1000)
+            for full_key in keys:
+                value = self.command('GET', full_key)
+                if value is not None:
+                    result.append((full_key.decode()[len(self.prefix):], int(value.split(b':')[0])))
+            if cursor == b'0':
+                return result
+
+    # las expiradas y desalojadas las cuenta el servidor (INFO stats)
+    def stats(self):
+        return dict(self.counters, live=None)
+
+
+def backend_from_env():
+    kind = os.getenv('SESSION_BACKEND', 'memory').lower()
+    max_sessions = int(os.getenv('SESSION_MAX', 100000))
+    ttls = {
+        'absolute_ttl': float(os.getenv('SESSION_TTL', 7 * 24 * 3600)),
+        'idle_ttl': float(os.getenv('SESSION_IDLE_TTL', 24 * 3600))
+    }
+    if kind == 'sqlite':
+        return SQLiteBackend(os.getenv('SESSION_SQLITE_PATH', '/tmp/api_sessions.db'), max_sessions, **ttls)
+    if kind == 'redis':
+        return RedisBackend(os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0'), **ttls)
+    backend = MemoryBackend(max_sessions, **ttls)
+    backend.start_sweeper()
+    snapshot_path = os.getenv('SESSION_SNAPSHOT_PATH')
+    if snapshot_path:
+        snapshot = SessionSnapshot(backend, snapshot_path, float(os.getenv('SESSION_SNAPSHOT_INTERVAL', 30)))
+        snapshot.restore()
+        snapshot.start()
+    return backend
@@ -1,22 +1,82 @@
+import os
 import uuid
+from functools import wraps
+from flask import g, jsonify, request
+from database import fetch_one, get_db
+from session_backends import backend_from_env
+from logger import my_logger
 
-session_storage = {}
+# SESSION_BACKEND=memory|sqlite|redis, SESSION_TTL / SESSION_IDLE_TTL en segundos
+session_store = backend_from_env()
 
 # crear el key para usuarios con el id
 def create_session(user_id):
     session_key = str(uuid.uuid4())
-    session_storage[session_key] = {
-        'user_id': user_id
-    }
+    session_store.set(session_key, int(user_id))
     return session_key
 
 # checar si existe y regresar el id del usuario
 def validate_key(session_key):
-    if session_key in session_storage:
-        return session_storage[session_key]['user_id']
-    return None
+    if not session_key:
+        return None
+    return session_store.get(session_key)
 
 # eliminar en el signout
 def delete_session(session_key):
-    if session_key in session_storage:
-        del session_storage[session_key]
+    session_store.delete(session_key)
+
+# todas las sesiones vivas, con el mismo formato que antes
+def list_sessions():
+    return {key: {'user_id': user_id} for key, user_id in session_store.items()}
+
+def session_stats():
+    return session_store.stats()
+
+
+# usuario de la sesión del request actual; se valida una sola vez por request
+def current_user_id():
+    if 'session_checked' not in g:
+        g.user_id = validate_key(request.headers.get('key'))
+        g.session_checked = True
+    return g.user_id
+
+# ID_TIPO_USUARIO del staff ('Empleado' en insertData.sql)
+STAFF_TIPO_USUARIO = int(os.getenv('STAFF_TIPO_USUARIO', 1))
+
+def is_staff(user_id):
+    cursor = get_db().cursor()
+    try:
+        row = fetch_one(cursor, "SELECT ID_TIPO_USUARIO FROM USUARIOS WHERE ID_USUARIO = %s", (user_id,))
+    finally:
+        cursor.close()
+    return row is not None and row.ID_TIPO_USUARIO == STAFF_TIPO_USUARIO
+
+def require_session(view=None, match=None, staff=False):
+    """
+    Rechaza el request antes de leer el body o tomar una conexión si la
+    llave de sesión no es válida. Con `match` también exige que el usuario
+    de la sesión sea el del parámetro de la URL con ese nombre, y con
+    `staff` que sea del staff (403 si no).
+
+        @require_session
+        @require_session(match='user_id')
+        @require_session(staff=True)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = current_user_id()
+            if user_id is None:
+                my_logger.warning(f"({request.remote_addr}) Invalid or missing session key for {request.path}")
+                return jsonify({"error": "Llave de sesión inválida."}), 400
+            if match is not None and kwargs.get(match) != user_id:
+                my_logger.warning(f"({request.remote_addr}) Session user {user_id} does not match {match}={kwargs.get(match)}")
+                return jsonify({"error": "Llave de sesión inválida."}), 400
+            if staff and not is_staff(user_id):
+                my_logger.warning(f"({request.remote_addr}) User {user_id} is not staff for {request.path}")
+                return jsonify({"error": "Solo el staff puede hacer esta operación."}), 403
+            return view(*args, **kwargs)
+        return wrapper
+    if view is not None:
+        return decorator(view)
+    return decorator
@@ -0,0 +1,200 @@
+import atexit
+import fcntl
+import gc
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from logger import my_logger
+
+# Respaldo en disco de las sesiones del MemoryBackend para que un deploy o
+# el reciclaje de un worker no obligue a todos los clientes a hacer login.
+#
+# El archivo es un log append-only de registros de tamaño fijo:
+#   op (1 = set, 2 = delete), llave (uuid, 16 bytes), user_id, creado, expira
+# Se agregan solo los cambios cada `interval` segundos; cuando el log crece
+# más de `compact_ratio` veces las sesiones vivas se reescribe completo.
+# Al arrancar se lee con mmap y gana el último registro de cada llave.
+# Las escrituras y la compactación toman un flock en `<path>.lock`, así que
+# varios workers pueden compartir el mismo archivo.
+
+MAGIC = b'SESSNAP1'
+RECORD = struct.Struct('<B16sqdd')
+OP_SET = 1
+OP_DELETE = 2
+
+
+def read_records(path):
+    """Regresa los registros (op, llave, user_id, creado, expira) del archivo."""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < len(MAGIC):
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a session snapshot")
+            # ignorar un registro incompleto al final (crash a media escritura)
+            usable = (size - len(MAGIC)) // RECORD.size * RECORD.size
+            view = memoryview(mm)[len(MAGIC):len(MAGIC) + usable]
+            try:
+                return list(RECORD.iter_unpack(view))
+            finally:
+                view.release()
+
+
+# conversiones rápidas entre el uuid en texto y sus 16 bytes
+def key_to_bytes(key):
+    return bytes.fromhex(key.replace('-', ''))
+
+def bytes_to_key(key_bytes):
+    h = key_bytes.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def replay(records, now=None):
+    """Aplica el log y regresa {llave: (user_id, creado, expira)} de las sesiones vivas."""
+    now = time.time() if now is None else now
+    sessions = {}
+    for op, key, user_id, created, expires in records:
+        if op == OP_SET:
+            sessions[key] = (user_id, created, expires)
+        else:
+            sessions.pop(key, None)
+    return {key: value for key, value in sessions.items() if value[2] > now}
+
+
+class SessionSnapshot:
+
+    def __init__(self, backend, path, interval=30, compact_ratio=2.0):
+        self.backend = backend
+        self.path = path
+        self.interval = interval
+        self.compact_ratio = compact_ratio
+        self._io_lock = threading.Lock()
+        self._lock_path = path + '.lock'
+        self._log_records = 0
+        self._thread = None
+
+    def restore(self):
+        if not os.path.exists(self.path):
+            self.backend.track_changes()
+            return 0
+        started = time.perf_counter()
+        # son millones de objetos que viven mucho; el GC solo estorba aquí
+        gc.disable()
+        try:
+            try:
+                records = read_records(self.path)
+                sessions = replay(records)
+            except Exception as e:
+                my_logger.error(f"Could not restore sessions from {self.path}: {e}")
+                records, sessions = [], {}
+            self.backend.load(
+                (bytes_to_key(key), user_id, created, expires)
+                for key, (user_id, created, expires) in sessions.items()
+            )
+        finally:
+            gc.enable()
+        self.backend.track_changes()
+        self._log_records = len(records)
+        if not records or self._log_records > self.compact_ratio * max(len(sessions), 1024):
+            self.compact()
+        my_logger.info(f"Restored {len(sessions)} sessions in {time.perf_counter() - started:.2f}s")
+        return len(sessions)
+
+    def flush(self):
+        changes = self.backend.take_changes()
+        if not changes:
+            return
+        buf = bytearray()
+        for key, record in changes.items():
+            try:
+                key_bytes = key_to_bytes(key)
+            except ValueError:
+                continue
+            if record is None:
+                buf += RECORD.pack(OP_DELETE, key_bytes, 0, 0.0, 0.0)
+            else:
+                buf += RECORD.pack(OP_SET, key_bytes, record.user_id, record.created, record.expires)
+        with self._locked():
+            new_file = not os.path.exists(self.path)
+            with open(self.path, 'ab') as f:
+                if new_file:
+                    f.write(MAGIC)
+                f.write(buf)
+                f.flush()
+                os.fsync(f.fileno())
+            self._log_records += len(changes)
+        live = self.backend.stats()['live']
+        if self._log_records > self.compact_ratio * max(live, 1024):
+            self.compact()
+
+    @contextmanager
+    def _locked(self):
+        """_io_lock entre los hilos del worker y flock entre los workers que comparten el archivo."""
+        with self._io_lock:
+            with open(self._lock_path, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def compact(self):
+        # con el lock tomado nadie agrega registros entre leer el estado y
+        # reemplazar el archivo. Se parte del log (ahí está lo que guardó otro
+        # worker, p. ej. el viejo en un deploy) y encima van las sesiones de
+        # este backend; los cambios que llegan después se quedan en el
+        # backend para el siguiente flush.
+        with self._locked():
+            try:
+                records = read_records(self.path) if os.path.exists(self.path) else []
+            except ValueError as e:
+                my_logger.error(f"Discarding unreadable session snapshot: {e}")
+                records = []
+            sessions = replay(records)
+            for key, user_id, created, expires in self.backend.snapshot():
+                try:
+                    sessions[key_to_bytes(key)] = (user_id, created, expires)
+                except ValueError:
+                    continue
+            directory, name = os.path.split(self.path)
+            # nombre único: un .tmp fijo lo pisaría otro proceso a media escritura
+            fd, tmp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory or '.')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(MAGIC)
+                    buf = bytearray()
+                    for key, (user_id, created, expires) in sessions.items():
+                        buf += RECORD.pack(OP_SET, key, user_id, created, expires)
+                        if len(buf) >= 1 << 20:
+                            f.write(buf)
+                            buf.clear()
+                    f.write(buf)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+                raise
+            self._log_records = len(sessions)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='session-snapshot', daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                my_logger.error(f"Error writing session snapshot: {e}")
@@ -0,0 +1,103 @@
+import decimal
+import os
+import re
+from datetime import date, datetime, time
+
+# pymssql interpola los parámetros en el texto del query, así que SQL Server
+# ve un query distinto por cada user_id y compila un plan ad hoc para cada
+# uno. Aquí los queries con %s / %d se reescriben a
+#
+#   EXEC sp_executesql N'... WHERE USUARIO = @p0', N'@p0 INT', 5
+#
+# para que el texto del statement sea siempre el mismo y se reuse su plan.
+# Los tipos de los parámetros coinciden con los de las columnas (VARCHAR y
+# no NVARCHAR, DATETIME y no DATETIME2) para que SQL Server no tenga que
+# convertir la columna y pueda usar los índices.
+# DB_SERVER_PARAMS=0 regresa a la interpolación de pymssql.
+
+SERVER_PARAMS = os.getenv('DB_SERVER_PARAMS', '1') != '0'
+
+_PLACEHOLDER = re.compile(r'%%|%[sd]')
+
+_statements = {}
+
+
+def _prepare(query):
+    """(texto con @p0, @p1... ya escapado para N'...', número de parámetros), por texto del query."""
+    cached = _statements.get(query)
+    if cached is None:
+        count = 0
+
+        def name(match):
+            nonlocal count
+            if match.group() == '%%':
+                return '%%'
+            count += 1
+            return f'@p{count - 1}'
+
+        text = _PLACEHOLDER.sub(name, query.strip().rstrip(';'))
+        cached = (text.replace("'", "''"), count)
+        _statements[query] = cached
+    return cached
+
+
+def sql_type(value):
+    if value is None:
+        return 'INT'
+    if isinstance(value, bool):
+        return 'BIT'
+    if isinstance(value, int):
+        return 'INT' if -2 ** 31 <= value < 2 ** 31 else 'BIGINT'
+    if isinstance(value, float):
+        return 'FLOAT'
+    if isinstance(value, decimal.Decimal):
+        return f'DECIMAL(38, {max(0, -value.as_tuple().exponent)})'
+    if isinstance(value, str):
+        return 'VARCHAR(8000)' if len(value) <= 8000 else 'VARCHAR(MAX)'
+    if isinstance(value, (bytes, bytearray)):
+        return 'VARBINARY(8000)' if len(value) <= 8000 else 'VARBINARY(MAX)'
+    if isinstance(value, datetime):
+        return 'DATETIME'
+    if isinstance(value, date):
+        return 'DATE'
+    if isinstance(value, time):
+        return 'TIME'
+    return 'NVARCHAR(4000)'
+
+
+def server_side(query, params):
+    """Regresa (sql, params) listos para cursor.execute."""
+    if not SERVER_PARAMS or not params or not isinstance(params, (tuple, list)):
+        return query, params
+    text, count = _prepare(query)
+    if count != len(params):
+        raise ValueError(f"Query expects {count} parameters, got {len(params)}")
+    declarations = ', '.join(f'@p{i} {sql_type(value)}' for i, value in enumerate(params))
+    placeholders = ', '.join(['%s'] * count)
+    return f"EXEC sp_executesql N'{text}', N'{declarations}', {placeholders}", tuple(params)
+
+
+# reuso de planes de esta BD según el caché de planes de SQL Server (pide
+# VIEW SERVER STATE); objtype Prepared son los de sp_executesql
+plan_cache_query = """
+    SELECT CP.OBJTYPE AS objtype,
+           COUNT(*) AS plans,
+           SUM(CAST(CP.USECOUNTS AS BIGINT)) AS uses,
+           SUM(CASE WHEN CP.USECOUNTS = 1 THEN 1 ELSE 0 END) AS single_use,
+           SUM(CAST(CP.SIZE_IN_BYTES AS BIGINT)) / 1024 AS size_kb
+    FROM sys.dm_exec_cached_plans CP
+    CROSS APPLY sys.dm_exec_plan_attributes(CP.PLAN_HANDLE) PA
+    WHERE PA.ATTRIBUTE = 'dbid' AND CAST(PA.VALUE AS INT) = DB_ID()
+    GROUP BY CP.OBJTYPE
+"""
+
+# los ad hoc de un solo uso que más memoria ocupan: los que faltan parametrizar
+single_use_query = """
+    SELECT TOP 10 LEFT(ST.TEXT, 200) AS text, CP.SIZE_IN_BYTES / 1024 AS size_kb
+    FROM sys.dm_exec_cached_plans CP
+    CROSS APPLY sys.dm_exec_sql_text(CP.PLAN_HANDLE) ST
+    CROSS APPLY sys.dm_exec_plan_attributes(CP.PLAN_HANDLE) PA
+    WHERE CP.OBJTYPE = 'Adhoc' AND CP.USECOUNTS = 1
+      AND PA.ATTRIBUTE = 'dbid' AND CAST(PA.VALUE AS INT) = DB_ID()
+    ORDER BY CP.SIZE_IN_BYTES DESC
+"""
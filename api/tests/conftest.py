@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+
+# sin BD ni hilos del pool: las pruebas no abren conexiones al importar database
+os.environ.setdefault('DB_POOL_MIN', '0')
+os.environ.setdefault('DB_PING_INTERVAL', '0')
+os.environ.setdefault('DB_LOGIN_TIMEOUT', '1')
+os.environ.setdefault('CACHE_DIR', tempfile.mkdtemp(prefix='api_cache_'))
+os.environ.setdefault('IMPORT_DIR', tempfile.mkdtemp(prefix='api_imports_'))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pytest
+
+
+class FakeCursor:
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Conexión del request; los módulos que se prueban parchan execute/fetch_*."""
+
+    def __init__(self):
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def cnx(monkeypatch):
+    import database
+    conn = FakeConnection()
+    monkeypatch.setattr(database.pool, 'get', lambda timeout=None: conn)
+    monkeypatch.setattr(database.pool, 'put', lambda conn, discard=False: None)
+    return conn
+
+
+@pytest.fixture
+def client(cnx):
+    import index
+    index.app.config['TESTING'] = True
+    return index.app.test_client()
+
+
+@pytest.fixture
+def login():
+    """Regresa los headers con una llave de sesión nueva del usuario."""
+    import session_manager
+    keys = []
+
+    def login(user_id):
+        key = session_manager.create_session(user_id)
+        keys.append(key)
+        return {'key': key}
+
+    yield login
+    for key in keys:
+        session_manager.delete_session(key)
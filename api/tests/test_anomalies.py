@@ -0,0 +1,71 @@
+import numpy as np
+
+import anomalies
+from anomalies import detect, detect_chunk
+from ingest import KINDS
+
+
+def steady(n, value, start=0):
+    x = start + np.arange(n, dtype=np.int64) * 3600
+    y = value + np.tile([-2, 0, 2, 1, -1], n // 5 + 1)[:n]
+    return x, y.astype(np.int64)
+
+
+def flagged(result):
+    indices, rules, _ = result
+    return list(zip(indices.tolist(), rules.tolist()))
+
+
+def test_range_rules():
+    x, y = steady(10, 100)
+    y[3] = 40
+    y[7] = 300
+    users = np.zeros(10, dtype=np.int64)
+    result = flagged(detect(users, x, y, 'glucosa', 0))
+    # una medición puede salir con varias reglas; vienen ordenadas por índice
+    assert {(3, 'hipoglucemia'), (7, 'hiperglucemia')} <= set(result)
+    assert {index for index, _ in result} == {3, 7}
+    assert [index for index, _ in result] == sorted(index for index, _ in result)
+
+
+def test_spike_needs_history_of_the_same_user():
+    x1, y1 = steady(30, 100)
+    x2, y2 = steady(3, 160)
+    users = np.array([1] * 30 + [2] * 3, dtype=np.int64)
+    x = np.concatenate((x1, x2))
+    y = np.concatenate((y1, y2))
+    y[25] = 160
+    indices, rules, scores = detect(users, x, y, 'glucosa', 0)
+    spikes = indices[rules == 'pico'].tolist()
+    # el usuario 2 tiene pocas mediciones y su valor "alto" no se compara con el usuario 1
+    assert spikes == [25]
+    assert scores[rules == 'pico'][0] > anomalies.SPIKE_Z
+
+
+def test_outlier_against_user_window():
+    x, y = steady(60, 70)
+    y[40] = 140
+    users = np.zeros(60, dtype=np.int64)
+    result = flagged(detect(users, x, y, 'ritmo', 0))
+    assert (40, 'atipica') in result
+    assert {index for index, _ in result} == {40}
+
+
+def test_history_rows_are_not_flagged():
+    x, y = steady(30, 100)
+    y[2] = 30
+    users = np.zeros(30, dtype=np.int64)
+    indices, _, _ = detect(users, x, y, 'glucosa', int(x[10]))
+    assert 2 not in indices.tolist()
+
+
+def test_detect_chunk_covers_both_pressures():
+    x, systolic = steady(10, 120)
+    systolic[4] = 200
+    diastolic = systolic - 40
+    diastolic[6] = 130
+    users = np.full(10, 9, dtype=np.int64)
+    alerts = detect_chunk(KINDS['presion_arterial'], users, x,
+                          {'PRESION_SISTOLICA': systolic, 'PRESION_DIASTOLICA': diastolic}, 0)
+    assert (9, 'presion_sistolica', int(x[4]), 200, 'crisis_hipertensiva', None) in alerts
+    assert (9, 'presion_diastolica', int(x[6]), 130, 'crisis_hipertensiva', None) in alerts
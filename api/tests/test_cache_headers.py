@@ -0,0 +1,53 @@
+import pytest
+
+import tienda
+
+
+@pytest.fixture
+def catalogo(monkeypatch):
+    beneficios = [{"ID_BENEFICIO": i, "NOMBRE": f"bono {i}", "PUNTOS": 10 * i} for i in (1, 2)]
+    monkeypatch.setattr(tienda.catalogo_cache, 'loader', lambda: beneficios)
+    tienda.catalogo_cache.invalidate()
+    return beneficios
+
+
+def test_cached_route_keeps_its_cache_control(client, login, catalogo):
+    response = client.get('/tienda/catalogo', headers=login(1))
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert response.headers['ETag']
+    # el resto de los headers de secure siguen saliendo
+    assert response.headers['X-Frame-Options']
+
+
+def test_etag_gives_304(client, login, catalogo):
+    headers = login(1)
+    etag = client.get('/tienda/catalogo', headers=headers).headers['ETag']
+    response = client.get('/tienda/catalogo', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_etag_changes_after_invalidate(client, login, catalogo):
+    headers = login(1)
+    etag = client.get('/tienda/catalogo', headers=headers).headers['ETag']
+    catalogo.append({'ID_BENEFICIO': 3, 'NOMBRE': 'bono 3', 'PUNTOS': 30})
+    tienda.catalogo_cache.invalidate()
+    response = client.get('/tienda/catalogo', headers={**headers, 'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_routes_without_policy_are_not_stored(client, login, monkeypatch):
+    monkeypatch.setattr('session_manager.is_staff', lambda user_id: True)
+    response = client.get('/getPoolStats', headers=login(1))
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache, no-store, must-revalidate'
+
+
+def test_bono_stubs_do_not_invalidate(client, catalogo):
+    version = tienda.catalogo_cache.version.get()
+    client.post('/tienda/crearBono')
+    client.delete('/tienda/borrarBono')
+    assert tienda.catalogo_cache.version.get() == version
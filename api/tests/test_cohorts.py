@@ -0,0 +1,138 @@
+import pickle
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import cohorts
+from cohorts import CohortIndex, CohortSketches, rollup_keys
+from ingest import KINDS, Batch
+from sketches import KLL
+
+QS = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def rank_errors(sketch, values):
+    ordered = np.sort(values)
+    return [abs(np.searchsorted(ordered, estimate, side='right') / len(values) - q)
+            for q, estimate in zip(QS, sketch.quantiles(QS))]
+
+
+def test_kll_rank_error_and_size():
+    values = np.random.default_rng(0).lognormal(4.7, 0.25, 200000)
+    sketch = KLL()
+    for chunk in np.array_split(values, 50):
+        sketch.update(chunk)
+    assert sketch.n == len(values)
+    assert max(rank_errors(sketch, values)) < 0.02
+    assert sum(len(level) for level in sketch.levels) < 1000
+    assert sketch.quantiles([0, 1]) == [values.min(), values.max()]
+
+
+def test_kll_merge_matches_union():
+    rng = np.random.default_rng(1)
+    parts = [rng.normal(100, 15, 30000) for _ in range(4)]
+    total = KLL()
+    for part in parts:
+        sketch = KLL()
+        sketch.update(part)
+        total.merge(sketch)
+    assert total.n == 120000
+    assert max(rank_errors(total, np.concatenate(parts))) < 0.02
+
+
+def test_kll_small_and_empty():
+    sketch = KLL()
+    assert sketch.quantiles([0.5]) == [None]
+    sketch.update([3, np.nan, 1, 2])
+    assert sketch.n == 3
+    assert sketch.quantiles([0, 0.5, 1]) == [1, 2, 3]
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(cohorts, 'SNAPSHOT_PATH', str(tmp_path / 'cohorts.npz'))
+    monkeypatch.setattr(cohorts, 'DELTAS_PATH', str(tmp_path / 'cohorts.deltas'))
+    state = CohortSketches()
+    state.users[7] = ('30-39', 'F', 'O+')
+    index = CohortIndex()
+    index.publish(state)
+    return index
+
+
+def batch(fechas, niveles):
+    fechas = np.array(fechas, dtype='datetime64[s]')
+    return Batch(KINDS['glucosa'], np.arange(len(fechas)), fechas,
+                 {'NIVEL': np.array(niveles, dtype=np.int64)}, np.full(len(fechas), None, dtype=object))
+
+
+def glucosa(state):
+    sketch = state.sketches.get((rollup_keys(('30-39', 'F', 'O+'))[-1], 'glucosa'))
+    return sketch.n if sketch is not None else 0
+
+
+def test_record_skips_old_readings(index):
+    now = datetime.now()
+    old = now - timedelta(days=cohorts.COHORT_DAYS + 1)
+    index.record(7, {'glucosa': batch([now, old, now], [90, 300, 110])})
+    index.record(7, {'glucosa': batch([old], [80])})
+    state = index.current()
+    assert glucosa(state) == 2
+    assert state.sketches[(('30-39', 'F', 'O+'), 'glucosa')].max == 110
+
+
+def test_partial_record_is_retried(index):
+    index.record(7, {'glucosa': batch([datetime.now()], [90])})
+    with open(cohorts.DELTAS_PATH, 'rb') as f:
+        record = f.read()
+    # un registro a medio escribir al final del log
+    with open(cohorts.DELTAS_PATH, 'ab') as f:
+        f.write(record[:len(record) // 2])
+    assert glucosa(index.current()) == 1
+    with open(cohorts.DELTAS_PATH, 'ab') as f:
+        f.write(record[len(record) // 2:])
+    assert glucosa(index.current()) == 2
+
+
+def test_publish_resets_readers(index):
+    index.record(7, {'glucosa': batch([datetime.now()] * 3, [90, 95, 100])})
+    assert glucosa(index.current()) == 3
+    state = CohortSketches()
+    state.users[7] = ('30-39', 'F', 'O+')
+    index.publish(state)
+    index.record(7, {'glucosa': batch([datetime.now()], [120])})
+    # el offset del log anterior no se usa sobre el nuevo
+    assert glucosa(index.current()) == 1
+
+
+def test_snapshot_round_trip(index):
+    state = CohortSketches()
+    state.users[7] = ('30-39', 'F', 'O+')
+    state.users[8] = (None, 'M', None)
+    state.user_counts[('30-39', 'F', 'O+')] = 1
+    state.built = datetime(2024, 5, 1, 3, 0)
+    values = np.random.default_rng(2).normal(100, 15, 20000)
+    state.sketch(('30-39', 'F', 'O+'), 'glucosa').update(values)
+    state.sketch(('*', '*', '*'), 'peso').update([70.5])
+    index.publish(state)
+    loaded = CohortIndex().current()
+    assert loaded.users == state.users
+    assert loaded.user_counts == state.user_counts
+    assert loaded.built == state.built
+    for key, sketch in state.sketches.items():
+        assert loaded.sketches[key].n == sketch.n
+        assert loaded.sketches[key].quantiles(QS) == sketch.quantiles(QS)
+
+
+def test_snapshot_is_not_unpickled(index, tmp_path):
+    marker = tmp_path / 'executed'
+
+    class Payload:
+        def __reduce__(self):
+            return (open, (str(marker), 'w'))
+
+    with open(cohorts.SNAPSHOT_PATH, 'wb') as f:
+        pickle.dump(Payload(), f)
+    state = CohortIndex().current()
+    assert not marker.exists()
+    assert state.users == {}
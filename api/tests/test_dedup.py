@@ -0,0 +1,106 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import dedup
+from dedup import BloomFilter, SampleIndex, drop_duplicates
+from ingest import validate
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """id_muestra que ya están en GLUCOSA; registra los queries que llegan a la BD."""
+    ids = set()
+    queries = []
+
+    def fetch_all(cursor, query, params=None):
+        queries.append(query)
+        if query.startswith('INSERT'):
+            # (usuario, fecha, nivel, id_muestra, ..., usuario): las que ya están no se insertan
+            new = [sample_id for sample_id in params[1:-1][2::3] if sample_id is None or sample_id not in ids]
+            ids.update(sample_id for sample_id in new if sample_id is not None)
+            return [SimpleNamespace(ID_MUESTRA=sample_id) for sample_id in new]
+        if 'UNION ALL' in query:
+            return [SimpleNamespace(TABLA='GLUCOSA', ID_MUESTRA=sample_id) for sample_id in ids]
+        return [SimpleNamespace(ID_MUESTRA=sample_id) for sample_id in params[1:] if sample_id in ids]
+
+    monkeypatch.setattr(dedup, 'fetch_all', fetch_all)
+    monkeypatch.setattr(dedup, 'samples', SampleIndex())
+    return SimpleNamespace(ids=ids, queries=queries)
+
+
+def glucosa(*ids):
+    readings = [{"tipo": "glucosa", "fecha": "2024-10-01T08:00:00", "glucosa": 90 + i, "id_muestra": sample_id}
+                for i, sample_id in enumerate(ids)]
+    batches, rejected = validate(readings, now=datetime(2024, 10, 2))
+    assert not rejected
+    return batches
+
+
+def test_drops_stored_and_repeated_samples(stored):
+    stored.ids.update({'a', 'b'})
+    batches, duplicates = drop_duplicates(None, 1, glucosa('a', 'c', 'c', None, 'b', None))
+    assert duplicates == 3
+    assert batches['glucosa'].ids.tolist() == ['c', None, None]
+    assert batches['glucosa'].values['NIVEL'].tolist() == [91, 93, 95]
+
+
+def test_without_sample_ids_skips_the_database(stored):
+    batches, duplicates = drop_duplicates(None, 1, glucosa(None, None))
+    assert duplicates == 0
+    assert len(batches['glucosa']) == 2
+    assert stored.queries == []
+
+
+def test_new_samples_are_not_probed(stored):
+    drop_duplicates(None, 1, glucosa('x'))
+    stored.queries.clear()
+    # el filtro ya está cargado y dice que 'y' es nueva: no hay SELECT de confirmación
+    batches, duplicates = drop_duplicates(None, 1, glucosa('y'))
+    assert duplicates == 0
+    assert stored.queries == []
+
+
+def test_remembered_samples_are_dropped(stored):
+    batches, _ = drop_duplicates(None, 1, glucosa('n1', 'n2'))
+    dedup.remember(1, batches)
+    stored.ids.update({'n1', 'n2'})
+    batches, duplicates = drop_duplicates(None, 1, glucosa('n1', 'n2', 'n3'))
+    assert duplicates == 2
+    assert batches['glucosa'].ids.tolist() == ['n3']
+
+
+def test_all_duplicates_leave_no_batch(stored):
+    stored.ids.add('a')
+    batches, duplicates = drop_duplicates(None, 1, glucosa('a'))
+    assert batches == {} and duplicates == 1
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(2000)
+    keys = [f'GLUCOSA:{i}' for i in range(2000)]
+    bloom.add(keys)
+    assert bloom.contains(keys).all()
+    others = bloom.contains([f'GLUCOSA:otro{i}' for i in range(10000)])
+    assert others.mean() < 0.03
+
+
+def test_store_passes_on_only_inserted_rows(stored, cnx, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(dedup.rollups, 'update', lambda *args: None)
+    monkeypatch.setattr(dedup.cohort_index, 'record', lambda user_id, batches: recorded.append(batches))
+
+    # otro worker guarda 'b' entre el filtro y el INSERT
+    def race(cursor, query, params=None):
+        if query.startswith('INSERT'):
+            stored.ids.add('b')
+        return fetch_all(cursor, query, params)
+
+    fetch_all = dedup.fetch_all
+    monkeypatch.setattr(dedup, 'fetch_all', race)
+    inserted, duplicates = dedup.store(cnx, 1, glucosa('a', 'b', None))
+    assert inserted == {'glucosa': 2} and duplicates == 1
+    [batches] = recorded
+    assert batches['glucosa'].ids.tolist() == ['a', None]
+    assert batches['glucosa'].values['NIVEL'].tolist() == [90, 92]
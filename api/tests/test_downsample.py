@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from downsample import lttb, minmax
+
+
+def reference_lttb(x, y, points):
+    """LTTB punto por punto, como en el artículo (Steinarsson 2013)."""
+    n = len(x)
+    every = (n - 2) / (points - 2)
+    selected = [0]
+    a = 0
+    for i in range(points - 2):
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        if i == points - 3:
+            end = n - 1
+            next_start, next_end = n - 1, n
+        avg_x, avg_y = np.mean(x[next_start:next_end]), np.mean(y[next_start:next_end])
+        areas = [abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a])) for j in range(start, end)]
+        a = start + int(np.argmax(areas))
+        selected.append(a)
+    return selected + [n - 1]
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.integers(1, 600, n)).astype(np.int64)
+    y = np.cumsum(rng.normal(0, 3, n)) + 100
+    return x, y
+
+
+@pytest.mark.parametrize('n, points', [(1000, 100), (1001, 37), (50, 3)])
+def test_lttb_matches_reference(n, points):
+    x, y = series(n)
+    assert lttb(x, y, points).tolist() == reference_lttb(x.astype(float), y, points)
+
+
+@pytest.mark.parametrize('points, expected', [(10, list(range(5))), (5, list(range(5))), (2, [0, 4]), (1, [0])])
+def test_lttb_small_requests(points, expected):
+    x, y = series(5)
+    assert lttb(x, y, points).tolist() == expected
+
+
+def test_minmax_keeps_extremes_of_each_interval():
+    x, y = series(5000, seed=1)
+    y[1234] = 400
+    y[4321] = -50
+    points = 100
+    selected = minmax(x, y, points)
+    assert len(selected) <= points
+    assert np.all(np.diff(selected) > 0)
+    assert {1234, 4321} <= set(selected.tolist())
+    bucket = (x - x[0]) * (points // 2) // (int(x[-1] - x[0]) + 1)
+    for b in np.unique(bucket):
+        members = np.flatnonzero(bucket == b)
+        assert members[np.argmin(y[members])] in selected
+        assert members[np.argmax(y[members])] in selected
+
+
+def test_minmax_returns_everything_when_it_fits():
+    x, y = series(20)
+    assert minmax(x, y, 20).tolist() == list(range(20))
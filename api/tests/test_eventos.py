@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import pytest
+
+import eventos
+import session_manager
+
+
+@pytest.fixture
+def staff(monkeypatch):
+    users = {1}
+    monkeypatch.setattr(session_manager, 'is_staff', lambda user_id: user_id in users)
+    return users
+
+
+def asistir(client, headers, user_id=7, id_evento=3):
+    return client.post('/eventos/asistirEvento', json={'user_id': user_id, 'id_evento': id_evento}, headers=headers)
+
+
+def test_asistir_requires_staff(client, login, staff, monkeypatch):
+    monkeypatch.setattr(eventos, 'execute', lambda *args: pytest.fail("no debe llegar a la BD"))
+    response = asistir(client, login(7))
+    assert response.status_code == 403
+
+
+def test_asistir_requires_session(client, staff):
+    assert asistir(client, {}).status_code == 400
+
+
+def test_asistir_registers_once(client, login, staff, cnx, monkeypatch):
+    updates = []
+
+    def execute(cursor, query, params):
+        updates.append((query, params))
+        return 1
+
+    monkeypatch.setattr(eventos, 'execute', execute)
+    response = asistir(client, login(1))
+    assert response.status_code == 200
+    # el UPDATE solo cambia renglones que no tenían la asistencia y no toca puntos
+    [(query, params)] = updates
+    assert 'ASISTIO = 0' in query
+    assert params == (7, 3)
+    assert cnx.commits == 1
+
+
+@pytest.mark.parametrize('row, status', [(None, 404), (SimpleNamespace(ASISTIO=True), 409)])
+def test_asistir_without_update(client, login, staff, monkeypatch, row, status):
+    monkeypatch.setattr(eventos, 'execute', lambda *args: 0)
+    monkeypatch.setattr(eventos, 'fetch_one', lambda *args: row)
+    assert asistir(client, login(1)).status_code == status
+
+
+@pytest.mark.parametrize('corte, ttl', [(None, eventos.EVENTOS_MAX_TTL), (60, 60), (10 ** 7, eventos.EVENTOS_MAX_TTL)])
+def test_futuros_eventos_expiry_is_capped(monkeypatch, corte, ttl):
+    results = {eventos.query_futuros_eventos: [], eventos.query_siguiente_corte: [SimpleNamespace(SEGUNDOS=corte)]}
+    monkeypatch.setattr(eventos, 'query_all', lambda query: results[query])
+    assert eventos.cargar_futuros_eventos().expires_in == ttl
+
+
+def test_invalidar_cache_requires_staff(client, login, staff):
+    assert client.post('/eventos/invalidarCache', headers=login(7)).status_code == 403
+    version = eventos.futuros_eventos_cache.version.get()
+    assert client.post('/eventos/invalidarCache', headers=login(1)).status_code == 200
+    assert eventos.futuros_eventos_cache.version.get() != version
@@ -0,0 +1,30 @@
+import pytest
+
+import database
+
+
+@pytest.fixture
+def exhausted(client, monkeypatch):
+    def get(timeout=None):
+        raise database.PoolTimeout("No hay conexiones libres")
+
+    monkeypatch.setattr(database.pool, 'get', get)
+    return client
+
+
+@pytest.mark.parametrize('method, path, body', [
+    ('post', '/tienda/comprarBono', {'user_id': 1, 'puntos': 10, 'beneficio_id': 2}),
+    ('delete', '/mediciones/borrarMedicion', {'user_id': 1, 'medicion_id': 5}),
+])
+def test_pool_timeout_is_a_json_500(exhausted, login, method, path, body):
+    response = getattr(exhausted, method)(path, json=body, headers=login(1))
+    assert response.status_code == 500
+    assert 'No hay conexiones libres' in response.json['error']
+
+
+@pytest.mark.parametrize('path', ['/getSessionStats', '/getCacheStats', '/getPoolStats', '/getPlanStats',
+                                  '/getDedupStats'])
+def test_stats_endpoints_require_staff(client, login, monkeypatch, path):
+    monkeypatch.setattr('session_manager.is_staff', lambda user_id: user_id == 1)
+    assert client.get(path).status_code == 400
+    assert client.get(path, headers=login(7)).status_code == 403
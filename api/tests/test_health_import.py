@@ -0,0 +1,82 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import health_import
+import mediciones
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    """Los imports se quedan 'corriendo' hasta que la prueba los suelta."""
+    started = []
+    done = threading.Event()
+
+    def run_import(cnx, user_id, path, progress=None):
+        started.append(user_id)
+        done.wait(5)
+        return {}
+
+    monkeypatch.setattr(health_import.pool, 'connection', lambda: _Context())
+    monkeypatch.setattr(health_import, 'run_import', run_import)
+    yield started
+    done.set()
+    deadline = time.time() + 5
+    while health_import._running and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class _Context:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+def upload(client, headers, data=b'<HealthData/>'):
+    return client.post('/mediciones/import', data=data, headers=dict(headers, **{'Content-Type': 'application/xml'}))
+
+
+def test_import_limits_jobs_per_user_and_worker(client, login, jobs, monkeypatch):
+    monkeypatch.setattr(health_import, 'MAX_JOBS', 2)
+    assert upload(client, login(1)).status_code == 202
+    assert upload(client, login(1)).status_code == 429
+    assert upload(client, login(2)).status_code == 202
+    assert upload(client, login(3)).status_code == 429
+    assert health_import._running == {1: 1, 2: 1}
+
+
+def test_import_rejects_large_upload(client, login, jobs, monkeypatch):
+    monkeypatch.setattr(mediciones, 'MAX_UPLOAD_BYTES', 4)
+    assert upload(client, login(1), b'<HealthData/>').status_code == 413
+    assert health_import._running == {}
+
+
+def test_save_upload_stops_at_max_bytes():
+    files = set(os.listdir(health_import.IMPORT_DIR)) if os.path.isdir(health_import.IMPORT_DIR) else set()
+    with pytest.raises(health_import.UploadTooLarge):
+        health_import.save_upload(io.BytesIO(b'x' * 100), chunk_size=10, max_bytes=50)
+    assert set(os.listdir(health_import.IMPORT_DIR)) == files
+    job_id, path = health_import.save_upload(io.BytesIO(b'x' * 50), chunk_size=10, max_bytes=50)
+    assert os.path.getsize(path) == 50
+    os.remove(path)
+
+
+def test_stale_uploads_are_cleaned():
+    os.makedirs(health_import.IMPORT_DIR, exist_ok=True)
+    old = time.time() - health_import.PROGRESS_TTL - 1
+    paths = {}
+    for name in ('viejo.upload', 'viejo.json', 'nuevo.upload'):
+        paths[name] = os.path.join(health_import.IMPORT_DIR, name)
+        open(paths[name], 'w').close()
+    for name in ('viejo.upload', 'viejo.json'):
+        os.utime(paths[name], (old, old))
+    health_import._clean_progress()
+    assert not os.path.exists(paths['viejo.upload'])
+    assert not os.path.exists(paths['viejo.json'])
+    assert os.path.exists(paths['nuevo.upload'])
+    os.remove(paths['nuevo.upload'])
@@ -0,0 +1,53 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from ingest import parse_body, validate
+
+NOW = datetime(2024, 10, 1, 12, 0)
+
+
+def test_valid_readings_are_grouped_by_tipo():
+    batches, rejected = validate([
+        {"tipo": "glucosa", "fecha": "2024-10-01T08:30:00", "glucosa": 95.4},
+        {"tipo": "ritmo_cardiaco", "fecha": "2024-10-01T08:31:00", "ritmo": "72", "id_muestra": "a1"},
+        {"tipo": "glucosa", "fecha": "2024-10-01T09:00:00-06:00", "glucosa": 110},
+        {"tipo": "presion_arterial", "fecha": "2024-09-30T20:00:00", "presion_sistolica": 120, "presion_diastolica": 80},
+    ], now=NOW)
+    assert rejected == []
+    assert sorted(batches) == ['glucosa', 'presion_arterial', 'ritmo_cardiaco']
+    glucosa = batches['glucosa']
+    assert glucosa.indices.tolist() == [0, 2]
+    assert glucosa.values['NIVEL'].tolist() == [95, 110]
+    # la fecha con zona se guarda en UTC
+    assert glucosa.fechas[1] == np.datetime64('2024-10-01T15:00:00')
+    assert batches['ritmo_cardiaco'].ids.tolist() == ['a1']
+
+
+@pytest.mark.parametrize('reading, error', [
+    ({"tipo": "peso", "fecha": "2024-10-01", "peso": 70}, "tipo inválido"),
+    ({"tipo": [], "fecha": "2024-10-01", "glucosa": 90}, "tipo inválido"),
+    ({"tipo": {"a": 1}, "fecha": "2024-10-01", "glucosa": 90}, "tipo inválido"),
+    ("glucosa", "tipo inválido"),
+    ({"tipo": "glucosa", "fecha": "ayer", "glucosa": 90}, "fecha inválida"),
+    ({"tipo": "glucosa", "fecha": "2030-01-01", "glucosa": 90}, "fecha fuera de rango"),
+    ({"tipo": "glucosa", "fecha": "2024-10-01", "glucosa": "mucha"}, "glucosa inválido"),
+    ({"tipo": "glucosa", "fecha": "2024-10-01", "glucosa": 900}, "glucosa fuera de rango (20-600)"),
+    ({"tipo": "glucosa", "fecha": "2024-10-01", "glucosa": 90, "id_muestra": 5}, "id_muestra inválido"),
+    ({"tipo": "presion_arterial", "fecha": "2024-10-01", "presion_sistolica": 80, "presion_diastolica": 90},
+     "presion_sistolica debe ser mayor que presion_diastolica"),
+])
+def test_invalid_readings_are_rejected(reading, error):
+    valid = {"tipo": "ritmo_cardiaco", "fecha": "2024-10-01", "ritmo": 60}
+    batches, rejected = validate([valid, reading], now=NOW)
+    assert rejected == [(1, error)]
+    assert list(batches) == ['ritmo_cardiaco']
+
+
+def test_parse_body_formats():
+    assert parse_body(b'{"tipo": "glucosa"}') == [{"tipo": "glucosa"}]
+    assert parse_body(b'{"mediciones": [{"tipo": "glucosa"}]}') == [{"tipo": "glucosa"}]
+    assert parse_body(b'{"a": 1}\n\n{"a": 2}\n', 'application/x-ndjson') == [{"a": 1}, {"a": 2}]
+    with pytest.raises(ValueError):
+        parse_body(b'"glucosa"')
@@ -0,0 +1,64 @@
+import base64
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from pagination import InvalidPage, Keyset, Page, decode_token, encode_token, page_rows
+
+eventos_keyset = Keyset('FECHA', 'ID_EVENTO')
+
+
+def token(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def test_token_round_trip():
+    values = (datetime(2024, 5, 1, 18, 30), 42)
+    assert decode_token(encode_token(values), eventos_keyset) == values
+
+
+@pytest.mark.parametrize('bad', [
+    'no-es-base64!!',
+    token({'d': 1}),
+    token([['v', 'a']]),
+    token([['v', True], ['v', 1]]),
+    token([['d', 5], ['v', 1]]),
+    token([['d', 'ayer'], ['v', 1]]),
+    token([['x', 1], ['v', 1]]),
+    token([['v', [1]], ['v', 1]]),
+    token([['v', 1]]),
+])
+def test_bad_tokens_are_rejected(bad):
+    with pytest.raises(InvalidPage):
+        decode_token(bad, eventos_keyset)
+
+
+def rows(n):
+    return [SimpleNamespace(FECHA=datetime(2024, 1, 1 + i), ID_EVENTO=i) for i in range(n)]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_page_rows_walks_every_row_once(descending):
+    keyset = Keyset('FECHA', 'ID_EVENTO', descending=descending)
+    data = rows(7)
+    seen, after = [], None
+    while True:
+        page = page_rows(data, keyset, Page(3, after, False))
+        seen.extend(page[:3])
+        if len(page) <= 3:
+            break
+        after = decode_token(encode_token(keyset.key(page[2])), keyset)
+    assert [row.ID_EVENTO for row in seen] == sorted(range(7), reverse=descending)
+
+
+def test_page_rows_rejects_token_of_other_listing():
+    after = decode_token(encode_token((5, 1)), eventos_keyset)
+    with pytest.raises(InvalidPage):
+        page_rows(rows(3), eventos_keyset, Page(3, after, False))
+
+
+def test_bad_token_is_a_400(client, login):
+    response = client.get('/retos/getRetos?next=' + token([['v', 'a']]), headers=login(1))
+    assert response.status_code == 400
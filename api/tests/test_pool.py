@@ -0,0 +1,84 @@
+import threading
+import time
+import pytest
+import database
+from database import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    def slow_connect(params):
+        # lento para que varios hilos pasen por _checkout a la vez
+        time.sleep(0.02)
+        return FakeConnection()
+    monkeypatch.setattr(database, 'connect_db', slow_connect)
+
+
+def make_pool(**kwargs):
+    kwargs.setdefault('min_size', 0)
+    kwargs.setdefault('ping_interval', 0)
+    return ConnectionPool({}, **kwargs)
+
+
+def test_concurrent_gets_never_exceed_max_size(connect):
+    pool = make_pool(max_size=3, timeout=5)
+    open_connection = pool._open
+
+    def delayed_open(*args, **kwargs):
+        # ensancha la ventana entre _checkout y _open para que los hilos choquen
+        time.sleep(0.01)
+        return open_connection(*args, **kwargs)
+    pool._open = delayed_open
+    peak = []
+    lock = threading.Lock()
+
+    def worker():
+        conn = pool.get()
+        with lock:
+            peak.append(pool.stats()['size'])
+        time.sleep(0.01)
+        pool.put(conn)
+
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 3
+    assert pool.stats()['size'] <= 3
+    assert pool.stats()['created'] <= 3
+
+
+def test_get_times_out_when_pool_is_exhausted(connect):
+    pool = make_pool(max_size=1)
+    conn = pool.get()
+    with pytest.raises(PoolTimeout):
+        pool.get(timeout=0.05)
+    assert pool.stats()['timeouts'] == 1
+    pool.put(conn)
+    assert pool.get(timeout=0.05) is conn
+
+
+def test_failed_connect_releases_the_slot(monkeypatch):
+    def fail(params):
+        raise OSError("down")
+    monkeypatch.setattr(database, 'connect_db', fail)
+    pool = make_pool(max_size=1, backoff_base=0.01)
+    with pytest.raises(OSError):
+        pool.get(timeout=0.05)
+    assert pool.stats()['size'] == 0
+
+
+def test_fill_opens_min_size(connect):
+    pool = make_pool(min_size=2, max_size=4)
+    pool.fill()
+    stats = pool.stats()
+    assert stats['size'] == 2 and stats['idle'] == 2
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+
+import recommendations
+from recommendations import Recommender, TagModel
+
+TAGS = [1, 2, 3, 4]
+SIMILITUD = [SimpleNamespace(ID_TAG_1=a, ID_TAG_2=b, SIMILITUD=s)
+             for a, b, s in ((1, 2, 0.8), (1, 3, 0.1), (2, 3, 0.5), (3, 4, 0.9))]
+EVENTOS = [SimpleNamespace(ID_EVENTO=i) for i in (10, 11, 12, 13)]
+EVENTOS_TAGS = [SimpleNamespace(ID_EVENTO=e, ID_TAG=t) for e, t in ((10, 1), (10, 3), (11, 2), (12, 4), (12, 3))]
+
+
+def per_pair(weights):
+    """La cuenta que hacía la app, un par (tag del usuario, tag del evento) a la vez."""
+    pairs = {(row.ID_TAG_1, row.ID_TAG_2): row.SIMILITUD for row in SIMILITUD}
+    scores = {}
+    for evento in EVENTOS:
+        tags = [row.ID_TAG for row in EVENTOS_TAGS if row.ID_EVENTO == evento.ID_EVENTO]
+        total = frequency = 0
+        for tag, veces in weights.items():
+            for event_tag in tags:
+                similarity = 1.0 if tag == event_tag else pairs.get((min(tag, event_tag), max(tag, event_tag)), 0.0)
+                total += similarity * veces
+                frequency += veces
+        scores[evento.ID_EVENTO] = total / frequency if frequency else 0.0
+    return scores
+
+
+@pytest.fixture
+def model():
+    return TagModel(EVENTOS, TAGS, SIMILITUD, EVENTOS_TAGS)
+
+
+@pytest.mark.parametrize('weights', [{1: 3, 4: 1}, {2: 1}, {3: 5, 2: 2, 1: 1}])
+def test_rank_matches_per_pair_loop(model, weights):
+    ranked = model.rank(weights)
+    expected = per_pair(weights)
+    assert {evento.ID_EVENTO: score for evento, score in ranked} == pytest.approx(expected, abs=1e-4)
+    scores = [score for _, score in ranked]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_rank_limit_and_ties(model):
+    # sin tags del usuario todos valen 0 y quedan en el orden de la lista
+    assert [(evento.ID_EVENTO, score) for evento, score in model.rank({})] == [(10, 0), (11, 0), (12, 0), (13, 0)]
+    assert [evento.ID_EVENTO for evento, _ in model.rank({4: 1}, limit=2)] == [12, 10]
+
+
+def test_unknown_tags_are_ignored(model):
+    assert model.rank({99: 4, 2: 1}) == model.rank({2: 1})
+
+
+def test_recommender_rebuilds_for_new_entry(monkeypatch):
+    loads = []
+
+    def fetch_sets(cursor, queries):
+        loads.append(len(queries))
+        return {'tags': [SimpleNamespace(ID_TAG=t) for t in TAGS], 'similitud': SIMILITUD,
+                'eventos_tags': EVENTOS_TAGS}
+
+    class Cnx:
+        def cursor(self):
+            return SimpleNamespace(close=lambda: None)
+
+    monkeypatch.setattr(recommendations, 'fetch_sets', fetch_sets)
+    recommender = Recommender()
+    entry = SimpleNamespace(data=EVENTOS)
+    first = recommender.model(entry, Cnx())
+    assert recommender.model(entry, Cnx()) is first
+    # lista nueva (otra entrada del cache), p. ej. después de invalidar_eventos()
+    second = SimpleNamespace(data=EVENTOS[:2])
+    assert recommender.model(second, Cnx()) is not first
+    assert len(loads) == 2
+    # similitud recargada con recommendations.py
+    recommender.version.bump()
+    recommender.model(second, Cnx())
+    assert len(loads) == 3
@@ -0,0 +1,17 @@
+import time
+
+import retos
+
+
+def test_retos_cache_expires(client, login, monkeypatch):
+    loads = []
+    monkeypatch.setattr(retos, 'query_all', lambda query: loads.append(query) or [{'ID_RETO': len(loads)}])
+    retos.retos_cache.invalidate()
+    headers = login(1)
+    assert client.get('/retos/getRetos', headers=headers).json == [{'ID_RETO': 1}]
+    assert client.get('/retos/getRetos', headers=headers).json == [{'ID_RETO': 1}]
+    assert len(loads) == 1
+
+    now = time.time()
+    monkeypatch.setattr('cache.time.time', lambda: now + retos.RETOS_TTL + 1)
+    assert client.get('/retos/getRetos', headers=headers).json == [{'ID_RETO': 2}]
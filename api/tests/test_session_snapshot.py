@@ -0,0 +1,96 @@
+import os
+import threading
+
+import session_snapshot
+from session_backends import MemoryBackend
+from session_snapshot import SessionSnapshot, read_records, replay
+
+KEYS = ['11111111-1111-1111-1111-111111111111', '22222222-2222-2222-2222-222222222222',
+        '33333333-3333-3333-3333-333333333333']
+
+
+def snapshot(path):
+    backend = MemoryBackend()
+    snap = SessionSnapshot(backend, str(path))
+    snap.restore()
+    return backend, snap
+
+
+def live(path):
+    return {session_snapshot.bytes_to_key(key): value[0] for key, value in replay(read_records(str(path))).items()}
+
+
+def test_compact_keeps_what_another_worker_wrote(tmp_path):
+    path = tmp_path / 'sessions.snap'
+    a, snap_a = snapshot(path)
+    b, snap_b = snapshot(path)
+    a.set(KEYS[0], 1)
+    snap_a.flush()
+    b.set(KEYS[1], 2)
+    snap_b.flush()
+    snap_a.compact()
+    assert live(path) == {KEYS[0]: 1, KEYS[1]: 2}
+
+
+def test_changes_after_compact_are_flushed(tmp_path):
+    path = tmp_path / 'sessions.snap'
+    backend, snap = snapshot(path)
+    backend.set(KEYS[0], 1)
+    snap.flush()
+    backend.set(KEYS[1], 2)
+    backend.delete(KEYS[0])
+    snap.compact()
+    snap.flush()
+    assert live(path) == {KEYS[1]: 2}
+
+
+def test_flush_during_compact_is_not_lost(tmp_path, monkeypatch):
+    path = tmp_path / 'sessions.snap'
+    backend, snap = snapshot(path)
+    backend.set(KEYS[0], 1)
+    snap.flush()
+    # otro hilo hace un cambio y un flush justo cuando compact ya tomó su estado
+    real_snapshot = backend.snapshot
+    flusher = []
+
+    def slow_snapshot():
+        entries = real_snapshot()
+        backend.set(KEYS[2], 3)
+        flusher.append(threading.Thread(target=snap.flush))
+        flusher[0].start()
+        flusher[0].join(0.1)
+        return entries
+
+    monkeypatch.setattr(backend, 'snapshot', slow_snapshot)
+    snap.compact()
+    flusher[0].join()
+    assert live(path) == {KEYS[0]: 1, KEYS[2]: 3}
+
+
+def test_compact_uses_unique_temp_files(tmp_path, monkeypatch):
+    path = tmp_path / 'sessions.snap'
+    backend, snap = snapshot(path)
+    names = []
+    real_mkstemp = session_snapshot.tempfile.mkstemp
+
+    def mkstemp(**kwargs):
+        fd, name = real_mkstemp(**kwargs)
+        names.append(name)
+        return fd, name
+
+    monkeypatch.setattr(session_snapshot.tempfile, 'mkstemp', mkstemp)
+    snap.compact()
+    snap.compact()
+    assert len(set(names)) == 2
+    assert all(os.path.dirname(name) == str(tmp_path) for name in names)
+    assert sorted(os.listdir(tmp_path)) == ['sessions.snap', 'sessions.snap.lock']
+
+
+def test_restore_after_compact(tmp_path):
+    path = tmp_path / 'sessions.snap'
+    backend, snap = snapshot(path)
+    backend.set(KEYS[0], 7)
+    snap.flush()
+    snap.compact()
+    restored, _ = snapshot(path)
+    assert restored.get(KEYS[0]) == 7
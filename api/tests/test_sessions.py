@@ -0,0 +1,71 @@
+from session_backends import MemoryBackend, SessionRecord, TimingWheel
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def make_backend(now=1000000.0, **kwargs):
+    clock = Clock(now)
+    return MemoryBackend(clock=clock.time, **kwargs), clock
+
+
+def test_wheel_returns_records_when_their_slot_is_due():
+    wheel = TimingWheel(tick=1.0, slots=60, clock=lambda: 100.0)
+    record = SessionRecord(1, 100.0, 105.0)
+    wheel.schedule('a', record)
+    assert wheel.advance(104.0) == []
+    assert wheel.advance(105.0) == [('a', record)]
+    assert record.slot is None
+
+
+def test_wheel_schedules_past_expiries_on_the_next_tick():
+    wheel = TimingWheel(tick=1.0, slots=60, clock=lambda: 100.0)
+    wheel.schedule('a', SessionRecord(1, 0.0, 50.0))
+    assert [key for key, _ in wheel.advance(101.0)] == ['a']
+
+
+def test_sweep_expires_idle_sessions():
+    backend, clock = make_backend(absolute_ttl=100, idle_ttl=10)
+    backend.set('k', 7)
+    clock.now += 11
+    backend.sweep(clock.now)
+    assert backend.stats()['expired'] == 1
+    assert backend.get('k') is None
+
+
+def test_use_slides_the_idle_ttl():
+    backend, clock = make_backend(absolute_ttl=100, idle_ttl=10)
+    backend.set('k', 7)
+    clock.now += 8
+    assert backend.get('k') == 7
+    clock.now += 8
+    # el slot viejo venció pero la sesión se extendió: se reagenda
+    backend.sweep(clock.now)
+    assert backend.get('k') == 7
+    assert backend.stats()['expired'] == 0
+
+
+def test_absolute_ttl_wins_over_use():
+    backend, clock = make_backend(absolute_ttl=20, idle_ttl=10)
+    backend.set('k', 7)
+    for _ in range(3):
+        clock.now += 8
+        backend.get('k')
+    backend.sweep(clock.now)
+    assert backend.get('k') is None
+
+
+def test_lru_eviction():
+    backend, clock = make_backend(max_sessions=2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    backend.get('a')
+    backend.set('c', 3)
+    assert backend.get('b') is None
+    assert backend.get('a') == 1 and backend.get('c') == 3
+    assert backend.stats()['evicted'] == 1
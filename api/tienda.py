@@ -1,6 +1,9 @@
-from flask import Blueprint, jsonify, request
-from database import cnx
-from session_manager import validate_key
+import os
+from flask import Blueprint, g, jsonify, request
+from database import execute, fetch_one, get_db, query_all
+from session_manager import require_session
+from cache import Expiring, VersionedCache, cache_policy
+from pagination import Keyset, page_args, page_rows
 
 from logger import my_logger  
 
@@ -10,41 +13,34 @@ from logger import my_logger
 # Create a Blueprint for 'Tienda'
 tienda_bp = Blueprint('tienda', __name__)
 
+# BENEFICIOS solo cambia cuando un admin lo edita, por ahora directo en la BD;
+# cuando crear_bono y borrar_bono existan deben llamar catalogo_cache.invalidate()
+# (los demás workers lo ven por la versión compartida). Mientras, caduca solo.
+CATALOGO_TTL = int(os.getenv('CATALOGO_CACHE_TTL', 300))
+
+catalogo_cache = VersionedCache('catalogo', lambda: Expiring(query_all("SELECT * FROM BENEFICIOS"), CATALOGO_TTL))
+catalogo_keyset = Keyset('ID_BENEFICIO')
+
 # Route to get the catalog of benefits
 @tienda_bp.route('/catalogo', methods=['GET'])
+@require_session
+@cache_policy('private, no-cache')
 def catalogo():
     """
     Obtiene el catálogo de beneficios disponibles para canjear.
     Documentado por Carlos.
     """
     my_logger.debug("Starting /catalogo request.")
+    page = page_args(catalogo_keyset)
 
-    key = request.headers.get('key')
-    if not key or not validate_key(key):
-        my_logger.warning("Invalid or missing session key.")
-        return jsonify({"error": "Llave de sesión inválida."}), 400
-
-    query = "SELECT * FROM BENEFICIOS"
-    
     try:
-        if cnx is None:
-            my_logger.error("Database connection not established.")
-            return jsonify({"error": "No se estableció la conexión con la Base de Datos."}), 500
-
-        cursor = cnx.cursor()
-        cursor.execute(query)
-        
-        # Check if query returned any results
-        if cursor.description is None:
-            my_logger.error("Query did not return any results.")
-            return jsonify({"error": "No se obtuvieron resultados de la Query."}), 500
-
-        columns = [column[0] for column in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        cursor.close()
+        if page is not None:
+            beneficios = catalogo_cache.get().data
+            return page.response(page_rows(beneficios, catalogo_keyset, page), catalogo_keyset, total=len(beneficios))
+        response = catalogo_cache.response()
 
-        my_logger.debug("Catalog query executed successfully.")
-        return jsonify(results), 200
+        my_logger.debug("Catalog served.")
+        return response
 
     except Exception as e:
         my_logger.error(f"Error occurred during /catalogo: {str(e)}")
@@ -53,19 +49,19 @@ def catalogo():
 
 # Route to handle the purchase of a benefit
 @tienda_bp.route('/comprarBono', methods=['POST'])
+@require_session
 def comprar_bono():
     """
     Maneja la compra de un beneficio por parte de un usuario.
     """
     my_logger.debug("Starting /comprarBono request.")
 
-    session_key = request.headers.get('key')
     data = request.json
     user_id = data.get('user_id')
     puntos = data.get('puntos')
     beneficio_id = data.get('beneficio_id')
 
-    if not session_key or validate_key(session_key) != user_id:
+    if g.user_id != user_id:
         my_logger.warning("Invalid session key.")
         return jsonify({"error": "Llave de sesión inválida."}), 400
 
@@ -85,33 +81,32 @@ def comprar_bono():
     VALUES (%s, GETDATE(), %s, 0, %s, NULL, NULL);
     """
 
+    # en None para que el except y el finally no fallen si get_db() no consigue conexión
+    cnx = cursor = None
     try:
+        cnx = get_db()
         cursor = cnx.cursor()
         
         # Check if the user has already bought the benefit
-        cursor.execute(query_checarBeneficio, (user_id, beneficio_id))
-        row = cursor.fetchone()
-        tiene_beneficio = row[0] == 'True'
+        tiene_beneficio = fetch_one(cursor, query_checarBeneficio, (user_id, beneficio_id)).TIENE_BENEFICIO == 'True'
         
         if tiene_beneficio:
             my_logger.warning(f"User {user_id} already purchased benefit {beneficio_id}.")
             return jsonify({"conflict": "Beneficio ya comprado anteriormente. Seleccione un beneficio distinto"}), 409
 
-        cursor.execute(query_puntajeBeneficio, (beneficio_id,))
-        row = cursor.fetchone()
-        costo_beneficio = row[0]
+        costo_beneficio = fetch_one(cursor, query_puntajeBeneficio, (beneficio_id,)).PUNTOS
 
         if puntos >= costo_beneficio:
             puntosAct = puntos - costo_beneficio
-            cursor.execute(query_restaPuntos, (puntosAct, user_id))
+            execute(cursor, query_restaPuntos, (puntosAct, user_id))
             my_logger.debug(f"Points deducted for user {user_id}: {puntosAct} remaining.")
 
             # Add to benefit history
-            cursor.execute(query_historialBeneficios, (user_id, beneficio_id))
+            execute(cursor, query_historialBeneficios, (user_id, beneficio_id))
             my_logger.debug(f"Benefit {beneficio_id} added to history for user {user_id}.")
 
             # Add to points history
-            cursor.execute(query_historialPuntos, (user_id, costo_beneficio, beneficio_id))
+            execute(cursor, query_historialPuntos, (user_id, costo_beneficio, beneficio_id))
             my_logger.debug(f"Points history updated for user {user_id}.")
 
             cnx.commit()
@@ -122,10 +117,12 @@ def comprar_bono():
 
     except Exception as e:
         my_logger.error(f"Error occurred during /comprarBono: {str(e)}")
-        cnx.rollback()
+        if cnx is not None:
+            cnx.rollback()
         return jsonify({"error": str(e)}), 500
     finally:
-        cursor.close()
+        if cursor is not None:
+            cursor.close()
 
 
 # Additional route stubs (to be implemented) with my_logger
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+import numpy as np
+from cache import UserMemo
+from series import EPOCH, METRICS, load_series
+
+# Estadísticas de tendencia de las mediciones de un usuario en una ventana
+# de días: promedio móvil diario, percentiles, desviación, pendiente y, para
+# la glucosa, tiempo en rango. Todo se calcula con numpy sobre la serie
+# cruda (un query por métrica) y se guarda por usuario hasta que llegan
+# mediciones nuevas (dedup.store llama a trend_stats.invalidate).
+
+DEFAULT_DAYS = 30
+MAX_DAYS = 365
+
+# el promedio móvil es de estos días
+MOVING_DAYS = 7
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# rango objetivo de glucosa en mg/dL (consenso internacional de tiempo en rango)
+GLUCOSE_RANGE = (70, 180)
+
+# la ventana termina "ahora", así que tampoco sin mediciones nuevas sirve para siempre
+trend_stats = UserMemo('trend_stats', ttl=300)
+
+
+def _round(values):
+    """floats de numpy redondeados a 2 decimales, con None donde no hay dato."""
+    rounded = np.round(np.asarray(values, dtype=float), 2)
+    return [None if np.isnan(value) else value for value in rounded.tolist()]
+
+
+def compute(series, desde, days, metric):
+    """Las estadísticas de una Series (ver series.py) que empieza en `desde` y dura `days` días."""
+    y = series.y.astype(np.float64)
+    n = len(y)
+    if n == 0:
+        return {"cuenta": 0}
+    x = series.x
+
+    mean = y.mean()
+    low, p25, median, p75, high = _round(np.percentile(y, PERCENTILES))
+
+    # pendiente de mínimos cuadrados, en unidades por día
+    xc = (x - x[0]).astype(np.float64)
+    xc -= xc.mean()
+    denominator = np.dot(xc, xc)
+    slope = np.dot(xc, y - mean) / denominator * 86400 if denominator else 0.0
+
+    # promedio de cada día y el móvil de MOVING_DAYS días, pesado por cuántas mediciones hubo
+    start = int((np.datetime64(desde, 's') - EPOCH).astype(np.int64))
+    day = np.clip((x - start) // 86400, 0, days - 1)
+    sums = np.bincount(day, weights=y, minlength=days)
+    counts = np.bincount(day, minlength=days)
+    window_sums = np.cumsum(sums)
+    window_counts = np.cumsum(counts)
+    window_sums[MOVING_DAYS:] -= window_sums[:-MOVING_DAYS].copy()
+    window_counts[MOVING_DAYS:] -= window_counts[:-MOVING_DAYS].copy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        daily = _round(sums / counts)
+        moving = _round(window_sums / window_counts)
+    fechas = [desde + timedelta(days=i) for i in range(days)]
+
+    stats = {
+        "cuenta": n,
+        "promedio": _round([mean])[0],
+        "desviacion": _round([y.std(ddof=1) if n > 1 else 0.0])[0],
+        "min": int(y.min()),
+        "max": int(y.max()),
+        "percentiles": {f"p{p}": value for p, value in zip(PERCENTILES, (low, p25, median, p75, high))},
+        "pendiente_por_dia": _round([slope])[0],
+        "diario": [{"fecha": fecha, "promedio": promedio, f"promedio_{MOVING_DAYS}d": movil, "cuenta": cuenta}
+                   for fecha, promedio, movil, cuenta in zip(fechas, daily, moving, counts.tolist())],
+    }
+    if metric == 'glucosa':
+        # porcentaje de las lecturas; con un sensor continuo es también el porcentaje del tiempo
+        below = np.count_nonzero(y < GLUCOSE_RANGE[0])
+        above = np.count_nonzero(y > GLUCOSE_RANGE[1])
+        stats["tiempo_en_rango"] = {
+            "rango": list(GLUCOSE_RANGE),
+            "bajo": _round([100 * below / n])[0],
+            "en_rango": _round([100 * (n - below - above) / n])[0],
+            "alto": _round([100 * above / n])[0],
+        }
+    return stats
+
+
+def user_trends(cursor, user_id, metrics, days):
+    """{métrica: estadísticas} de los últimos `days` días, del memo si siguen vigentes."""
+    # la ventana empieza a medianoche para que los días del promedio diario sean días completos
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    desde = today - timedelta(days=days - 1)
+    hasta = today + timedelta(days=1)
+    results = {}
+    for metric in metrics:
+        results[metric] = trend_stats.get(user_id, (metric, days, desde), lambda metric=metric: compute(
+            load_series(cursor, user_id, metric, desde, hasta), desde, days, metric))
+    return desde, hasta, results
+
+
+def trend_args(args):
+    """(métricas, días) de los parámetros del request; ValueError si alguno no sirve."""
+    metric = args.get('metric')
+    if metric is not None and metric not in METRICS:
+        raise ValueError(f"El parámetro metric debe ser uno de: {', '.join(METRICS)}.")
+    try:
+        days = int(args.get('days', DEFAULT_DAYS))
+    except ValueError:
+        raise ValueError("El parámetro days debe ser un número.")
+    return [metric] if metric else list(METRICS), max(1, min(days, MAX_DAYS))
@@ -1,6 +1,8 @@
-from flask import Blueprint, jsonify, request
-from database import cnx
-from session_manager import create_session, validate_key, delete_session
+from flask import Blueprint, g, jsonify, request
+from database import execute, fetch_one, fetch_sets, get_db, query_all, query_page, stream_rows
+from export import FORMATS, export_response
+from session_manager import create_session, delete_session, require_session
+from pagination import Keyset, ordered_query, page_args
 import hashlib
 
 from logger import my_logger  
@@ -91,19 +93,32 @@ def login():
     SELECT U.ID_USUARIO AS user_id FROM USUARIOS U WHERE U.CORREO = %s AND U.PASS = %s
     """
 
+    # Obtener los tags asociados al usuario y las veces que han sido usados;
+    # va en el mismo batch que las credenciales, por eso busca al usuario con
+    # un subquery en vez de usar el user_id
+    query_tags = """
+    SELECT T.NOMBRE AS nombre, UT.VECES_USADO AS veces_usado
+    FROM USUARIOS_TAGS UT
+    JOIN TAGS T ON UT.ID_TAG = T.ID_TAG
+    WHERE UT.ID_USUARIO = (SELECT U.ID_USUARIO FROM USUARIOS U WHERE U.CORREO = %s AND U.PASS = %s)
+    """
+
     try:
         hash_password = hashlib.sha256(password.encode()).digest()
+        cnx = get_db()
         cursor = cnx.cursor()
-        cursor.execute(query, (correo, hash_password))
-        columns = [column[0] for column in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        sets = fetch_sets(cursor, [
+            ('usuario', query, (correo, hash_password)),
+            ('tags', query_tags, (correo, hash_password)),
+        ])
         cursor.close()
 
-        if not results:
+        if not sets['usuario']:
             my_logger.warning(f"Invalid credentials for user: {correo}")
             return jsonify({"error": "Credenciales inválidas"}), 400
 
-        user_id = results[0]['user_id']
+        user_id = sets['usuario'][0].user_id
+        user_tags = sets['tags']
         my_logger.info(f"User {user_id} logged in successfully")
     except Exception as e:
         my_logger.error(f"Error during login: {e}")
@@ -113,41 +128,24 @@ def login():
     session_key = create_session(user_id)
     my_logger.info(f"Session created for user {user_id} with key {session_key}")
 
-    # Obtener los tags asociados al usuario y las veces que han sido usados
-    query_tags = """
-    SELECT T.NOMBRE, UT.VECES_USADO
-    FROM USUARIOS_TAGS UT
-    JOIN TAGS T ON UT.ID_TAG = T.ID_TAG
-    WHERE UT.ID_USUARIO = %s
-    """
-    
-    try:
-        cursor = cnx.cursor()
-        cursor.execute(query_tags, (user_id,))
-        user_tags = [{"nombre": row[0], "veces_usado": row[1]} for row in cursor.fetchall()]
-        cursor.close()
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
     # Responder con el user_id, la clave de sesión y los tags del usuario con las veces usados
     return jsonify({"user_id": user_id, "key": session_key, "tags": user_tags}), 200
 
 
 @users_bp.route('/signOut', methods=['POST'])
+@require_session
 def sign_out():
     my_logger.info("Sign out attempt started")
     session_key = request.headers.get('key')
     user_id = request.headers.get('User-Id')
 
     my_logger.debug(f"Session key: {session_key}, User ID: {user_id}")
-    session_user_id = validate_key(session_key)
 
-    if not session_key or not user_id:
+    if not user_id:
         my_logger.warning("Missing session key or user ID")
         return jsonify({"error": "El ID de usuario y la clave de sesión son obligatorios"}), 400
 
-    if str(session_user_id) == str(user_id):
+    if str(g.user_id) == str(user_id):
         my_logger.info(f"Valid session for user {user_id}, deleting session")
         delete_session(session_key)
         return jsonify({"message": "Sesión cerrada exitosamente"}), 200
@@ -161,25 +159,21 @@ def sign_up():
     return "Sign Up"
 
 @users_bp.route('/profilepicture/<int:user_id>', methods=['GET'])
+@require_session(match='user_id')
 def profile_picture_get(user_id):
     my_logger.info(f"Fetching profile picture for user {user_id}")
-    session_key = request.headers.get('key')
-
-    if not session_key or validate_key(session_key) != user_id:
-        my_logger.warning(f"Invalid session key for user {user_id}")
-        return jsonify({"error": "Invalid session key"}), 400
 
     query = """
     SELECT FP.ARCHIVO AS archivo FROM USUARIOS U LEFT JOIN FOTOS_PERFIL FP ON U.ID_FOTO = FP.ID_FOTO WHERE U.ID_USUARIO = %s
     """
     try:
+        cnx = get_db()
         cursor = cnx.cursor()
-        cursor.execute(query, (user_id,))
-        result = cursor.fetchone()
+        result = fetch_one(cursor, query, (user_id,))
         cursor.close()
 
         if result:
-            archivo = result[0]
+            archivo = result.archivo
             my_logger.info(f"Profile picture found for user {user_id}")
             return jsonify({"archivo": archivo}), 200
         else:
@@ -190,6 +184,7 @@ def profile_picture_get(user_id):
         return jsonify({"error": str(e)}), 500
 
 @users_bp.route('/profilepicture', methods=['PATCH'])
+@require_session
 def profile_picture_change():
     my_logger.info("Profile picture update attempt")
     try:
@@ -201,11 +196,17 @@ def profile_picture_change():
             my_logger.warning("Missing user ID or picture path")
             return jsonify({"error": "Invalid input data"}), 400
 
+        if g.user_id != user_id:
+            my_logger.warning(f"Invalid session key for user {user_id}")
+            return jsonify({"error": "Invalid session key"}), 400
+
+        cnx = get_db()
+
         cursor = cnx.cursor()
         query = """
             UPDATE USUARIOS SET ID_FOTO = (SELECT ID_FOTO FROM FOTOS_PERFIL WHERE ARCHIVO = %s) WHERE ID_USUARIO = %s
         """
-        cursor.execute(query, (path, user_id))
+        execute(cursor, query, (path, user_id))
         cnx.commit()
         cursor.close()
 
@@ -216,29 +217,25 @@ def profile_picture_change():
         return jsonify({"error": str(e)}), 500
 
 @users_bp.route('/currentpoints/<int:user_id>', methods=['GET'])
+@require_session(match='user_id')
 def current_points(user_id):
     my_logger.info(f"Fetching current points for user {user_id}")
-    session_key = request.headers.get('key')
-
-    if not session_key or validate_key(session_key) != user_id:
-        my_logger.warning(f"Invalid session key for user {user_id}")
-        return jsonify({"error": "Llave de sesión inválida."}), 400
 
     query = "SELECT PU.PUNTOS_ACTUALES AS puntos FROM PUNTOS_USUARIO PU WHERE PU.USUARIO = %s"
     query_nombre = "SELECT NOMBRE FROM USUARIOS WHERE ID_USUARIO = %s"
     
     try:
+        cnx = get_db()
         cursor = cnx.cursor()
-        cursor.execute(query_nombre, (user_id,))
-        row = cursor.fetchone()
-        nombre = row[0]
-
-        cursor.execute(query, (user_id,))
-        result = cursor.fetchone()
+        sets = fetch_sets(cursor, [
+            ('nombre', query_nombre, (user_id,)),
+            ('puntos', query, (user_id,)),
+        ])
         cursor.close()
 
-        if result:
-            puntos = int(result[0])
+        if sets['puntos']:
+            nombre = sets['nombre'][0].NOMBRE
+            puntos = sets['puntos'][0].puntos
             my_logger.info(f"User {user_id} has {puntos} points")
             return jsonify({"puntos": puntos, "nombre": nombre}), 200
         else:
@@ -248,27 +245,55 @@ def current_points(user_id):
         my_logger.error(f"Error fetching points: {e}")
         return jsonify({"error": str(e)}), 500
 
+query_historial = """
+    SELECT HP.ID, HP.FECHA, HP.PUNTOS_MODIFICADOS, HP.TIPO_MODIFICACION, HP.BENEFICIO, HP.EVENTO, HP.RETO
+    FROM HISTORIAL_PUNTOS HP
+    WHERE HP.USUARIO = %s
+"""
+
+# del movimiento más reciente al más viejo
+historial_keyset = Keyset('FECHA', 'ID', descending=True)
+
 @users_bp.route('/historypoints/<int:user_id>', methods=['GET'])
+@require_session(match='user_id')
 def history_points(user_id):
     my_logger.info(f"Fetching point history for user {user_id}")
-    query = """
-    SELECT ... FROM HISTORIAL_PUNTOS HP ...
-    """
+    query = query_historial
+    params = (user_id,)
+    page = page_args(historial_keyset)
     try:
-        cursor = cnx.cursor()
-        cursor.execute(query, (user_id,))
-        columns = [column[0] for column in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        cursor.close()
+        if page is None:
+            results = query_all(ordered_query(query, historial_keyset), params)
+            my_logger.info(f"History points fetched for user {user_id}")
+            return jsonify(results), 200
 
-        my_logger.info(f"History points fetched for user {user_id}")
-        return jsonify(results), 200
+        results, total = query_page(query, params, historial_keyset, page)
+
+        my_logger.info(f"History points page fetched for user {user_id}")
+        return page.response(results, historial_keyset, total=total)
     except Exception as e:
         my_logger.error(f"Error fetching point history: {e}")
         return jsonify({"error": str(e)}), 500
 
+@users_bp.route('/historypoints/<int:user_id>/export', methods=['GET'])
+@require_session(match='user_id')
+def history_points_export(user_id):
+    """Todo el historial como ?format=ndjson (default) o csv, en streaming."""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({"error": "Formato inválido, usa ndjson o csv"}), 400
+
+    my_logger.info(f"Exporting point history for user {user_id} as {fmt}")
+    try:
+        rows = stream_rows(ordered_query(query_historial, historial_keyset), (user_id,))
+        return export_response(rows, fmt, f"historial_puntos_{user_id}")
+    except Exception as e:
+        my_logger.error(f"Error exporting point history: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # Similar my_logger additions for updatehistorypoints and updatecurrentpoints...
 @users_bp.route('/updatehistorypoints', methods=['POST'])
+@require_session
 def update_history_points():
     try:
         data = request.json
@@ -285,13 +310,19 @@ def update_history_points():
             my_logger.error("Invalid input data: user_id=%s, puntos=%s, tipo=%s", user_id, puntos, tipo)
             return jsonify({"error": "Invalid input data"}), 400
 
+        if g.user_id != user_id:
+            my_logger.warning("Session does not belong to user_id=%s", user_id)
+            return jsonify({"error": "Llave de sesión inválida."}), 400
+
+        cnx = get_db()
+
         cursor = cnx.cursor()
 
         queryHistorial = """
         INSERT INTO HISTORIAL_PUNTOS (USUARIO, PUNTOS_MODIFICADOS, TIPO_MODIFICACION, FECHA, BENEFICIO, EVENTO, RETO)
         VALUES (%s, %s, %s, GETDATE(), %s, %s, %s)
         """
-        cursor.execute(queryHistorial, (user_id, puntos, tipo, beneficio_id, evento_id, reto_id))
+        execute(cursor, queryHistorial, (user_id, puntos, tipo, beneficio_id, evento_id, reto_id))
         cnx.commit()
         cursor.close()
 
@@ -303,6 +334,7 @@ def update_history_points():
 
 
 @users_bp.route('/updatecurrentpoints', methods=['PATCH'])
+@require_session
 def update_current_points():
     try:
         data = request.json
@@ -316,6 +348,12 @@ def update_current_points():
             my_logger.error("Invalid input data: user_id=%s, puntos=%s, tipo=%s", user_id, puntos, tipo)
             return jsonify({"error": "Invalid input data"}), 400
 
+        if g.user_id != user_id:
+            my_logger.warning("Session does not belong to user_id=%s", user_id)
+            return jsonify({"error": "Llave de sesión inválida."}), 400
+
+        cnx = get_db()
+
         cursor = cnx.cursor()
         if tipo:
             query = """
@@ -329,7 +367,7 @@ def update_current_points():
             SET PUNTOS_ACTUALES = PUNTOS_ACTUALES - %s
             WHERE USUARIO = %s
             """
-        cursor.execute(query, (puntos, user_id))
+        execute(cursor, query, (puntos, user_id))
         cnx.commit()
         cursor.close()
 
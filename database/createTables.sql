@@ -74,6 +74,9 @@ CREATE TABLE USUARIOS_EVENTOS (
     FOREIGN KEY (EVENTO) REFERENCES EVENTOS(ID_EVENTO)
 );
 
+-- paginación de /eventos/usuariosEvento (orden de registro)
+CREATE INDEX IX_USUARIOS_EVENTOS_EVENTO ON USUARIOS_EVENTOS (EVENTO, ID) INCLUDE (USUARIO);
+
 -- 8. Relacion usuarios y retos obtenidos
 CREATE TABLE USUARIOS_RETOS (
     ID NUMERIC(18, 0),
@@ -107,6 +110,9 @@ CREATE TABLE HISTORIAL_PUNTOS (
     FOREIGN KEY (RETO) REFERENCES RETOS(ID_RETO),
 );
 
+-- paginación de /users/historypoints (más reciente primero)
+CREATE INDEX IX_HISTORIAL_PUNTOS_USUARIO_FECHA ON HISTORIAL_PUNTOS (USUARIO, FECHA DESC, ID DESC);
+
 -- 11. Datos salud del usuario
 CREATE TABLE DATOS_SALUD (
     ID_HISTORIAL NUMERIC(18, 0) PRIMARY KEY IDENTITY,
@@ -126,27 +132,83 @@ CREATE TABLE PRESION_ARTERIAL (
     FECHA DATETIME DEFAULT GETDATE(),
     PRESION_SISTOLICA INT,
     PRESION_DIASTOLICA INT,
+    ID_MUESTRA VARCHAR(64) NULL,
     FOREIGN KEY (USUARIO) REFERENCES USUARIOS(ID_USUARIO)
 );
 
+-- una muestra de HealthKit (id_muestra) solo se guarda una vez por usuario
+CREATE UNIQUE INDEX UX_PRESION_ARTERIAL_USUARIO_MUESTRA ON PRESION_ARTERIAL (USUARIO, ID_MUESTRA) WHERE ID_MUESTRA IS NOT NULL;
+
+-- rangos de fechas de /mediciones/rango y las últimas de /medicionesdatos
+CREATE INDEX IX_PRESION_ARTERIAL_USUARIO_FECHA ON PRESION_ARTERIAL (USUARIO, FECHA) INCLUDE (PRESION_SISTOLICA, PRESION_DIASTOLICA);
+
 -- 13. Registros de Ritmo Cardiaco
 CREATE TABLE RITMO_CARDIACO (
     ID_RITMO NUMERIC(18, 0) PRIMARY KEY IDENTITY,
     USUARIO NUMERIC(18, 0),
     FECHA DATETIME DEFAULT GETDATE(),
     RITMO INT,
+    ID_MUESTRA VARCHAR(64) NULL,
     FOREIGN KEY (USUARIO) REFERENCES USUARIOS(ID_USUARIO)
 );
 
+CREATE UNIQUE INDEX UX_RITMO_CARDIACO_USUARIO_MUESTRA ON RITMO_CARDIACO (USUARIO, ID_MUESTRA) WHERE ID_MUESTRA IS NOT NULL;
+CREATE INDEX IX_RITMO_CARDIACO_USUARIO_FECHA ON RITMO_CARDIACO (USUARIO, FECHA) INCLUDE (RITMO);
+
 -- 14. Registros de Glucosa
 CREATE TABLE GLUCOSA (
     ID_GLUCOSA NUMERIC(18, 0) PRIMARY KEY IDENTITY,
     USUARIO NUMERIC(18, 0),
     FECHA DATETIME DEFAULT GETDATE(),
     NIVEL INT,
+    ID_MUESTRA VARCHAR(64) NULL,
     FOREIGN KEY (USUARIO) REFERENCES USUARIOS(ID_USUARIO)
 );
 
+CREATE UNIQUE INDEX UX_GLUCOSA_USUARIO_MUESTRA ON GLUCOSA (USUARIO, ID_MUESTRA) WHERE ID_MUESTRA IS NOT NULL;
+CREATE INDEX IX_GLUCOSA_USUARIO_FECHA ON GLUCOSA (USUARIO, FECHA) INCLUDE (NIVEL);
+
+-- 15. Resúmenes por hora y por día de las mediciones (ver api/rollups.py)
+CREATE TABLE RESUMEN_MEDICIONES_HORA (
+    USUARIO NUMERIC(18, 0) NOT NULL,
+    METRICA VARCHAR(32) NOT NULL,
+    INICIO DATETIME NOT NULL,
+    MINIMO INT NOT NULL,
+    MAXIMO INT NOT NULL,
+    SUMA BIGINT NOT NULL,
+    CUENTA INT NOT NULL,
+    PRIMARY KEY (USUARIO, METRICA, INICIO),
+    FOREIGN KEY (USUARIO) REFERENCES USUARIOS(ID_USUARIO)
+);
+
+CREATE TABLE RESUMEN_MEDICIONES_DIA (
+    USUARIO NUMERIC(18, 0) NOT NULL,
+    METRICA VARCHAR(32) NOT NULL,
+    INICIO DATETIME NOT NULL,
+    MINIMO INT NOT NULL,
+    MAXIMO INT NOT NULL,
+    SUMA BIGINT NOT NULL,
+    CUENTA INT NOT NULL,
+    PRIMARY KEY (USUARIO, METRICA, INICIO),
+    FOREIGN KEY (USUARIO) REFERENCES USUARIOS(ID_USUARIO)
+);
+
+
+-- 16. Alertas de mediciones fuera de rango o con picos (ver api/anomalies.py)
+CREATE TABLE ALERTAS_MEDICIONES (
+    ID_ALERTA NUMERIC(18, 0) PRIMARY KEY IDENTITY,
+    USUARIO NUMERIC(18, 0) NOT NULL,
+    METRICA VARCHAR(32) NOT NULL,
+    FECHA DATETIME NOT NULL,
+    VALOR INT NOT NULL,
+    REGLA VARCHAR(32) NOT NULL,
+    PUNTAJE FLOAT NULL,
+    DETECTADA DATETIME DEFAULT GETDATE(),
+    FOREIGN KEY (USUARIO) REFERENCES USUARIOS(ID_USUARIO)
+);
+
+CREATE INDEX IX_ALERTAS_MEDICIONES_USUARIO_FECHA ON ALERTAS_MEDICIONES (USUARIO, FECHA) INCLUDE (METRICA);
+
 
 
 -- TAGS
@@ -171,3 +233,13 @@ CREATE TABLE EVENTOS_TAGS (
     FOREIGN KEY (ID_EVENTO) REFERENCES EVENTOS(ID_EVENTO),
     FOREIGN KEY (ID_TAG) REFERENCES TAGS(ID_TAG)
 );
+
+-- similitud entre tags para /eventos/recomendados (ver api/recommendations.py)
+CREATE TABLE TAGS_SIMILITUD (
+    ID_TAG_1 INT NOT NULL,
+    ID_TAG_2 INT NOT NULL,
+    SIMILITUD FLOAT NOT NULL,
+    PRIMARY KEY (ID_TAG_1, ID_TAG_2),
+    FOREIGN KEY (ID_TAG_1) REFERENCES TAGS(ID_TAG),
+    FOREIGN KEY (ID_TAG_2) REFERENCES TAGS(ID_TAG)
+);
@@ -1,3 +1,13 @@
+-- 16. Drop table for ALERTAS_MEDICIONES
+DROP TABLE IF EXISTS ALERTAS_MEDICIONES;
+
+-- 15. Drop tables for RESUMEN_MEDICIONES
+DROP TABLE IF EXISTS RESUMEN_MEDICIONES_HORA;
+
+DROP TABLE IF EXISTS RESUMEN_MEDICIONES_DIA;
+
+DROP TABLE IF EXISTS TAGS_SIMILITUD;
+
 DROP TABLE IF EXISTS EVENTOS_TAGS;
 
 DROP TABLE IF EXISTS USUARIOS_TAGS;
@@ -0,0 +1,8 @@
+-- Índices para la paginación por llave (ver api/pagination.py).
+-- Para bases creadas antes de que createTables.sql los incluyera.
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_HISTORIAL_PUNTOS_USUARIO_FECHA')
+    CREATE INDEX IX_HISTORIAL_PUNTOS_USUARIO_FECHA ON HISTORIAL_PUNTOS (USUARIO, FECHA DESC, ID DESC);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_USUARIOS_EVENTOS_EVENTO')
+    CREATE INDEX IX_USUARIOS_EVENTOS_EVENTO ON USUARIOS_EVENTOS (EVENTO, ID) INCLUDE (USUARIO);
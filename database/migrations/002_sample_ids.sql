@@ -0,0 +1,22 @@
+-- ID_MUESTRA (el id de la muestra en HealthKit) para que /mediciones/ingest
+-- no duplique las muestras que la app vuelve a mandar (ver api/dedup.py).
+-- Para bases creadas antes de que createTables.sql las incluyera.
+
+IF COL_LENGTH('GLUCOSA', 'ID_MUESTRA') IS NULL
+    ALTER TABLE GLUCOSA ADD ID_MUESTRA VARCHAR(64) NULL;
+
+IF COL_LENGTH('RITMO_CARDIACO', 'ID_MUESTRA') IS NULL
+    ALTER TABLE RITMO_CARDIACO ADD ID_MUESTRA VARCHAR(64) NULL;
+
+IF COL_LENGTH('PRESION_ARTERIAL', 'ID_MUESTRA') IS NULL
+    ALTER TABLE PRESION_ARTERIAL ADD ID_MUESTRA VARCHAR(64) NULL;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_GLUCOSA_USUARIO_MUESTRA')
+    CREATE UNIQUE INDEX UX_GLUCOSA_USUARIO_MUESTRA ON GLUCOSA (USUARIO, ID_MUESTRA) WHERE ID_MUESTRA IS NOT NULL;
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_RITMO_CARDIACO_USUARIO_MUESTRA')
+    CREATE UNIQUE INDEX UX_RITMO_CARDIACO_USUARIO_MUESTRA ON RITMO_CARDIACO (USUARIO, ID_MUESTRA) WHERE ID_MUESTRA IS NOT NULL;
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_PRESION_ARTERIAL_USUARIO_MUESTRA')
+    CREATE UNIQUE INDEX UX_PRESION_ARTERIAL_USUARIO_MUESTRA ON PRESION_ARTERIAL (USUARIO, ID_MUESTRA) WHERE ID_MUESTRA IS NOT NULL;
@@ -0,0 +1,11 @@
+-- Índices por usuario y fecha para /mediciones/rango (ver api/series.py).
+-- Para bases creadas antes de que createTables.sql los incluyera.
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_GLUCOSA_USUARIO_FECHA')
+    CREATE INDEX IX_GLUCOSA_USUARIO_FECHA ON GLUCOSA (USUARIO, FECHA) INCLUDE (NIVEL);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_RITMO_CARDIACO_USUARIO_FECHA')
+    CREATE INDEX IX_RITMO_CARDIACO_USUARIO_FECHA ON RITMO_CARDIACO (USUARIO, FECHA) INCLUDE (RITMO);
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_PRESION_ARTERIAL_USUARIO_FECHA')
+    CREATE INDEX IX_PRESION_ARTERIAL_USUARIO_FECHA ON PRESION_ARTERIAL (USUARIO, FECHA) INCLUDE (PRESION_SISTOLICA, PRESION_DIASTOLICA);
@@ -0,0 +1,28 @@
+-- Resúmenes por hora y por día de las mediciones (ver api/rollups.py).
+-- Después de crearlas se llenan con: python api/rollups.py
+
+IF OBJECT_ID('RESUMEN_MEDICIONES_HORA') IS NULL
+    CREATE TABLE RESUMEN_MEDICIONES_HORA (
+        USUARIO NUMERIC(18, 0) NOT NULL,
+        METRICA VARCHAR(32) NOT NULL,
+        INICIO DATETIME NOT NULL,
+        MINIMO INT NOT NULL,
+        MAXIMO INT NOT NULL,
+        SUMA BIGINT NOT NULL,
+        CUENTA INT NOT NULL,
+        PRIMARY KEY (USUARIO, METRICA, INICIO),
+        FOREIGN KEY (USUARIO) REFERENCES USUARIOS(ID_USUARIO)
+    );
+
+IF OBJECT_ID('RESUMEN_MEDICIONES_DIA') IS NULL
+    CREATE TABLE RESUMEN_MEDICIONES_DIA (
+        USUARIO NUMERIC(18, 0) NOT NULL,
+        METRICA VARCHAR(32) NOT NULL,
+        INICIO DATETIME NOT NULL,
+        MINIMO INT NOT NULL,
+        MAXIMO INT NOT NULL,
+        SUMA BIGINT NOT NULL,
+        CUENTA INT NOT NULL,
+        PRIMARY KEY (USUARIO, METRICA, INICIO),
+        FOREIGN KEY (USUARIO) REFERENCES USUARIOS(ID_USUARIO)
+    );
@@ -0,0 +1,18 @@
+-- Alertas del job de detección de anomalías (ver api/anomalies.py).
+-- Se llenan con: python api/anomalies.py --dias 1
+
+IF OBJECT_ID('ALERTAS_MEDICIONES') IS NULL
+    CREATE TABLE ALERTAS_MEDICIONES (
+        ID_ALERTA NUMERIC(18, 0) PRIMARY KEY IDENTITY,
+        USUARIO NUMERIC(18, 0) NOT NULL,
+        METRICA VARCHAR(32) NOT NULL,
+        FECHA DATETIME NOT NULL,
+        VALOR INT NOT NULL,
+        REGLA VARCHAR(32) NOT NULL,
+        PUNTAJE FLOAT NULL,
+        DETECTADA DATETIME DEFAULT GETDATE(),
+        FOREIGN KEY (USUARIO) REFERENCES USUARIOS(ID_USUARIO)
+    );
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_ALERTAS_MEDICIONES_USUARIO_FECHA')
+    CREATE INDEX IX_ALERTAS_MEDICIONES_USUARIO_FECHA ON ALERTAS_MEDICIONES (USUARIO, FECHA) INCLUDE (METRICA);
@@ -0,0 +1,12 @@
+-- Similitud entre tags para /eventos/recomendados (ver api/recommendations.py).
+-- Se llena con: python api/recommendations.py tags_similarity.csv
+
+IF OBJECT_ID('TAGS_SIMILITUD') IS NULL
+    CREATE TABLE TAGS_SIMILITUD (
+        ID_TAG_1 INT NOT NULL,
+        ID_TAG_2 INT NOT NULL,
+        SIMILITUD FLOAT NOT NULL,
+        PRIMARY KEY (ID_TAG_1, ID_TAG_2),
+        FOREIGN KEY (ID_TAG_1) REFERENCES TAGS(ID_TAG),
+        FOREIGN KEY (ID_TAG_2) REFERENCES TAGS(ID_TAG)
+    );
@@ -13,8 +13,65 @@ struct ContentView: View {
     @State private var eventId: String = ""
     @State private var alertMessage: String = ""
     @State private var showingAlert = false
+    // sesión del staff; /eventos/asistirEvento la exige en el header "key"
+    @State private var correo: String = ""
+    @State private var password: String = ""
+    @State private var sessionKey: String = ""
+    
+    let baseURL = "https://sabritones.tc2007b.tec.mx:10206"
     
     var body: some View {
+        if sessionKey.isEmpty {
+            loginView
+        } else {
+            scannerView
+        }
+    }
+    
+    var loginView: some View {
+        VStack(alignment:.center) {
+            Text("Iniciar sesión del staff")
+                .font(.title)
+                .padding(.top, 20)
+                .foregroundColor(.black)
+            
+            TextField("correo", text: $correo)
+                .padding(10)
+                .background(
+                    RoundedRectangle(cornerRadius: 5)
+                        .fill(Color(red: 198/255, green: 198/255, blue: 198/255)))
+                .foregroundColor(.black)
+                .padding(.horizontal, 20)
+                .autocapitalization(.none)
+            
+            SecureField("contraseña", text: $password)
+                .padding(10)
+                .background(
+                    RoundedRectangle(cornerRadius: 5)
+                        .fill(Color(red: 198/255, green: 198/255, blue: 198/255)))
+                .foregroundColor(.black)
+                .padding(.horizontal, 20)
+                .padding(.bottom, 10)
+            
+            Button("Entrar") {
+                iniciarSesion()
+            }
+            .padding()
+            .background(Color(red: 255/255, green: 88/255, blue: 0/255))
+            .foregroundColor(.white)
+            .font(.title2)
+            .cornerRadius(10)
+            
+            Spacer()
+        }
+        .padding()
+        .background(.white)
+        .alert(isPresented: $showingAlert) {
+            Alert(title: Text("Resultado"), message: Text(alertMessage), dismissButton: .default(Text("OK")))
+        }
+    }
+    
+    var scannerView: some View {
         VStack(alignment:.center) {
             Text("Registrar asistencia a Evento")
                 .font(/*@START_MENU_TOKEN@*/.title/*@END_MENU_TOKEN@*/)
@@ -78,6 +135,31 @@ struct ContentView: View {
             Alert(title: Text("Resultado"), message: Text(alertMessage), dismissButton: .default(Text("OK")))
         }
     }
+    func iniciarSesion() {
+        let url = URL(string: baseURL + "/users/login")!
+        var request = URLRequest(url: url)
+        request.httpMethod = "POST"
+        request.addValue("application/json", forHTTPHeaderField: "Content-Type")
+        request.httpBody = try! JSONSerialization.data(withJSONObject: ["correo": correo, "password": password])
+
+        URLSession.shared.dataTask(with: request) { data, response, error in
+            guard let data = data,
+                  let httpResponse = response as? HTTPURLResponse, httpResponse.statusCode == 200,
+                  let json = try? JSONSerialization.jsonObject(with: data) as? [String: Any],
+                  let key = json["key"] as? String else {
+                DispatchQueue.main.async {
+                    self.alertMessage = "No se pudo iniciar sesión: \(error?.localizedDescription ?? "credenciales inválidas")"
+                    self.showingAlert = true
+                }
+                return
+            }
+            DispatchQueue.main.async {
+                self.sessionKey = key
+                self.password = ""
+            }
+        }.resume()
+    }
+
     func confirmarAsistencia() {
         guard let userId = Int(qrCode), let eventIdInt = Int(eventId) else {
             alertMessage = "Código QR o ID del evento inválido"
@@ -85,10 +167,11 @@ struct ContentView: View {
             return
         }
 
-        let url = URL(string: "https://sabritones.tc2007b.tec.mx:10206/eventos/asistirEvento")!
+        let url = URL(string: baseURL + "/eventos/asistirEvento")!
         var request = URLRequest(url: url)
         request.httpMethod = "POST"
         request.addValue("application/json", forHTTPHeaderField: "Content-Type")
+        request.addValue(sessionKey, forHTTPHeaderField: "key")
 
         let json: [String: Any] = [
             "user_id": userId,
@@ -116,7 +199,15 @@ struct ContentView: View {
             }
 
             let responseString = String(data: data, encoding: .utf8) ?? "Error desconocido"
-            if let httpResponse = response as? HTTPURLResponse, httpResponse.statusCode == 200 {
+            let statusCode = (response as? HTTPURLResponse)?.statusCode
+            if statusCode == 400 {
+                // la sesión venció: volver a pedir el login
+                DispatchQueue.main.async {
+                    self.sessionKey = ""
+                    self.alertMessage = "La sesión venció, vuelve a iniciar sesión."
+                    self.showingAlert = true
+                }
+            } else if statusCode == 200 {
                 DispatchQueue.main.async {
                     self.alertMessage = "Asistencia registrada exitosamente."
                     self.showingAlert = true